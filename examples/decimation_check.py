@@ -0,0 +1,38 @@
+"""Check of the profile decimation: no segment is drawn across the depth view between non-adjacent samples
+
+The profiles include up/down casts that leave the depth view and come back. Return a non-zero exit code on
+failure.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import sys
+
+import numpy as np
+
+from hydroffice.ssp_manager.plots import decimate_profile
+
+
+def false_segments(depth, speed, depth_range, n_bins):
+    """Return the retained consecutive samples that replace an excursion out of the depth view"""
+    idx = decimate_profile(depth, speed, depth_range, n_bins)
+    inside = (depth >= min(depth_range)) & (depth <= max(depth_range))
+    return [(a, b) for a, b in zip(idx[:-1], idx[1:])
+            if (b > a + 1) and not inside[a + 1:b].all() and (inside[a] or inside[b])]
+
+
+def check(label, depth, depth_range, n_bins=50):
+    speed = 1500.0 + np.sin(np.arange(depth.size) / 7.0)
+    segments = false_segments(depth, speed, depth_range, n_bins)
+    print("%-50s %s" % (label, "ok" if not segments else "FAILED: %s" % segments[:4]))
+    return not segments
+
+
+if __name__ == '__main__':
+    leg = np.linspace(0.0, 100.0, 3000)
+    passed = True
+    passed &= check("down cast", leg, (40.0, 60.0))
+    passed &= check("down/up/down cast", np.concatenate((leg, leg[::-1], leg)), (40.0, 60.0))
+    passed &= check("down/up/down cast, few visible samples", np.concatenate((leg, leg[::-1], leg)), (50.0, 51.0))
+    passed &= check("looping cast", 50.0 + 45.0 * np.sin(np.linspace(0.0, 20.0 * np.pi, 20000)), (20.0, 30.0))
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,65 @@
+"""Import-time regression benchmark of SSP Manager
+
+The main module is imported in a fresh interpreter (with '-X importtime' when available) to report the
+slowest imports, and to check the import time budget and that the heavy subsystems are not imported.
+Return a non-zero exit code on regression.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import subprocess
+import sys
+
+module = "hydroffice.ssp_manager.sspmanager"
+budget = 3.0  # [s]
+# the subsystems that have to be imported only at their first use
+deferred = ["mpl_toolkits.basemap", "hydroffice.ssp_manager.geomonitor", "hydroffice.ssp_manager.refmonitor",
+            "hydroffice.base.gdal_aux", "osgeo"]
+
+probe = """
+import sys, time
+start = time.time()
+import %s
+print("elapsed %%f" %% (time.time() - start))
+for name in %r:
+    if name in sys.modules:
+        print("imported " + name)
+""" % (module, deferred)
+
+
+def slowest_imports(stderr, count=15):
+    """Parse the '-X importtime' output, returning the slowest (cumulative) imports"""
+    imports = list()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        imports.append((int(fields[1]), fields[2].strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == '__main__':
+    cmd = [sys.executable]
+    if sys.version_info >= (3, 7):
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", probe]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        print("unable to import %s:\n%s" % (module, stderr[-2000:]))
+        sys.exit(2)
+
+    for micro_seconds, name in slowest_imports(stderr):
+        print("%10.3f s  %s" % (micro_seconds / 1e6, name))
+
+    failed = False
+    for line in stdout.splitlines():
+        if line.startswith("elapsed "):
+            elapsed = float(line.split()[1])
+            print("import of %s: %.3f s (budget: %.1f s)" % (module, elapsed, budget))
+            failed = failed or (elapsed > budget)
+        elif line.startswith("imported "):
+            print("regression: %s imported at startup" % line.split()[1])
+            failed = True
+
+    sys.exit(1 if failed else 0)
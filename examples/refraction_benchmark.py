@@ -0,0 +1,67 @@
+"""Benchmark of the refraction monitor correction: legacy per-beam loop vs. vectorised NumPy path"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import math
+import timeit
+
+import numpy as np
+
+from hydroffice.ssp_manager import refraction
+
+
+def legacy_correction(depth, across, flags, num_beams, ssp_equiv, ssp_corrected):
+    """The per-beam implementation previously used by RefMonitor.update_plots"""
+    valid_depth = np.zeros(num_beams)
+    valid_across = np.zeros(num_beams)
+    angles = np.zeros(num_beams)
+    ranges = np.zeros(num_beams)
+    count = 0
+    for beam in range(num_beams):
+        if int(flags[beam]) & 0x80 != 0:
+            continue
+        valid_depth[count] = depth[beam]
+        valid_across[count] = across[beam]
+        angles[count] = math.atan(valid_across[count] / valid_depth[count])
+        ranges[count] = math.sqrt(valid_depth[count] * valid_depth[count] +
+                                  valid_across[count] * valid_across[count])
+        count += 1
+
+    depth_corrected = np.zeros(count)
+    across_corrected = np.zeros(count)
+    for idx in range(count):
+        angle_new = math.asin(math.sin(angles[idx]) * ssp_corrected / ssp_equiv)
+        range_new = ranges[idx] * ssp_corrected / ssp_equiv
+        depth_corrected[idx] = range_new * math.cos(angle_new)
+        across_corrected[idx] = range_new * math.sin(angle_new)
+    return depth_corrected, across_corrected
+
+
+def vectorised_correction(depth, across, flags, num_beams, ssp_equiv, ssp_corrected):
+    valid_depth, valid_across = refraction.valid_beams(depth, across, flags, num_beams)
+    return refraction.snell_correction(valid_depth, valid_across, ssp_equiv, ssp_corrected)
+
+
+def synthetic_ping(num_beams=800, swath_angle=65.0, mean_depth=200.0):
+    angles = np.radians(np.linspace(-swath_angle, swath_angle, num_beams))
+    depth = mean_depth + np.random.normal(0.0, 0.5, num_beams)
+    across = depth * np.tan(angles)
+    flags = np.zeros(num_beams, dtype=np.uint8)
+    flags[np.random.choice(num_beams, num_beams // 20, replace=False)] = 0x80
+    return depth, across, flags
+
+
+if __name__ == '__main__':
+    repeats = 200
+    for num_beams in [400, 800, 1600]:
+        ping = synthetic_ping(num_beams=num_beams)
+        args = ping + (num_beams, 1500.0, 1502.5)
+
+        ref = legacy_correction(*args)
+        out = vectorised_correction(*args)
+        assert np.allclose(ref[0], out[0]) and np.allclose(ref[1], out[1])
+
+        t_legacy = timeit.timeit(lambda: legacy_correction(*args), number=repeats) / repeats
+        t_vector = timeit.timeit(lambda: vectorised_correction(*args), number=repeats) / repeats
+        print("%4d beams: legacy %8.3f ms, vectorised %8.3f ms (x%.1f)"
+              % (num_beams, t_legacy * 1000.0, t_vector * 1000.0, t_legacy / t_vector))
@@ -0,0 +1,93 @@
+"""Offline check of the on-disk RTOFS cache against a file-based stand-in for the remote atlas
+
+The stand-in folder is filled with synthetic casts, then the cache is exercised online (through the stand-in)
+and in offline mode. Return a non-zero exit code on failure.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime as dt
+import shutil
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from hydroffice.ssp.helper import SspError
+from hydroffice.ssp_manager.atlases import RtofsCache, RtofsFolder
+
+
+class SyntheticCast(object):
+    """Minimal cast, with the sound speed depending on the position of the grid node"""
+
+    def __init__(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.date_time = None
+        self.data = np.array([[0.0, 10.0, 100.0], [1500.0 + latitude, 1495.0 + longitude, 1490.0]])
+
+    def set_position(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class SyntheticAtlas(object):
+    def query(self, latitude, longitude, date_time):
+        return SyntheticCast(latitude, longitude)
+
+
+def check(label, condition):
+    print("%-60s %s" % (label, "ok" if condition else "FAILED"))
+    return condition
+
+
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp(prefix="rtofs_check_")
+    server_folder = os.path.join(folder, "server")
+    cache_folder = os.path.join(folder, "cache")
+    today = dt.datetime.utcnow()
+    passed = True
+    try:
+        # the stand-in has the casts of a small area
+        server = RtofsCache(SyntheticAtlas(), server_folder)
+        nr_casts = server.prefetch(43.0, 43.25, -70.25, -70.0, today)
+        passed &= check("stand-in filled (%d casts)" % nr_casts, nr_casts > 0)
+
+        cache = RtofsCache(RtofsFolder(server_folder), cache_folder)
+        first = cache.query(43.01, -70.01, today)
+        passed &= check("query through the stand-in", first is not None)
+        passed &= check("queried position set", (first.latitude, first.longitude) == (43.01, -70.01))
+
+        # two positions in the same quarter of degree, but at different grid nodes
+        second = cache.query(43.2, -70.2, today)
+        passed &= check("distinct casts for distinct grid nodes", not np.array_equal(first.data, second.data))
+        again = cache.query(43.02, -70.02, today)
+        passed &= check("same cast for the same grid node", np.array_equal(first.data, again.data))
+
+        try:
+            cache.query(10.0, 10.0, today)
+            passed &= check("missing cast in the stand-in raises", False)
+        except SspError:
+            passed &= check("missing cast in the stand-in raises", True)
+
+        cache.offline = True
+        cached = cache.query(43.01, -70.01, today)
+        passed &= check("offline: cached cast served", np.array_equal(cached.data, first.data))
+        old = cache.query(43.01, -70.01, today + dt.timedelta(days=2))
+        passed &= check("offline: older forecast served", np.array_equal(old.data, first.data))
+        try:
+            cache.query(43.1, -70.1, today)
+            passed &= check("offline: not cached node raises", False)
+        except SspError:
+            passed &= check("offline: not cached node raises", True)
+        try:
+            cache.prefetch(43.0, 43.1, -70.1, -70.0, today)
+            passed &= check("offline: prefetch refused", False)
+        except SspError:
+            passed &= check("offline: prefetch refused", True)
+
+    finally:
+        shutil.rmtree(folder)
+
+    sys.exit(0 if passed else 1)
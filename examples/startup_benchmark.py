@@ -0,0 +1,66 @@
+"""Benchmark of the SSP Manager project startup: eager WOA09 atlas load vs. load at the first query
+
+Each mode runs in a fresh interpreter, since the peak resident memory of a process can only grow.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime as dt
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+modes = ["lazy", "eager"]
+
+
+def max_rss():
+    """Peak resident memory of the process [MB] (None if not available)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def load_woa09_atlas():
+    from hydroffice.ssp.atlases.woa09atlas import Woa09Atlas
+
+    atlas = Woa09Atlas()
+    return atlas if atlas.load_grids() else None
+
+
+def timed(label, fn, *args, **kwargs):
+    start = time.time()
+    result = fn(*args, **kwargs)
+    print("%-40s %8.3f s   peak RSS: %s MB" % (label, time.time() - start, max_rss()))
+    return result
+
+
+def run(mode):
+    from hydroffice.ssp import project
+    from hydroffice.ssp_manager.atlases import LazyAtlas
+
+    if mode == "lazy":
+        timed("project startup (lazy WOA09)", project.Project, with_listeners=False, with_woa09=False,
+              with_rtofs=False)
+        atlas = LazyAtlas(load_woa09_atlas, "WOA09", empty=(None, None, None))
+        timed("first WOA09 query (lazy load)", atlas.query, 43.0, -70.0, dt.datetime.utcnow())
+        timed("next WOA09 query", atlas.query, 43.0, -70.0, dt.datetime.utcnow())
+    else:
+        timed("project startup (eager WOA09)", project.Project, with_listeners=False, with_woa09=True,
+              with_rtofs=False)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+        sys.exit(0)
+
+    failed = False
+    for mode in modes:
+        sys.stdout.flush()
+        failed = (subprocess.call([sys.executable, __file__, mode]) != 0) or failed
+    sys.exit(1 if failed else 0)
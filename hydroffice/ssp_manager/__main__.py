@@ -30,9 +30,17 @@ ch.addFilter(SettingsFilter())
 ch.addFilter(KmIOFilter())
 logger.addHandler(ch)
 
-from . import ssp_gui
+import sys
 
-ssp_gui.gui()
+# the guard avoids to run the application in the batch worker processes (e.g., spawned on Windows)
+if __name__ == '__main__':
+    if (len(sys.argv) > 1) and (sys.argv[1] == 'batch'):
+        from . import batch
+        sys.exit(batch.main(sys.argv[2:]))
+
+    from . import ssp_gui
+
+    ssp_gui.gui()
 
 
 
@@ -0,0 +1,417 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime as dt
+import logging
+import math
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from hydroffice.ssp.helper import SspError
+from .snapshot import relocated
+
+log = logging.getLogger(__name__)
+
+
+class AtlasQuery(object):
+    """The pending outcome of a query submitted to AtlasQueries
+
+    The done callbacks are called (through the executor dispatcher) once the query is completed or cancelled.
+    A query can be cancelled also while running: its result is then dropped.
+    """
+
+    def __init__(self, fn, args, kwargs, dispatch):
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._dispatch = dispatch
+        self._condition = threading.Condition()
+        self._state = 'pending'
+        self._result = None
+        self._exception = None
+        self._callbacks = list()
+
+    def running(self):
+        return self._state == 'running'
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def done(self):
+        return self._state in ('done', 'cancelled')
+
+    def cancel(self):
+        with self._condition:
+            if self.done():
+                return self.cancelled()
+            self._state = 'cancelled'
+            self._condition.notify_all()
+        self._call_back()
+        return True
+
+    def result(self, timeout=None):
+        """Return the query result (or raise its exception), waiting for the completion"""
+        with self._condition:
+            if not self.done():
+                self._condition.wait(timeout)
+            if self.cancelled():
+                raise SspError("atlas query cancelled")
+            if not self.done():
+                raise SspError("atlas query timeout")
+            if self._exception is not None:
+                raise self._exception
+            return self._result
+
+    def exception(self):
+        return self._exception
+
+    def add_done_callback(self, fn):
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        self._dispatch(fn, self)
+
+    def _call_back(self):
+        for fn in self._callbacks:
+            self._dispatch(fn, self)
+        self._callbacks = list()
+
+    def _run(self):
+        with self._condition:
+            if self._state != 'pending':
+                return
+            self._state = 'running'
+
+        result = None
+        exception = None
+        try:
+            result = self._fn(*self._args, **self._kwargs)
+        except Exception as e:
+            exception = e
+
+        with self._condition:
+            if self.cancelled():
+                log.info("dropped result of cancelled query")
+                return
+            self._result = result
+            self._exception = exception
+            self._state = 'done'
+            self._condition.notify_all()
+        self._call_back()
+
+
+class AtlasQueries(object):
+    """Executor of atlas queries on a pool of background threads
+
+    The query callbacks are called through 'dispatch' (e.g., wx.CallAfter to get them on the GUI thread).
+    """
+
+    def __init__(self, max_workers=2, dispatch=None):
+        self.max_workers = max_workers
+        self.dispatch = dispatch if dispatch is not None else self._call
+        self._queries = queue.Queue()
+        self._workers = list()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _call(fn, *args):
+        fn(*args)
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule the call of fn(*args, **kwargs), returning its AtlasQuery"""
+        query = AtlasQuery(fn, args, kwargs, self.dispatch)
+        with self._lock:
+            self._queries.put(query)
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work, name="AtlasQueries")
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+        return query
+
+    def _work(self):
+        while True:
+            query = self._queries.get()
+            if query is None:
+                return
+            query._run()
+
+    def shutdown(self):
+        """Stop the workers once the queued queries are processed"""
+        with self._lock:
+            for _ in self._workers:
+                self._queries.put(None)
+            self._workers = list()
+
+
+class LazyAtlas(object):
+    """Proxy that loads an atlas at its first query, so that the sessions not using it never pay its load
+
+    The 'loader' returns the atlas (or None on failure). While the atlas is not available, the queries return
+    the 'empty' result (or raise SspError, if 'empty' is None). The optional 'on_load(atlas)' is called once
+    the load is attempted (in the loading thread), with the atlas or None.
+
+    The atlas is shared by the background threads (e.g., the atlas queries and the drop folder watcher), so its
+    queries are run one at a time.
+    """
+
+    def __init__(self, loader, name, empty=None, on_load=None):
+        self.loader = loader
+        self.name = name
+        self.empty = empty
+        self.on_load = on_load
+        self._atlas = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._query_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        """Load the atlas (once), and return it"""
+        with self._lock:
+            if self._loaded:
+                return self._atlas
+
+            start = time.time()
+            try:
+                self._atlas = self.loader()
+            except Exception as e:
+                log.warning("failure in loading %s atlas: %s" % (self.name, e))
+                self._atlas = None
+            self._loaded = True
+            log.info("%s atlas loaded in %.2f s (available: %s)"
+                     % (self.name, time.time() - start, self._atlas is not None))
+
+        if self.on_load is not None:
+            self.on_load(self._atlas)
+        return self._atlas
+
+    def query(self, latitude, longitude, date_time):
+        atlas = self.load()
+        if atlas is None:
+            if self.empty is None:
+                raise SspError("%s atlas not available" % self.name)
+            log.info("%s atlas not available" % self.name)
+            return self.empty
+        with self._query_lock:
+            return atlas.query(latitude, longitude, date_time)
+
+
+class Woa09Cache(object):
+    """Bounded LRU cache in front of the WOA09 atlas lookups
+
+    The (mean, min, max) casts are cached by atlas grid cell and month. A cache hit returns copies of the
+    cached casts, with the position and the date time of the query.
+    """
+
+    def __init__(self, atlas, size=64, resolution=1.0):
+        self.atlas = atlas
+        self.size = size
+        self.resolution = resolution  # grid cell size [deg]
+        self._casts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, latitude, longitude, date_time):
+        return int(math.floor(latitude / self.resolution)), \
+            int(math.floor((longitude % 360.0) / self.resolution)), \
+            date_time.month
+
+    def clear(self):
+        with self._lock:
+            self._casts.clear()
+
+    def query(self, latitude, longitude, date_time):
+        """Same as the atlas query, but served from the cache if the cell and the month were already queried"""
+        key = self.key(latitude, longitude, date_time)
+        with self._lock:
+            casts = self._casts.pop(key, None)
+            if casts is not None:
+                self._casts[key] = casts  # most recently used
+                self.hits += 1
+
+        if casts is None:
+            self.misses += 1
+            casts = self.atlas.query(latitude, longitude, date_time)
+            if casts[0] is None:  # failed lookups are not cached
+                return casts
+            with self._lock:
+                self._casts[key] = casts
+                while len(self._casts) > self.size:
+                    self._casts.popitem(last=False)
+
+        log.debug("WOA09 cache: %d hits, %d misses" % (self.hits, self.misses))
+        return tuple(self._located(cast, latitude, longitude, date_time) for cast in casts)
+
+    @staticmethod
+    def _located(cast, latitude, longitude, date_time):
+        if cast is None:
+            return None
+        return relocated(cast, latitude, longitude, date_time)  # sharing the arrays of the cached cast
+
+
+class RtofsCache(object):
+    """On-disk cache of the RTOFS casts, by forecast date and grid node
+
+    Each query is served with the cast of the RTOFS grid node nearest to its position (grid spacing:
+    'resolution' degrees), stored under a folder per forecast date. In offline mode (or when the remote lookup
+    fails), the casts are only served from the cache, reverting to the most recent forecast of the previous
+    'max_age' days if needed.
+    The 'atlas' is any object providing query(latitude, longitude, date_time) (e.g., the RTOFS atlas, or the
+    RtofsFolder file-based stand-in for the remote server).
+    """
+
+    resolution = 1.0 / 12.0  # [deg] spacing of the RTOFS grid
+
+    def __init__(self, atlas, folder, resolution=None, max_age=7, offline=False):
+        self.atlas = atlas
+        self.folder = folder
+        if resolution is not None:
+            self.resolution = resolution
+        self.max_age = max_age  # [days]
+        self.offline = offline
+        self._lock = threading.Lock()
+
+    def node(self, latitude, longitude):
+        """Return the (latitude, longitude) indices of the grid node nearest to the passed position"""
+        nr_lon_nodes = int(round(360.0 / self.resolution))
+        return int(round(latitude / self.resolution)), \
+            int(round((longitude % 360.0) / self.resolution)) % nr_lon_nodes
+
+    def node_position(self, node):
+        latitude = node[0] * self.resolution
+        longitude = node[1] * self.resolution
+        if longitude > 180.0:
+            longitude -= 360.0
+        return latitude, longitude
+
+    def node_path(self, node, forecast_date):
+        return os.path.join(self.folder, forecast_date.strftime("%Y%m%d"), "%d_%d.pkl" % node)
+
+    def _load(self, path):
+        try:
+            with open(path, "rb") as fid:
+                return pickle.load(fid)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError) as e:
+            log.warning("unable to read cached RTOFS cast %s: %s" % (path, e))
+            return None
+
+    def _store(self, path, cast):
+        with self._lock:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            tmp_path = "%s.%d.tmp" % (path, threading.current_thread().ident)
+            with open(tmp_path, "wb") as fid:
+                pickle.dump(cast, fid, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp_path, path)
+
+    def _retrieve(self, node, date_time):
+        """Query the atlas at the grid node, and store the cast (None, if the atlas has no cast there)"""
+        latitude, longitude = self.node_position(node)
+        cast = self.atlas.query(latitude, longitude, date_time)
+        if cast is not None:
+            self._store(self.node_path(node, date_time.date()), cast)
+        return cast
+
+    def cached(self, latitude, longitude, date_time):
+        """Return the cached cast for the position and the forecast date (or the most recent older one)"""
+        node = self.node(latitude, longitude)
+        for age in range(self.max_age + 1):
+            path = self.node_path(node, date_time.date() - dt.timedelta(days=age))
+            if os.path.exists(path):
+                cast = self._load(path)
+                if cast is not None:
+                    if age > 0:
+                        log.info("using a %d-day old RTOFS forecast" % age)
+                    return cast
+        return None
+
+    def query(self, latitude, longitude, date_time):
+        """Same as the atlas query, but served from the on-disk cache when possible"""
+        node = self.node(latitude, longitude)
+        path = self.node_path(node, date_time.date())
+        cast = self._load(path) if os.path.exists(path) else None
+
+        if cast is None:
+            if self.offline:
+                cast = self.cached(latitude, longitude, date_time)
+                if cast is None:
+                    raise SspError("RTOFS offline mode: no cached cast for %.4f, %.4f" % (latitude, longitude))
+            else:
+                try:
+                    cast = self._retrieve(node, date_time)
+                except SspError as e:
+                    cast = self.cached(latitude, longitude, date_time)
+                    if cast is None:
+                        raise
+                    log.info("failure in RTOFS lookup (%s), using the cached cast" % e)
+                else:
+                    if cast is None:
+                        return None
+
+        return relocated(cast, latitude, longitude, date_time)  # sharing the arrays of the cached cast
+
+    def prefetch(self, min_lat, max_lat, min_lon, max_lon, date_time, cancelled=None):
+        """Retrieve and store the missing casts of the grid nodes in the passed area, for the forecast date
+
+        The optional 'cancelled' callable is checked at each node to stop the prefetch.
+        Return the number of retrieved casts.
+        """
+        if self.offline:
+            raise SspError("RTOFS prefetch unavailable in offline mode")
+
+        min_node = self.node(min_lat, min_lon)
+        max_node = self.node(max_lat, max_lon)
+        nr_lon_nodes = int(round(360.0 / self.resolution))
+        lon_nodes = range(min_node[1], max_node[1] + 1) if max_node[1] >= min_node[1] \
+            else list(range(min_node[1], nr_lon_nodes)) + list(range(0, max_node[1] + 1))  # across the 0/360 meridian
+
+        fetched = 0
+        for lat_node in range(min_node[0], max_node[0] + 1):
+            for lon_node in lon_nodes:
+                if cancelled is not None and cancelled():
+                    log.info("RTOFS prefetch cancelled")
+                    return fetched
+                node = (lat_node, lon_node)
+                if os.path.exists(self.node_path(node, date_time.date())):
+                    continue
+                try:
+                    cast = self._retrieve(node, date_time)
+                except SspError as e:
+                    log.info("failure in prefetching RTOFS at %.4f, %.4f: %s" % (self.node_position(node) + (e, )))
+                    continue
+                if cast is not None:
+                    fetched += 1
+
+        log.info("prefetched %d RTOFS casts" % fetched)
+        return fetched
+
+
+class RtofsFolder(object):
+    """File-based stand-in for the remote RTOFS atlas
+
+    The casts are read from a folder with the RtofsCache layout (e.g., a cache filled by another installation,
+    or prepared for testing), so that the cache, its offline mode and the processing can be checked without
+    network access. The missing casts raise SspError (as a failed remote lookup).
+    """
+
+    def __init__(self, folder, resolution=None):
+        self.folder = folder
+        self._casts = RtofsCache(None, folder, resolution=resolution, max_age=0, offline=True)
+
+    def query(self, latitude, longitude, date_time):
+        return self._casts.query(latitude, longitude, date_time)
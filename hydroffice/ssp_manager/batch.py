@@ -0,0 +1,452 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import datetime as dt
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from hydroffice.ssp import project
+from hydroffice.ssp.ssp_db import SspDb
+from hydroffice.ssp.ssp_dicts import Dicts
+from hydroffice.ssp.ssp_collection import SspCollection
+from hydroffice.ssp.helper import SspError
+from hydroffice.ssp.atlases.woa09checker import Woa09Checker
+from .atlases import LazyAtlas, RtofsCache, RtofsFolder
+from .context import CastContext
+from .snapshot import own
+
+log = logging.getLogger(__name__)
+
+# each worker process loads its own WOA09 atlas (~350 MB), so by default only a few of them are used
+max_default_workers = 4
+
+
+class BatchConfig(object):
+    """The processing options applied to all the casts of a batch
+
+    The options are read from a JSON file. The missing options take the default values.
+    """
+
+    defaults = {
+        "input_formats": None,  # names from Dicts.import_formats (None: all of them)
+        "latitude": None,  # used when the cast file has no position
+        "longitude": None,
+        "date": None,  # "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS", used when the cast file has no date
+        "load_salinity": True,  # XBT casts only
+        "load_temp_and_sal": True,  # XSV and SVP casts only
+        "surface_ssp": None,  # [m/s] applied at the vessel draft (when both are set)
+        "vessel_draft": None,  # [m]
+        "extend": True,
+        "thin": False,
+        "salinity_source": None,  # "WOA09" or "RTOFS" (None: from the settings)
+        "extension_source": None,  # "WOA09" or "RTOFS" (None: from the settings)
+        "with_woa09": True,
+        "with_rtofs": False,
+        "rtofs_offline": False,  # RTOFS casts only from the on-disk cache
+        "rtofs_folder": None,  # folder with RTOFS casts used in place of the remote atlas (see RtofsFolder)
+        "export_formats": ["ASVP"],  # names as in the Export menu (e.g., ASVP, CSV, PRO, HIPS, VEL)
+        "output_folder": None,  # None: the project output folder
+        "store_db": True,
+        "workers": None,  # None: all the cores, up to 'max_default_workers'
+    }
+
+    def __init__(self, **kwargs):
+        for key in kwargs:
+            if key not in self.defaults:
+                raise SspError("unknown batch option: %s" % key)
+        for key, value in self.defaults.items():
+            setattr(self, key, kwargs.get(key, value))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fid:
+            return cls(**json.load(fid))
+
+    def cast_date(self):
+        if self.date is None:
+            return None
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+            try:
+                return dt.datetime.strptime(self.date, fmt)
+            except ValueError:
+                pass
+        raise SspError("invalid batch date: %s" % self.date)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__,
+                            ", ".join("%s=%s" % (key, getattr(self, key)) for key in sorted(self.defaults)))
+
+
+class CastPipeline(object):
+    """GUI-free version of the SSP Manager processing steps, applied to the current cast of a project
+
+    Each step is split in the choice of the source cast and in its application to the profile (the add_* and
+    extend_with methods), so that the GUI can retrieve the source casts in background and then apply them
+    with the same logic. Where the GUI asks the user (draft, surface sound speed), the configured values are
+    used. The position and the date of the casts without them are resolved by the cast 'context' (by default,
+    the configured values). The failures are raised as SspError.
+    """
+
+    def __init__(self, prj, config, context=None, rtofs_cache=None):
+        self.prj = prj
+        self.config = config
+        if context is None:
+            default_position = None
+            if (config.latitude is not None) and (config.longitude is not None):
+                default_position = (config.latitude, config.longitude)
+            context = CastContext(default_position=default_position, default_date=config.cast_date())
+        self.context = context
+        if rtofs_cache is None:
+            atlas = RtofsFolder(config.rtofs_folder) if config.rtofs_folder else prj.rtofs_atlas
+            rtofs_cache = RtofsCache(atlas, os.path.join(Woa09Checker.get_atlases_folder(), "rtofs"),
+                                     offline=config.rtofs_offline)
+        self.rtofs_cache = rtofs_cache
+        for name in config.export_formats:
+            self.prj.u.switch_export_format(name)
+
+    # source casts
+
+    def woa09_available(self):
+        """WOA09 casts are available from the loaded atlas, or from the atlas to be loaded at the first query"""
+        if self.prj.woa09_atlas_loaded:
+            return True
+        atlas = self.prj.woa09_atlas
+        return isinstance(atlas, LazyAtlas) and not atlas.loaded
+
+    def rtofs_available(self):
+        """RTOFS casts are available from the remote atlas (also while loading), its stand-in, or the offline cache"""
+        if self.prj.rtofs_atlas_loaded or self.rtofs_cache.offline:
+            return True
+        atlas = self.rtofs_cache.atlas
+        return isinstance(atlas, RtofsFolder) or (isinstance(atlas, LazyAtlas) and not atlas.loaded)
+
+    def _source(self, option, setting, sources):
+        name = getattr(self.config, option)
+        if name is None:
+            return setting
+        try:
+            return sources[name]
+        except KeyError:
+            raise SspError("unsupported %s: %s" % (option, name))
+
+    def _woa09_cast(self):
+        if not self.woa09_available():
+            raise SspError("failure in loading WOA09 atlas")
+        if self.prj.ssp_woa is None:
+            raise SspError("failure in WOA2009 lookup")
+        return self.prj.ssp_woa
+
+    def atlas(self, source, sources):
+        """Return the atlas ("RTOFS" or "WOA09") to use for the passed salinity or extension source"""
+        if source == sources["RTOFS"]:
+            if self.rtofs_available():
+                return "RTOFS"
+            if not self.woa09_available():
+                raise SspError("Failed on load RTOFS and WOA09 grids")
+            log.info("RTOFS grids not loaded, reverting to WOA09")
+            self._woa09_cast()
+            return "WOA09"
+
+        elif source == sources["WOA09"]:
+            self._woa09_cast()
+            return "WOA09"
+
+        raise SspError("unsupported atlas source: %s" % source)
+
+    def _atlas_cast(self, source, sources):
+        """Return the atlas cast at the current profile location, and the name of the used atlas"""
+        if self.atlas(source, sources) == "RTOFS":
+            try:
+                return self.rtofs_cache.query(self.prj.ssp_data.latitude, self.prj.ssp_data.longitude,
+                                              self.prj.ssp_data.date_time), "RTOFS"
+            except SspError:
+                log.info("failure in RTOFS lookup, reverting to WOA09")
+        return self._woa09_cast(), "WOA09"
+
+    def reference_source(self):
+        return 'user-specified reference file %s' % self.prj.ssp_reference_filename
+
+    def _reference(self, source, sources):
+        if self.prj.ssp_reference:
+            return self.prj.ssp_reference, self.reference_source()
+        return self._atlas_cast(source, sources)
+
+    # application of the source casts
+
+    def add_salinity(self, cast, salinity_source):
+        """Replace the salinity values of the profile with the ones of the passed cast"""
+        own(self.prj.ssp_data)
+        self.prj.ssp_data.replace_samples(cast, 'salinity')
+        self.prj.ssp_data.calc_speed()
+        self.prj.ssp_data.modify_source_info("salinity augmented from %s" % salinity_source)
+        log.info('salinity added to profile using source %s' % salinity_source)
+
+    def add_temp_and_sal(self, cast, temperature_salinity_source):
+        """Replace the temperature and the salinity values of the profile with the ones of the passed cast"""
+        own(self.prj.ssp_data)
+        self.prj.ssp_data.replace_samples(cast, 'salinity')
+        self.prj.ssp_data.replace_samples(cast, 'temperature')
+        # We don't recalculate speed, of course.  T/S is simply for absorption coefficient calculation
+        self.prj.ssp_data.modify_source_info("temperature/salinity augmented from %s" % temperature_salinity_source)
+        log.info('temperature/salinity added to profile using source %s' % temperature_salinity_source)
+
+    def add_surface_ssp(self, surface_ssp, vessel_draft, surface_ssp_source):
+        own(self.prj.ssp_data)
+        self.prj.vessel_draft = vessel_draft
+
+        # Insert the surface speed value into the profile at the vessel_draft
+        self.prj.surface_speed_applied = True
+        self.prj.ssp_applied_depth = 1.15 * self.prj.vessel_draft
+        self.prj.ssp_data.insert_sample(depth=self.prj.ssp_applied_depth, speed=surface_ssp,
+                                        temperature=None, salinity=None,
+                                        source=Dicts.source_types['SurfaceSensor'])
+
+        # And set all values shoaller than the draft to be the same speed
+        idx = self.prj.ssp_data.data[Dicts.idx['depth'], :] < self.prj.ssp_applied_depth
+        self.prj.ssp_data.data[Dicts.idx['speed'], idx] = surface_ssp
+        self.prj.ssp_data.modify_source_info('surface sound speed from %s' % surface_ssp_source)
+        log.info('surface sound speed %.2f added to profile for upper %.1f m (source: %s)'
+                 % (surface_ssp, vessel_draft, surface_ssp_source))
+
+    def extend_with(self, cast, source):
+        """Extend the profile with the passed cast (from "RTOFS", "WOA09" or the reference), returning the type"""
+        own(self.prj.ssp_data)
+        if source == "RTOFS":
+            ext_type = Dicts.source_types['RtofsExtend']
+            self.prj.ssp_data.extend(cast, ext_type)
+            # now use the WOA09 since it usually goes deeper
+            if self.prj.ssp_woa is not None:
+                self.prj.ssp_data.extend(self.prj.ssp_woa, Dicts.source_types['Woa09Extend'])
+        elif source == "WOA09":
+            ext_type = Dicts.source_types['Woa09Extend']
+            self.prj.ssp_data.extend(cast, ext_type)
+        else:
+            ext_type = Dicts.source_types['UserRefExtend']
+            self.prj.ssp_data.extend(cast, ext_type)
+
+        self.prj.ssp_data.modify_source_info("extension type %s" % ext_type)
+        log.info('profile extended to depth %d m using source type %s'
+                 % (self.prj.ssp_data.data[Dicts.idx['depth'], self.prj.ssp_data.data.shape[1] - 1], ext_type))
+        return ext_type
+
+    # processing steps
+
+    def open(self, filename, input_format):
+        if not (input_format in Dicts.import_formats.values()):
+            raise SspError("unsupported import format: %s" % input_format)
+
+        if self.prj.has_ssp_loaded:
+            self.prj.clean_project()
+
+        self.prj.open_file_format(filename, input_format, self.context.get_date, self.context.get_position)
+        log.info("loaded %s" % self.prj.filename)
+
+    def load_salinity(self):
+        """XBT-specific step to add salinity values"""
+        if self.prj.ssp_data.sensor_type != Dicts.sensor_types["XBT"]:
+            raise SspError("XBT-specific function")
+
+        source = self._source("salinity_source", self.prj.s.ssp_salinity_source, Dicts.salinity_sources)
+        self.add_salinity(*self._reference(source, Dicts.salinity_sources))
+
+    def load_temp_and_sal(self):
+        """XSV- and SVP- specific step to add temperature and salinity values"""
+        if (self.prj.ssp_data.sensor_type != Dicts.sensor_types["XSV"]) \
+                and (self.prj.ssp_data.sensor_type != Dicts.sensor_types["SVP"]):
+            raise SspError("XSV- and SVP-specific function")
+
+        source = self._source("salinity_source", self.prj.s.ssp_salinity_source, Dicts.salinity_sources)
+        self.add_temp_and_sal(*self._reference(source, Dicts.salinity_sources))
+
+    def load_surface_ssp(self, surface_ssp, vessel_draft):
+        self.add_surface_ssp(surface_ssp, vessel_draft, "batch configuration")
+
+    def extend(self):
+        if self.prj.ssp_reference:
+            self.extend_with(self.prj.ssp_reference, "reference")
+            return
+
+        source = self._source("extension_source", self.prj.s.ssp_extension_source, Dicts.extension_sources)
+        self.extend_with(*self._atlas_cast(source, Dicts.extension_sources))
+
+    def preview_thinning(self):
+        own(self.prj.ssp_data)
+        self.prj.ssp_data.prepare_sis_data(thin=True)
+
+    def export(self):
+        if self.prj.count_export_formats() == 0:
+            return
+
+        if self.config.output_folder:
+            self.prj.u.user_export_directory = self.config.output_folder
+        else:
+            self.prj.u.user_export_directory = self.prj.get_output_folder()
+        filename = os.path.basename(self.prj.filename)
+        self.prj.u.user_filename_prefix = os.path.splitext(filename)[0]
+        own(self.prj.ssp_data)
+        self.prj.formats_export("USER")
+
+    def process(self, filename, input_format):
+        """Apply all the configured steps to a cast file, and return the processed cast"""
+        self.open(filename, input_format)
+
+        sensor_type = self.prj.ssp_data.sensor_type
+        if self.config.load_salinity and (sensor_type == Dicts.sensor_types["XBT"]):
+            self.load_salinity()
+        if self.config.load_temp_and_sal \
+                and ((sensor_type == Dicts.sensor_types["XSV"]) or (sensor_type == Dicts.sensor_types["SVP"])):
+            self.load_temp_and_sal()
+        if (self.config.surface_ssp is not None) and self.config.vessel_draft:
+            self.load_surface_ssp(self.config.surface_ssp, self.config.vessel_draft)
+        if self.config.extend:
+            self.extend()
+        if self.config.thin:
+            self.preview_thinning()
+        self.export()
+        return self.prj.ssp_data
+
+
+def cast_formats(input_formats=None):
+    """Return the input formats by (lowercase) file extension, for the named formats (None: all of them)"""
+    if input_formats is None:
+        input_formats = list(Dicts.import_formats.keys())
+
+    formats = dict()
+    for name in input_formats:
+        try:
+            input_format = Dicts.import_formats[name]
+        except KeyError:
+            raise SspError("unsupported import format: %s" % name)
+        ext = Dicts.import_extensions[input_format].lower()
+        formats.setdefault(ext, list()).append(input_format)
+    return formats
+
+
+def cast_format(filename, formats):
+    """Return the input format of a cast file (None, if not recognized), given the formats by extension
+
+    The extensions shared by several of the input formats are not recognized (restrict the 'input_formats'
+    option to process them).
+    """
+    ext = os.path.splitext(filename)[1][1:].lower()
+    if ext not in formats:
+        return None
+    if len(formats[ext]) > 1:
+        log.warning("skipping %s: the '%s' extension is shared by several input formats" % (filename, ext))
+        return None
+    return formats[ext][0]
+
+
+def find_casts(folder, input_formats=None):
+    """Return the sorted list of (path, input format) for the cast files under the folder"""
+    formats = cast_formats(input_formats)
+
+    casts = list()
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            input_format = cast_format(filename, formats)
+            if input_format is not None:
+                casts.append((os.path.join(root, filename), input_format))
+    return casts
+
+
+# the pipeline of each pool process (created once, since loading the atlases is costly)
+_pipeline = None
+
+
+def _init_worker(config):
+    global _pipeline
+    prj = project.Project(with_listeners=False, with_woa09=config.with_woa09, with_rtofs=config.with_rtofs)
+    _pipeline = CastPipeline(prj, config)
+
+
+def _process_cast(cast):
+    filename, input_format = cast
+    start = time.time()
+    try:
+        ssp = _pipeline.process(filename, input_format)
+    except Exception as e:
+        log.warning("failure in processing %s: %s" % (filename, e))
+        return filename, None, "%s" % e, time.time() - start
+    return filename, ssp, None, time.time() - start
+
+
+def run(folder, config):
+    """Process all the cast files under the folder, and return the list of (path, error) for the failures"""
+    casts = find_casts(folder, config.input_formats)
+    if len(casts) == 0:
+        log.info("no cast files in %s" % folder)
+        return list()
+
+    workers = min(config.workers or min(multiprocessing.cpu_count(), max_default_workers), len(casts))
+    log.info("processing %d casts with %d workers" % (len(casts), workers))
+    start = time.time()
+
+    if workers == 1:
+        _init_worker(config)
+        results = (_process_cast(cast) for cast in casts)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(config, ))
+        results = pool.imap_unordered(_process_cast, casts)
+
+    processed = SspCollection()
+    failures = list()
+    durations = list()
+    try:
+        for filename, ssp, error, duration in results:
+            durations.append(duration)
+            if error is not None:
+                failures.append((filename, error))
+                continue
+            log.info("processed %s in %.2f s (%d/%d)" % (filename, duration, len(durations), len(casts)))
+            processed.append(ssp)
+
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+        raise
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # all the casts are stored at once, since the local db does not support concurrent writers
+    if config.store_db and len(processed) > 0:
+        ssp_db = SspDb()
+        ssp_db.add_casts(processed)
+        ssp_db.disconnect()
+
+    log.info("processed %d/%d casts in %.1f s (mean per cast: %.2f s)"
+             % (len(casts) - len(failures), len(casts), time.time() - start, np.mean(durations)))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m hydroffice.ssp_manager batch",
+                                     description="Process all the cast files in a folder, without GUI")
+    parser.add_argument("folder", help="folder with the raw cast files (searched recursively)")
+    parser.add_argument("-c", "--config", help="JSON file with the processing options")
+    parser.add_argument("-o", "--output", help="output folder for the exported casts")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="number of worker processes (default: all the cores, up to %d)" % max_default_workers)
+    args = parser.parse_args(argv)
+
+    config = BatchConfig.load(args.config) if args.config else BatchConfig()
+    if args.output:
+        config.output_folder = args.output
+    if args.workers:
+        config.workers = args.workers
+    log.info("batch configuration: %s" % config)
+
+    failures = run(args.folder, config)
+    for filename, error in failures:
+        log.error("%s: %s" % (filename, error))
+    return 1 if failures else 0
@@ -0,0 +1,203 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class SisProber(object):
+    """Request the current cast to the SIS clients, and take the first valid one
+
+    The clients share the listener, so they are requested one at a time: a cast in the listener right after
+    a request is the answer of that client (and only then it becomes the recipient). The client that
+    answered last is probed first at the next request, so that usually a single request is needed.
+
+    With start(), the requests run in a background thread and the outcome is provided through 'dispatch'
+    (e.g., wx.CallAfter), so that the caller is not blocked while the offline clients time out.
+    """
+
+    def __init__(self, prj, dispatch=None):
+        self.prj = prj
+        self.dispatch = dispatch
+        self.last_ip = None  # the client that provided the last valid cast
+        self._thread = None
+
+    @property
+    def busy(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def client_ips(self):
+        """Return the IPs of the configured clients, with the last answering client first"""
+        ips = list()
+        for client in range(self.prj.s.client_list.num_clients):
+            ip = self.prj.s.client_list.clients[client].IP
+            if ip not in ips:
+                ips.append(ip)
+        if self.last_ip in ips:
+            ips.remove(self.last_ip)
+            ips.insert(0, self.last_ip)
+        return ips
+
+    def probe(self):
+        """Request the cast to the clients, and return the IP of the first one with a valid cast (or None)
+
+        The retrieved cast is in the listener (as for Project.get_cast_from_sis).
+        """
+        recipient_ip = self.prj.ssp_recipient_ip
+        for ip in self.client_ips():
+            log.info("testing client %s" % ip)
+            self.prj.km_listener.ssp = None
+            self.prj.ssp_recipient_ip = ip
+            try:
+                self.prj.get_cast_from_sis()
+            except Exception as e:
+                log.warning("client %s: failure in requesting the cast: %s" % (ip, e))
+                self.prj.km_listener.ssp = None
+
+            if self.prj.km_listener.ssp:
+                log.info("got SSP from client %s" % ip)
+                self.last_ip = ip
+                return ip
+            log.info("no valid SSP from client %s" % ip)
+
+        self.prj.km_listener.ssp = None
+        self.prj.ssp_recipient_ip = recipient_ip
+        return None
+
+    def start(self, on_done):
+        """Run probe() in a background thread, then call 'on_done(ip)' (through 'dispatch')"""
+        if self.busy:
+            raise RuntimeError("a cast request is already in progress")
+
+        def worker():
+            ip = None
+            try:
+                ip = self.probe()
+            except Exception as e:
+                log.warning("failure in requesting the cast: %s" % e)
+            if self.dispatch is None:
+                on_done(ip)
+            else:
+                self.dispatch(on_done, ip)
+
+        self._thread = threading.Thread(target=worker, name="SisProber")
+        self._thread.daemon = True
+        self._thread.start()
+
+
+class CastSender(object):
+    """Transmit the current cast to all the clients, in a background thread
+
+    The clients share the listener and the profile (each send_cast prepares its SIS data), so the
+    transmissions run one at a time: each one waits for its own reception confirmation. The outcomes are
+    provided through 'dispatch' (e.g., wx.CallAfter), so that the caller is never blocked.
+    """
+
+    def __init__(self, prj, dispatch=None):
+        self.prj = prj
+        self.dispatch = dispatch
+        self._thread = None
+
+    @property
+    def busy(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def clients(self):
+        return [self.prj.s.client_list.clients[client] for client in range(self.prj.s.client_list.num_clients)]
+
+    def _notify(self, callback, *args):
+        if callback is None:
+            return
+        if self.dispatch is None:
+            callback(*args)
+        else:
+            self.dispatch(callback, *args)
+
+    def send(self, fmt, on_sent=None, on_done=None):
+        """Send the cast in the passed format to all the clients
+
+        'on_sent(client, success)' is called for each client, and 'on_done(outcomes)' with the list of all the
+        (client, success) at the end.
+        """
+        if self.busy:
+            raise RuntimeError("a transmission is already in progress")
+        clients = self.clients()
+
+        def worker():
+            outcomes = list()
+            for client in clients:
+                log.info("transmitting cast to %s" % client.IP)
+                success = False
+                try:
+                    success = self.prj.send_cast(client, fmt)
+                except Exception as e:
+                    log.warning("client %s: failure in transmitting the cast: %s" % (client.IP, e))
+                outcomes.append((client, success))
+                self._notify(on_sent, client, success)
+            self._thread = None  # no longer busy once 'on_done' is called
+            self._notify(on_done, outcomes)
+
+        self._thread = threading.Thread(target=worker, name="CastSender")
+        self._thread.daemon = True
+        self._thread.start()
+
+
+class PayloadCache(object):
+    """Encode-once cache of the Kongsberg datagrams of the current profile
+
+    Once attached, the profile 'convert_km' is memoised by format, thinning parameters (the ones of the last
+    'prepare_sis_data' call, which builds the encoded SIS data) and data version, so that the transmission to
+    every client, the log and the stored copy of the transmitted datagram reuse the same encoded payload.
+    The data version has to be increased (by 'invalidate') after any in-place modification of the profile:
+    the edit journal does it at each recorded operation (see EditJournal.on_change).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+        self._ssp = None
+        self._encode = None
+        self._prepare = None
+        self._thinning = None  # the parameters of the last SIS data preparation (None: unknown)
+        self._payloads = dict()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._payloads.clear()
+
+    def attach(self, ssp):
+        """Memoise the datagram encoding of the passed profile"""
+        with self._lock:
+            if ssp is self._ssp:
+                return
+            self._payloads.clear()
+            self._ssp = ssp
+            self._thinning = None
+            self._encode = ssp.convert_km
+            self._prepare = ssp.prepare_sis_data
+            ssp.convert_km = self.convert_km
+            ssp.prepare_sis_data = self.prepare_sis_data
+
+    def prepare_sis_data(self, *args, **kwargs):
+        result = self._prepare(*args, **kwargs)
+        with self._lock:
+            self._thinning = (args, tuple(sorted(kwargs.items())))
+        return result
+
+    def key(self, fmt):
+        return fmt, self._thinning, self.version
+
+    def convert_km(self, fmt, *args, **kwargs):
+        if args or kwargs:  # not the plain encoding
+            return self._encode(fmt, *args, **kwargs)
+
+        with self._lock:
+            if self._thinning is None:  # SIS data prepared before the attach
+                return self._encode(fmt)
+            key = self.key(fmt)
+            if key not in self._payloads:
+                log.debug("encoding payload: %s" % (key, ))
+                self._payloads[key] = self._encode(fmt)
+            return self._payloads[key]
@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime as dt
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class CastContext(object):
+    """Resolve the position and the date of a cast without user interaction
+
+    The position is taken from (in order):
+    - the latest SIS navigation (if not older than 'max_nav_age' seconds),
+    - the last remembered position (e.g., entered by the user; only if 'max_cast_age' is set, and for that
+      many seconds),
+    - the default position.
+
+    The date is taken from the latest SIS navigation, or the default date (the machine clock is wrong for the
+    historical casts, so it is never used).
+
+    The get_position() and get_date() methods can be passed as callbacks to the project. When nothing is
+    available, they return [None, None] and None.
+    """
+
+    def __init__(self, listener=None, default_position=None, default_date=None, max_nav_age=300.0,
+                 max_cast_age=None):
+        self.listener = listener  # the Kongsberg listener (or None)
+        self.default_position = default_position  # (latitude, longitude)
+        self.default_date = default_date
+        self.max_nav_age = max_nav_age
+        self.max_cast_age = max_cast_age  # [s] None to not reuse the remembered cast position
+        self._cast_position = None  # (latitude, longitude, time when remembered)
+
+    def _nav(self):
+        """Return the latest SIS navigation (or None, if missing or too old)"""
+        nav = self.listener.nav if self.listener else None
+        if not nav:
+            return None
+        if nav.dg_time and (abs((dt.datetime.utcnow() - nav.dg_time).total_seconds()) > self.max_nav_age):
+            log.debug("SIS navigation too old: %s" % nav.dg_time)
+            return None
+        return nav
+
+    def remember(self, latitude, longitude):
+        """Remember the position of a cast, for the next casts without position"""
+        if (latitude is None) or (longitude is None):
+            return
+        self._cast_position = (latitude, longitude, time.time())
+
+    def position(self):
+        """Return the position and its source as (latitude, longitude, source)"""
+        nav = self._nav()
+        if nav and (nav.latitude is not None) and (nav.longitude is not None):
+            return nav.latitude, nav.longitude, "SIS"
+
+        cast_position = self._cast_position
+        if cast_position and (self.max_cast_age is not None) \
+                and (time.time() - cast_position[2] <= self.max_cast_age):
+            return cast_position[0], cast_position[1], "last entry"
+
+        if self.default_position:
+            return self.default_position[0], self.default_position[1], "default"
+
+        return None, None, None
+
+    def date(self):
+        """Return the date and its source as (date, source)"""
+        nav = self._nav()
+        if nav and nav.dg_time:
+            return nav.dg_time, "SIS"
+
+        if self.default_date:
+            return self.default_date, "default"
+
+        return None, None
+
+    def get_position(self):
+        latitude, longitude, source = self.position()
+        if source is not None:
+            log.info("cast position %s %s from %s" % (latitude, longitude, source))
+        return [latitude, longitude]
+
+    def get_date(self):
+        date, source = self.date()
+        if source is not None:
+            log.info("cast date %s from %s" % (date, source))
+        return date
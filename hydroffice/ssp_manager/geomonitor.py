@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import datetime as dt
 import logging
+from collections import OrderedDict
 
 import wx
 from mpl_toolkits.basemap import Basemap
@@ -10,6 +11,7 @@ import numpy as np
 import math
 
 from . import wxmpl
+from .track import TrackStore, SpeedGrid
 
 lgr = logging.getLogger(__name__)
 
@@ -56,9 +58,9 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
         self.last_longitude = None
         self.last_ssp = None
         self.last_ssp_time = None
-        self.latitude = []
-        self.longitude = []
-        self.ssp = []
+        self.track_store = TrackStore()  # array-backed (and thinned) vessel track
+        self.speed_grid = None  # surface sound speed binned on the current view extent
+        self.binned = 0  # number of track positions already added to the speed grid
         self.view_min_lat = -90
         self.view_max_lat = 90
         self.lat_step = None
@@ -69,15 +71,20 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
         self.last_ping_time = dt.datetime.utcnow()
         self.is_zoomed = False
 
-        self.m = Basemap(projection='mill', lat_ts=10, llcrnrlon=-180, urcrnrlon=180,
-                         llcrnrlat=-90, urcrnrlat=90, resolution='c')
-        self.m.drawcoastlines(ax=self.map_axes)
-        self.m.fillcontinents(ax=self.map_axes, color='coral', lake_color='aqua')
-        self.m.drawmapboundary(ax=self.map_axes, fill_color='aqua')
-        self.m.drawparallels(np.arange(-90., 120., 30.), labels=[1, 0, 0, 0], ax=self.map_axes)
-        self.m.drawmeridians(np.arange(-180., 180., 60.), labels=[0, 0, 0, 1], ax=self.map_axes)
+        # the map layers are rendered once per view extent into a cached background, then only the surface
+        # sound speed image and the last position are blitted on top of it
+        self.basemaps = OrderedDict()  # Basemap instances by view extent (least recently used first)
+        self.basemaps_size = 4
+        self.background = None
+        self.background_extent = None
+        self.track = None
+        self.speed_image = None
+        self.plots.mpl_connect('draw_event', self._on_draw)
+
+        self.m = self.get_basemap()
         self.view_min_x, self.view_min_y = self.m(-180, -90, inverse=True)
         self.view_max_x, self.view_max_y = self.m(180, 90, inverse=True)
+        self.draw_background()
 
     def _on_selection(self, evt):
         x1, y1 = evt.x1data, evt.y1data
@@ -95,9 +102,7 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
                 self.view_min_lon, self.view_min_lat = self.m(self.view_min_x, self.view_min_y, inverse=True)
                 self.view_max_lon, self.view_max_lat = self.m(self.view_max_x, self.view_max_y, inverse=True)
                 self.get_lat_lon_steps()
-                self.m = Basemap(projection='mill', lat_ts=10, resolution='c',
-                                 llcrnrlon=self.view_min_lon, urcrnrlon=self.view_max_lon,
-                                 llcrnrlat=self.view_min_lat, urcrnrlat=self.view_max_lat)
+                self.m = self.get_basemap()
                 self.is_zoomed = True
             else:
                 lgr.info("unknown axes")
@@ -140,8 +145,6 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
         self.last_latitude = self.km_listener.nav.latitude
         self.last_longitude = self.km_listener.nav.longitude
         lgr.info("got position: %s, %s" % (self.last_latitude, self.last_longitude))
-        self.latitude.append(self.last_latitude)
-        self.longitude.append(self.last_longitude)
         msg_str = "%s, " % (self.km_listener.xyz88.dg_time.strftime("%Y-%m-%d %H:%M:%S"))
         msg_str += "%.1f m/s" % self.km_listener.xyz88.sound_speed
         self.GeographicMonitorFrame_statusbar.SetStatusText(msg_str, 1)
@@ -151,7 +154,7 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
             return
         self.last_ssp_time = self.km_listener.xyz88.dg_time
         self.last_ssp = self.km_listener.xyz88.sound_speed
-        self.ssp.append(self.last_ssp)
+        self.track_store.append(self.last_ssp_time, self.last_latitude, self.last_longitude, self.last_ssp)
         lgr.info("got (%s, %s) -> %s" % (self.last_latitude, self.last_longitude, self.last_ssp))
         self.last_ping_time = self.km_listener.xyz88.dg_time
         if self.display_timer.is_alive():
@@ -164,8 +167,25 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
         self.lon_step = int(lon_range / 10.0)
         lgr.info("got lat/lon steps %s %s" % (self.lat_step, self.lon_step))
 
-    def update_plots(self):
-        lgr.info("updating plots")
+    def view_extent(self):
+        return self.view_min_lon, self.view_max_lon, self.view_min_lat, self.view_max_lat
+
+    def get_basemap(self):
+        """Return the (cached) Basemap for the current view extent, only the last few extents are kept"""
+        extent = self.view_extent()
+        m = self.basemaps.pop(extent, None)
+        if m is None:
+            m = Basemap(projection='mill', lat_ts=10, resolution='c',
+                        llcrnrlon=self.view_min_lon, urcrnrlon=self.view_max_lon,
+                        llcrnrlat=self.view_min_lat, urcrnrlat=self.view_max_lat)
+        self.basemaps[extent] = m  # most recently used
+        while len(self.basemaps) > self.basemaps_size:
+            self.basemaps.popitem(last=False)
+        return m
+
+    def draw_background(self):
+        """Redraw the map layers for the current view extent (the background is cached by the draw event)"""
+        lgr.info("drawing map background")
 
         try:
             self.map_axes.cla()
@@ -180,7 +200,54 @@ class GeoMonitor(geomonitor_ui.GeoMonitorBase):
         except:
             lgr.info("failure in updating")
 
-        x, y = self.m(self.longitude, self.latitude)
-        lgr.info("got projected coords: %s %s from: %s %s" % (x, y, self.longitude, self.latitude))
-        self.map_axes.plot(x, y, 'r+')
+        # the surface sound speed is re-binned from the stored track on the new view extent
+        self.speed_grid = SpeedGrid(self.m.llcrnrx, self.m.urcrnrx, self.m.llcrnry, self.m.urcrnry)
+        self.binned = 0
+        self.speed_image = self.map_axes.imshow(self.speed_grid.mean(), origin='lower', interpolation='nearest',
+                                                extent=self.speed_grid.extent, cmap='jet', zorder=10,
+                                                animated=True)
+        self.track, = self.map_axes.plot([], [], 'k+', markersize=10, zorder=11, animated=True)
+        self.update_track()
+        self.background = None
+        self.background_extent = self.view_extent()
         self.plots.draw()
+
+    def _on_draw(self, evt):
+        """After a full draw, cache the map background and draw the (animated) track on top of it"""
+        self.background = self.plots.copy_from_bbox(self.map_axes.bbox)
+        self.draw_track()
+
+    def update_track(self):
+        # only the positions received since the last update are projected (unless the Basemap changed)
+        x, y = self.track_store.projected(self.m)
+
+        # only the positions received since the last update are binned in the speed grid
+        nr_new = min(self.track_store.appended - self.binned, self.track_store.size)
+        if nr_new > 0:
+            ssp = self.track_store.ssp[self.track_store.size - nr_new:self.track_store.size]
+            self.speed_grid.add(x[-nr_new:], y[-nr_new:], ssp)
+            self.binned = self.track_store.appended
+            self.speed_image.set_data(self.speed_grid.mean())
+            speed_range = self.speed_grid.speed_range()
+            if speed_range is not None:
+                self.speed_image.set_clim(speed_range[0], max(speed_range[1], speed_range[0] + 0.1))
+
+        self.track.set_data(x[-1:], y[-1:])
+
+    def draw_track(self):
+        if self.speed_image is not None:
+            self.map_axes.draw_artist(self.speed_image)
+        if self.track is not None:
+            self.map_axes.draw_artist(self.track)
+
+    def update_plots(self):
+        lgr.info("updating plots")
+
+        if (self.background is None) or (self.background_extent != self.view_extent()):
+            self.draw_background()
+            return
+
+        self.update_track()
+        self.plots.restore_region(self.background)
+        self.draw_track()
+        self.plots.blit(self.map_axes.bbox)
@@ -0,0 +1,275 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+from collections import deque
+
+import numpy as np
+
+from hydroffice.ssp.ssp_dicts import Dicts
+from .snapshot import own
+
+log = logging.getLogger(__name__)
+
+
+def _changed(before, after):
+    """Mask of the differing values (NaN values are equal to each other)"""
+    if not np.issubdtype(before.dtype, np.floating):
+        return before != after
+    return (before != after) & ~(np.isnan(before) & np.isnan(after))
+
+
+class ProfileEdit(object):
+    """The delta between the data of a profile before and after an operation
+
+    Only the inserted columns and the changed values of the other columns are kept. Both are
+    indexed in the layout after the operation.
+    """
+
+    __slots__ = ('name', 'inserted', 'columns', 'rows', 'cols', 'old', 'new', 'state')
+
+    def __init__(self, name, inserted, columns, rows, cols, old, new):
+        self.name = name
+        self.inserted = inserted  # indices of the inserted columns
+        self.columns = columns  # values of the inserted columns
+        self.rows = rows  # row and column indices of the changed values
+        self.cols = cols
+        self.old = old
+        self.new = new
+        self.state = None  # (state before, state after) of the journal owner
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in (self.inserted, self.columns, self.rows, self.cols, self.old, self.new))
+
+    @classmethod
+    def diff(cls, name, before, after, keep=False, rows=None):
+        """Return the edit from the 'before' to the 'after' data (None, if nothing changed and not 'keep')
+
+        With 'rows', 'before' only has these rows of the data (including the depth one, to match the columns),
+        and the other rows are assumed unchanged.
+        """
+        if rows is None:
+            rows = np.arange(after.shape[0])
+            if after.shape[0] != before.shape[0]:
+                raise ValueError("unsupported profile change in %s: %s -> %s" % (name, before.shape, after.shape))
+        rows = np.asarray(rows)
+
+        if before.shape[1] == after.shape[1]:
+            is_matched = np.ones(after.shape[1], dtype=bool)
+
+        else:
+            # the columns of 'before' are matched in order by depth (the operations never change it), the
+            # remaining columns of 'after' are the inserted ones
+            depth_before = before[np.flatnonzero(rows == Dicts.idx['depth'])[0]].tolist()
+            depth_after = after[Dicts.idx['depth']].tolist()
+            is_matched = np.zeros(after.shape[1], dtype=bool)
+            i = 0
+            for j, depth in enumerate(depth_after):
+                if (i < len(depth_before)) and ((depth_before[i] == depth)
+                                                or ((depth_before[i] != depth_before[i]) and (depth != depth))):
+                    is_matched[j] = True
+                    i += 1
+            if i != before.shape[1]:
+                raise ValueError("unsupported profile change in %s: %s -> %s" % (name, before.shape, after.shape))
+
+        inserted = np.flatnonzero(~is_matched)
+        matched = np.flatnonzero(is_matched)
+        if len(rows) == after.shape[0]:
+            after_matched = after[:, matched]
+        else:
+            after_matched = after[rows[:, np.newaxis], matched]
+        changed_rows, before_cols = np.nonzero(_changed(before, after_matched))
+        if (len(inserted) == 0) and (len(changed_rows) == 0) and not keep:
+            return None
+
+        return cls(name, inserted, after[:, inserted], rows[changed_rows], matched[before_cols],
+                   before[changed_rows, before_cols], after_matched[changed_rows, before_cols])
+
+    def undo(self, ssp):
+        own(ssp)
+        ssp.data[self.rows, self.cols] = self.old
+        if len(self.inserted):
+            ssp.data = np.delete(ssp.data, self.inserted, axis=1)
+
+    def redo(self, ssp):
+        own(ssp)
+        if len(self.inserted):
+            # np.insert positions refer to the data before the insertion
+            positions = self.inserted - np.arange(len(self.inserted))
+            ssp.data = np.insert(ssp.data, positions, self.columns, axis=1)
+        ssp.data[self.rows, self.cols] = self.new
+
+    def __repr__(self):
+        return "<%s %s: %d inserted, %d changed>" % (self.__class__.__name__, self.name, len(self.inserted),
+                                                     len(self.rows))
+
+
+class ProfileReplace(object):
+    """The full data of a profile before an operation (for the changes not supported by ProfileEdit)
+
+    Undo and redo swap the kept data with the current one, so that a single copy is held.
+    """
+
+    __slots__ = ('name', 'data', 'state')
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.state = None
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def undo(self, ssp):
+        self.data, ssp.data = ssp.data, self.data
+
+    def redo(self, ssp):
+        self.data, ssp.data = ssp.data, self.data
+
+    def __repr__(self):
+        return "<%s %s: %s>" % (self.__class__.__name__, self.name, self.data.shape)
+
+
+class EditJournal(object):
+    """Undo/redo journal of the operations applied to the data of the current profile
+
+    An operation is recorded between begin() and commit() (or with record()). The data before the operation is
+    only held until the commit, the journal keeps the deltas (see ProfileEdit). When the rows that an operation
+    can change are known (e.g., the flags), only these rows are held. Undo and redo apply the last delta in
+    place, whatever the journal length. The rare changes that cannot be expressed as a delta are kept as full
+    copies (see ProfileReplace).
+
+    At most 'max_depth' operations are kept, and the oldest ones are dropped once the kept deltas exceed
+    'max_bytes' (the last operation is always kept).
+
+    The journal follows a single profile: it is emptied when used with a different one. The 'attributes' of the
+    'owner' object (e.g., the project flags about the applied surface sound speed) are recorded with each
+    operation, and restored by undo and redo.
+
+    The optional 'on_change()' is called after each change of the profile data through the journal (a recorded
+    operation, undo, redo) and when the journal is emptied (e.g., to invalidate the encoded datagrams).
+    """
+
+    def __init__(self, max_depth=200, max_bytes=32 * 1024 * 1024, owner=None, attributes=(), on_change=None):
+        self.ssp = None
+        self.max_bytes = max_bytes
+        self.owner = owner
+        self.attributes = tuple(attributes)
+        self.on_change = on_change
+        self._done = deque(maxlen=max_depth)
+        self._undone = list()
+        self._pending = None  # (name, recorded rows, data before the operation, owner state before the operation)
+
+    def _follow(self, ssp):
+        if ssp is not self.ssp:
+            self.clear()
+            self.ssp = ssp
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def clear(self):
+        self._done.clear()
+        self._undone = list()
+        self._pending = None
+        self._changed()
+
+    @property
+    def nbytes(self):
+        return sum(edit.nbytes for edit in self._done) + sum(edit.nbytes for edit in self._undone)
+
+    def _state(self):
+        if self.owner is None:
+            return None
+        return tuple(getattr(self.owner, attribute) for attribute in self.attributes)
+
+    def _restore(self, state):
+        if self.owner is None:
+            return
+        for attribute, value in zip(self.attributes, state):
+            setattr(self.owner, attribute, value)
+
+    def begin(self, name, ssp, rows=None):
+        """Start recording an operation on the profile data
+
+        The optional 'rows' are the only data rows that the operation can change (e.g., the flags), while the
+        inserted columns are always recorded: only these rows are held until the commit.
+        """
+        self._follow(ssp)
+        own(ssp)  # the read-only arrays of a snapshot (if any) are copied at the first edit
+        if rows is None:
+            before = ssp.data.copy()
+        else:
+            rows = sorted(set(rows) | {Dicts.idx['depth']})  # the depths match the columns after an insertion
+            before = ssp.data[rows]
+        self._pending = (name, rows, before, self._state())
+
+    def commit(self, ssp):
+        """Record the operation started with begin(), and return its edit (None, if nothing changed)"""
+        if (self._pending is None) or (ssp is not self.ssp):
+            return None
+        name, rows, before, state_before = self._pending
+        self._pending = None
+
+        state = self._state()
+        try:
+            edit = ProfileEdit.diff(name, before, ssp.data, keep=(state != state_before), rows=rows)
+        except ValueError as e:
+            if rows is not None:  # the data before the operation is not available
+                log.warning("%s, the journal is emptied" % e)
+                self.clear()
+                return None
+            log.info("%s, recorded as full copy" % e)
+            edit = ProfileReplace(name, before)
+        if edit is not None:
+            if state != state_before:
+                edit.state = (state_before, state)
+            self._done.append(edit)
+            self._undone = list()
+            while (len(self._done) > 1) and (self.nbytes > self.max_bytes):
+                log.debug("dropped %s" % self._done.popleft())
+            log.debug("recorded %s" % edit)
+            self._changed()
+        return edit
+
+    def record(self, name, ssp, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) and record its changes to the profile data as an operation
+
+        The optional 'rows' keyword is passed to begin().
+        """
+        self.begin(name, ssp, rows=kwargs.pop('rows', None))
+        result = fn(*args, **kwargs)
+        self.commit(ssp)
+        return result
+
+    def can_undo(self, ssp):
+        return (ssp is self.ssp) and (len(self._done) > 0)
+
+    def can_redo(self, ssp):
+        return (ssp is self.ssp) and (len(self._undone) > 0)
+
+    def undo(self, ssp):
+        """Revert the last operation, and return its edit (None, if nothing to undo)"""
+        if not self.can_undo(ssp):
+            return None
+        edit = self._done.pop()
+        edit.undo(ssp)
+        if edit.state is not None:
+            self._restore(edit.state[0])
+        self._undone.append(edit)
+        self._changed()
+        return edit
+
+    def redo(self, ssp):
+        """Re-apply the last reverted operation, and return its edit (None, if nothing to redo)"""
+        if not self.can_redo(ssp):
+            return None
+        edit = self._undone.pop()
+        edit.redo(ssp)
+        if edit.state is not None:
+            self._restore(edit.state[1])
+        self._done.append(edit)
+        self._changed()
+        return edit
@@ -0,0 +1,33 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import importlib
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class LazyModule(object):
+    """Proxy of a (heavy or optional) module, imported at the first access to one of its attributes"""
+
+    def __init__(self, name, package=None):
+        self._name = str(name)
+        self._package = str(package) if package else None
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.time()
+            self._module = importlib.import_module(self._name, self._package)
+            log.info("imported %s in %.2f s" % (self._module.__name__, time.time() - start))
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return "<lazy module %s%s>" % (self._name, "" if self._module is None else " (loaded)")
@@ -16,6 +16,14 @@ rcParams.update(
     }
 )
 
+import time
+import threading
+
+import numpy as np
+import matplotlib.patches
+import wx
+
+from hydroffice.ssp.ssp_dicts import Dicts
 from . import wxmpl  # local version of this module, since Pydro's one has an issue
 
 
@@ -59,12 +67,16 @@ class PlotsSettings(object):
 
     def __init__(self):
         self.plots = None
+        self.artists = None
+        self.scheduler = None
+        self.extents = ProfileExtents()
         self.canvas = None
         self.cid = None
         self.speed_axes = None
         self.temp_axes = None
         self.sal_axes = None
         self.sel_mode = self.sel_modes["Zoom"]
+        self.title = None
         self.has_zoom_applied = False
         self.display_flagged = True
         self.display_woa = True
@@ -78,3 +90,377 @@ class PlotsSettings(object):
         self.max_temp = None
         self.min_sal = None
         self.max_sal = None
+
+    def view_limits(self):
+        return (self.min_depth, self.max_depth, self.min_speed, self.max_speed,
+                self.min_temp, self.max_temp, self.min_sal, self.max_sal)
+
+
+def decimate_profile(depth, values, depth_range, n_bins):
+    """Depth-binned min/max decimation of a profile line
+
+    The visible depth range is split in 'n_bins' bins (usually, one per pixel row). For each run of consecutive
+    samples falling in the same bin, only the first, the last, the minimum and the maximum samples are kept
+    (so the rendered line looks the same). The samples just outside the depth range are kept to preserve the
+    line continuity at the borders (also where the cast leaves the range and comes back, as for the up/down
+    casts), while the other samples out of range are dropped.
+
+    Returns the indices of the retained samples (in the original order).
+    """
+    nr_samples = depth.size
+    if nr_samples <= 4 * n_bins:
+        return np.arange(nr_samples)
+
+    d_min, d_max = min(depth_range), max(depth_range)
+    inside = np.nonzero((depth >= d_min) & (depth <= d_max))[0]
+    if inside.size <= 4 * n_bins:
+        # just add the neighbours of the visible samples
+        keep = np.zeros(nr_samples, dtype=bool)
+        keep[inside] = True
+        keep[:-1] |= keep[1:].copy()
+        keep[1:] |= keep[:-1].copy()
+        return np.nonzero(keep)[0]
+
+    bins = ((depth[inside] - d_min) / (d_max - d_min) * n_bins).astype(np.int64)
+    np.clip(bins, 0, n_bins - 1, out=bins)
+
+    # a new run starts at each bin change or at each gap in the visible samples
+    starts = np.ones(inside.size, dtype=bool)
+    starts[1:] = (bins[1:] != bins[:-1]) | (inside[1:] != inside[:-1] + 1)
+    runs = np.cumsum(starts) - 1
+    ends = np.ones(inside.size, dtype=bool)
+    ends[:-1] = starts[1:]
+
+    # after sorting by run and value, the first/last entries of each run are its minimum/maximum
+    order = np.lexsort((values[inside], runs))
+    sorted_runs = runs[order]
+    run_mins = np.ones(inside.size, dtype=bool)
+    run_mins[1:] = sorted_runs[1:] != sorted_runs[:-1]
+    run_maxs = np.ones(inside.size, dtype=bool)
+    run_maxs[:-1] = run_mins[1:]
+
+    keep = np.concatenate((inside[starts], inside[ends], inside[order[run_mins]], inside[order[run_maxs]]))
+    # the neighbours just outside the visible range, at each gap in the visible samples
+    gaps = inside[1:] != inside[:-1] + 1
+    borders = np.concatenate((inside[np.r_[True, gaps]] - 1, inside[np.r_[gaps, True]] + 1))
+    borders = borders[(borders >= 0) & (borders < nr_samples)]
+    return np.unique(np.concatenate((keep, borders)))
+
+
+class ProfileExtents(object):
+    """Cache of the per-field extents of the plotted profiles
+
+    The extents are stored by role ('data', 'woa', 'reference', etc.), and recomputed only when the profile
+    or its data array are replaced, or when the role is explicitly invalidated after an in-place change.
+    """
+    fields = ['depth', 'speed', 'temperature', 'salinity']
+
+    def __init__(self):
+        self._cache = dict()
+
+    def invalidate(self, role=None):
+        """Invalidate a role (or all of them, if not passed)"""
+        if role is None:
+            self._cache = dict()
+        else:
+            self._cache.pop(role, None)
+
+    def get(self, role, ssp, good_only=False):
+        """Return a (2, n_fields) array with the minimum and the maximum of each field"""
+        entry = self._cache.get(role)
+        if (entry is None) or (entry['ssp'] is not ssp) or (entry['data'] is not ssp.data) \
+                or (entry['shape'] != ssp.data.shape):
+            entry = {
+                'ssp': ssp,
+                'data': ssp.data,
+                'shape': ssp.data.shape
+            }
+            self._cache[role] = entry
+
+        variant = 'good' if good_only else 'all'
+        if variant not in entry:
+            rows = ssp.data[[Dicts.idx[field] for field in self.fields], :]
+            if good_only:
+                rows = rows[:, ssp.data[Dicts.idx['flag'], :] == 0]
+            entry[variant] = self.calc(rows)
+        return entry[variant]
+
+    @classmethod
+    def calc(cls, rows):
+        if rows.shape[1] == 0:
+            return np.full((2, len(cls.fields)), np.nan)
+        return np.vstack((np.nanmin(rows, axis=1), np.nanmax(rows, axis=1)))
+
+    @classmethod
+    def from_values(cls, **kwargs):
+        """Build the extents of a set of single values (e.g., speed=1500.0); missing or None values are NaN"""
+        values = np.array([kwargs.get(field) if kwargs.get(field) is not None else np.nan
+                           for field in cls.fields], dtype=np.float64)
+        return np.vstack((values, values))
+
+    @classmethod
+    def combine(cls, extents):
+        """Merge a list of extents in a single (2, n_fields) array"""
+        stack = np.array(extents)
+        return np.vstack((np.nanmin(stack[:, 0, :], axis=0), np.nanmax(stack[:, 1, :], axis=0)))
+
+
+class PlotsArtists(object):
+    """Retained-mode model of the speed/temperature/salinity panels
+
+    The axes and all their artists are created once; the following updates only change
+    their data, visibility and limits, instead of clearing and rebuilding the whole figure.
+    """
+    fields = ['speed', 'temperature', 'salinity']
+    labels = {
+        'speed': 'Sound Speed [m/s]',
+        'temperature': 'Temp [deg C]',
+        'salinity': 'Sal [psu]'
+    }
+    band_widths = {
+        'speed': 2100,
+        'temperature': 200,
+        'salinity': 200
+    }
+    # artists that change while the user flags/inserts samples
+    editable = ['flagged', 'good', 'insert_above', 'insert_below', 'insert_point']
+    # line artists with (potentially) long profiles: they are decimated based on the current depth view (the
+    # artists with markers, as the flagged samples and the SIS cast, are not, since every sample is visible)
+    decimated = ['good', 'reference']
+
+    def __init__(self, figure, on_lod_changed=None):
+        self.figure = figure
+        self.axes = dict()
+        self.lines = dict()
+        self.bands = dict()
+        self.interactive = False
+        self.backgrounds = dict()
+        self.lod = None
+        self.on_lod_changed = on_lod_changed  # called when the decimated profiles have to be refreshed
+        self._setting_limits = False
+
+        speed_axes = None
+        for i, field in enumerate(self.fields):
+            axes = self.figure.add_subplot(131 + i, sharey=speed_axes)
+            if speed_axes is None:
+                speed_axes = axes
+                axes.invert_yaxis()
+                axes.set_ylabel('Depth [m]')
+            axes.grid()
+            axes.set_xlabel(self.labels[field])
+            self.axes[field] = axes
+
+            # the creation order is the drawing order
+            self._add_line('woa', field, 'm--')
+            self._add_line('woa_min', field, 'm--')
+            self._add_line('woa_max', field, 'm--')
+            self._add_line('reference', field, 'y', linewidth=3.0)
+            if field == 'speed':
+                self._add_line('sis', field, marker='o', markersize=2.5, markerfacecolor='#00FF00',
+                               fillstyle=u'full', linestyle='-', color='#33FF33')
+            self._add_line('flagged', field, 'r,')
+            self._add_line('good', field, 'b')
+            self._add_line('mean_depth', field, color='#663300')
+            if field == 'speed':
+                self._add_line('draft_speed', field, 'g--')
+                self._add_line('draft_depth', field, 'g--')
+                self._add_line('draft_point', field, 'g+', mew=1.6, ms=6)
+            else:
+                self._add_line('insert_above', field, 'c--')
+                self._add_line('insert_below', field, 'c--')
+                self._add_line('insert_point', field, 'c.')
+
+            band = matplotlib.patches.Rectangle((-100.0, 0.0), self.band_widths[field], 12000, edgecolor='k',
+                                                facecolor='#996633', label='_nolegend_', alpha=0.5)
+            band.set_visible(False)
+            axes.add_patch(band)
+            self.bands[field] = band
+
+        self.figure.canvas.mpl_connect('draw_event', self._on_draw)
+        # the decimated profiles follow the resizes of the canvas and the zooms of the depth axis
+        self.figure.canvas.mpl_connect('resize_event', self._on_view_changed)
+        self.speed_axes.callbacks.connect('ylim_changed', self._on_view_changed)
+
+    def _add_line(self, name, field, *args, **kwargs):
+        line = self.axes[field].plot([], [], *args, **kwargs)[0]
+        line.set_visible(False)
+        self.lines[(name, field)] = line
+
+    @property
+    def speed_axes(self):
+        return self.axes['speed']
+
+    @property
+    def temp_axes(self):
+        return self.axes['temperature']
+
+    @property
+    def sal_axes(self):
+        return self.axes['salinity']
+
+    def set_visible(self, flag):
+        """Show/hide the whole set of panels"""
+        for axes in self.axes.values():
+            axes.set_visible(flag)
+
+    def set_background(self, color):
+        for axes in self.axes.values():
+            axes.set_axis_bgcolor(color)
+
+    def set_line(self, name, field, x, y):
+        """Set the data of a line and make it visible
+
+        The long profiles are decimated to the resolution of the current depth view: the view limits have
+        to be set before the data.
+        """
+        if name in self.decimated:
+            idx = decimate_profile(np.asarray(y), np.asarray(x), self.speed_axes.get_ylim(), self.depth_pixels())
+            x, y = np.asarray(x)[idx], np.asarray(y)[idx]
+        line = self.lines[(name, field)]
+        line.set_data(x, y)
+        line.set_visible(True)
+
+    def hide_line(self, name, field=None):
+        """Hide a line, or the lines with the same name on all the panels if the field is not passed"""
+        fields = self.fields if field is None else [field]
+        for fld in fields:
+            line = self.lines.get((name, fld))
+            if line is not None:
+                line.set_visible(False)
+
+    def set_band(self, depth, alpha):
+        """Show the mean-depth band (and its top line) starting at the passed depth"""
+        for field in self.fields:
+            self.bands[field].set_y(depth)
+            self.bands[field].set_alpha(alpha)
+            self.bands[field].set_visible(True)
+            self.set_line('mean_depth', field, [-100.0, self.band_widths[field] - 100.0], [depth, depth])
+
+    def hide_band(self):
+        for field in self.fields:
+            self.bands[field].set_visible(False)
+        self.hide_line('mean_depth')
+
+    def set_limits(self, field, x_min, x_max):
+        self.axes[field].set_xlim(x_min, x_max)
+
+    def set_depth_limits(self, d_min, d_max):
+        # the y-axis is shared among the panels
+        self._setting_limits = True
+        try:
+            self.speed_axes.set_ylim(d_min, d_max)
+        finally:
+            self._setting_limits = False
+
+    def depth_pixels(self):
+        """Number of pixel rows of the depth axis"""
+        return max(int(self.speed_axes.bbox.height), 1)
+
+    def _current_lod(self):
+        return tuple(self.speed_axes.get_ylim()) + (self.depth_pixels(), )
+
+    def refine_lod(self):
+        """Return True if the depth view (or its pixel resolution) has changed since the last call, so that the
+        decimated profiles have to be refreshed"""
+        lod = self._current_lod()
+        if lod == self.lod:
+            return False
+        self.lod = lod
+        return True
+
+    def _on_view_changed(self, evt):
+        """Request the refresh of the decimated profiles after a resize or a zoom not done by the update"""
+        if self._setting_limits or (self.lod is None) or (self.on_lod_changed is None):
+            return
+        if self._current_lod() != self.lod:
+            self.on_lod_changed()
+
+    def set_title(self, title):
+        self.temp_axes.set_title(title)
+
+    # ### blitting ###
+
+    def _editable_lines(self, field):
+        return [line for (name, fld), line in self.lines.items() if (fld == field) and (name in self.editable)]
+
+    def set_interactive(self, flag):
+        """Enable/disable the blitting of the editable artists on top of a cached background"""
+        self.interactive = flag
+        self.backgrounds = dict()
+        for field in self.fields:
+            for line in self._editable_lines(field):
+                line.set_animated(flag)
+
+    def can_blit(self):
+        return self.interactive and (len(self.backgrounds) == len(self.fields))
+
+    def _on_draw(self, evt):
+        """After a full draw, cache the background of each axes and draw the (animated) editable artists"""
+        if not self.interactive:
+            return
+
+        canvas = self.figure.canvas
+        self.backgrounds = dict()
+        for field in self.fields:
+            axes = self.axes[field]
+            if not axes.get_visible():
+                continue
+            self.backgrounds[field] = canvas.copy_from_bbox(axes.bbox)
+            for line in self._editable_lines(field):
+                axes.draw_artist(line)
+
+    def blit(self):
+        """Restore the cached backgrounds and redraw only the editable artists"""
+        canvas = self.figure.canvas
+        for field in self.fields:
+            axes = self.axes[field]
+            canvas.restore_region(self.backgrounds[field])
+            for line in self._editable_lines(field):
+                axes.draw_artist(line)
+            canvas.blit(axes.bbox)
+
+
+class PlotsScheduler(object):
+    """Coalesce the plot redraw requests
+
+    The requests only mark some plot regions as dirty: the render callback is called on the GUI thread
+    with the set of dirty regions, at most once per frame, and never when nothing is dirty.
+    """
+    regions = ['woa', 'profile', 'depth', 'title']
+    edited = 'edited'  # only the artists changed by flagging/insertion (see PlotsArtists.editable)
+    frame_time = 1.0 / 25.0
+
+    def __init__(self, render):
+        self.render = render
+        self.dirty = set()
+        self.pending = False
+        self.last_render = 0.0
+        self.lock = threading.Lock()
+
+    def mark_dirty(self, *regions):
+        """Mark the passed regions (all of them, if not passed) as dirty and request a render
+
+        It can be called from any thread.
+        """
+        with self.lock:
+            self.dirty.update(regions or self.regions)
+            if self.pending:
+                return
+            self.pending = True
+        wx.CallAfter(self._flush)
+
+    def _flush(self):
+        wait = self.frame_time - (time.time() - self.last_render)
+        if wait > 0:
+            wx.CallLater(int(wait * 1000) + 1, self._flush)
+            return
+
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = set()
+            self.pending = False
+        if not dirty:
+            return
+
+        self.last_render = time.time()
+        self.render(dirty)
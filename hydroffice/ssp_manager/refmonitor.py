@@ -1,7 +1,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import logging
-import math
+import threading
 
 import numpy as np
 
@@ -18,6 +18,7 @@ import wx
 from . import wxmpl
 
 from . import refmonitor_ui
+from . import refraction
 from hydroffice.ssp.io import kmio
 from hydroffice.ssp.helper import SspError
 from hydroffice.ssp.ssp_dicts import Dicts
@@ -30,6 +31,10 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
         self.SetBackgroundColour(wx.WHITE)
 
         self.display_timer = None
+        self.ping_timer = None
+        # the candidate profile, and its version (increased at each in-place modification)
+        self.ssp = None
+        self.ssp_version = 0
         self.km_listener = km_listener
         if not isinstance(km_listener, kmio.KmIO):
             if not km_listener:
@@ -59,25 +64,36 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
 
         self.Layout()
 
-        self.ssp = None
+        self._sis_speed = None  # (ssp, num entries, HarmonicSpeed) of the SIS profile
+        self._ssp_speed = None  # (ssp, data, version, HarmonicSpeed) of the candidate profile
         self.ssp_corrected = 0
         self.ssp_corrector = 0
         self.ssp_equiv = 0
 
         self.pause = False
 
-        # init to hold 1000 beams
-        self.depth = np.zeros(1000)
-        self.across = np.zeros(1000)
-        self.angle = np.zeros(1000)
-        self.range = np.zeros(1000)
-        self.depth_corrected = np.zeros(1000)
-        self.across_corrected = np.zeros(1000)
-        self.depth_correction = np.zeros(1000)
-        self.across_correction = np.zeros(1000)
+        # valid beams of the last ping (and their corrections)
+        self.depth = np.zeros(0)
+        self.across = np.zeros(0)
+        self.depth_corrected = np.zeros(0)
+        self.across_corrected = np.zeros(0)
+        self.depth_correction = np.zeros(0)
+        self.across_correction = np.zeros(0)
 
         self.avg_depth = 0
 
+        # rolling window of the last pings, and the resulting per-angle statistics
+        # The window is fed by a poll of the listener (every 'ping_interval' seconds, independently of the
+        # redraws) that adds each new ping once. The listener only keeps the latest XYZ88, so at ping rates
+        # above the poll rate the window holds a sampling of the pings.
+        self.ping_interval = 0.2
+        self.pings = refraction.PingBuffer(size=10)
+        self._pings_lock = threading.Lock()  # the poll and the redraws run on different threads
+        self._last_ping = None  # (XYZ88 datagram, its time) of the last polled ping
+        self._ping = None  # (valid depths, valid across distances, transducer draft) of the last polled ping
+        self.window_stats = None
+        self.outer_correction = np.nan
+
     def pause_corrections(self):
         if not self.km_listener:
             return
@@ -96,8 +112,31 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
 
     def set_ssp(self, ssp):
         self.ssp = ssp
+        self.ssp_changed()
         self.update_plots()
 
+    def ssp_changed(self):
+        """To be called after any in-place modification of the candidate profile"""
+        self.ssp_version += 1
+
+    def sis_harmonic_speed(self):
+        """Return the (cached) harmonic mean speed integrator of the SIS profile"""
+        ssp = self.km_listener.ssp
+        if (self._sis_speed is None) or (self._sis_speed[0] is not ssp) \
+                or (self._sis_speed[1] != len(ssp.depth)):
+            self._sis_speed = (ssp, len(ssp.depth), refraction.HarmonicSpeed(ssp.depth, ssp.speed))
+        return self._sis_speed[2]
+
+    def ssp_harmonic_speed(self):
+        """Return the (cached) harmonic mean speed integrator of the candidate profile"""
+        if (self._ssp_speed is None) or (self._ssp_speed[0] is not self.ssp) \
+                or (self._ssp_speed[1] is not self.ssp.data) or (self._ssp_speed[2] != self.ssp_version):
+            good_pts = (self.ssp.data[Dicts.idx['flag'], :] == 0)
+            speed = refraction.HarmonicSpeed(self.ssp.data[Dicts.idx['depth'], good_pts],
+                                             self.ssp.data[Dicts.idx['speed'], good_pts])
+            self._ssp_speed = (self.ssp, self.ssp.data, self.ssp_version, speed)
+        return self._ssp_speed[3]
+
     def on_ssp_scroll(self, evt):
         self.ssp_corrector = float(self.SVCorrectorSlider.GetValue()) / 10.0
         self.update_plots()
@@ -120,12 +159,19 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
         if self.km_listener:
             if self.display_timer:
                 self.display_timer.stop()
+            if self.ping_timer:
+                self.ping_timer.stop()
         self.Hide()
 
     def OnShow(self):
         # since a thread cannot re-run, we create a thread each time
         self.display_timer = TimerThread(self.update, timing=3)
         self.display_timer.start()
+        if self.km_listener:
+            if self.ping_timer and self.ping_timer.is_alive():
+                self.ping_timer.stop()
+            self.ping_timer = TimerThread(self.poll_ping, timing=self.ping_interval)
+            self.ping_timer.start()
         self.Show()
 
     def OnExit(self):
@@ -133,11 +179,32 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
             if self.display_timer:
                 if self.display_timer.is_alive():
                     self.display_timer.stop()
+            if self.ping_timer:
+                if self.ping_timer.is_alive():
+                    self.ping_timer.stop()
         self.Destroy()  # Close the frame.
 
+    def poll_ping(self):
+        """Add the latest XYZ88 ping of the listener to the window, if not added yet"""
+        xyz88 = self.km_listener.xyz88
+        if xyz88 is None:
+            return
+        with self._pings_lock:
+            last_ping = self._last_ping
+            if (last_ping is not None) and (xyz88 is last_ping[0]) and (xyz88.dg_time == last_ping[1]):
+                return
+            self._last_ping = (xyz88, xyz88.dg_time)
+            depth, across = refraction.valid_beams(xyz88.depth, xyz88.across,
+                                                   xyz88.detection_information, xyz88.number_beams)
+            self._ping = (depth, across, xyz88.transducer_draft)
+            if depth.size > 0:
+                self.pings.append(depth, across, xyz88.dg_time)
+
     def update(self):
 
         string0 = "SSP equiv. %.1f, corr. %.1f" % (self.ssp_equiv, self.ssp_corrected)
+        if not np.isnan(self.outer_correction):
+            string0 += ", outer beams %+.2f m (%d pings)" % (self.outer_correction, self.pings.count)
 
         if self.km_listener.xyz88:
             string1 = "%s, " % (self.km_listener.xyz88.dg_time.strftime("%Y-%m-%d %H:%M:%S"))
@@ -162,71 +229,34 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
         if self.km_listener.xyz88 is None:
             log.info("missing XYZ88 datagram")
             return
-        num_beams = self.km_listener.xyz88.number_beams
-        temp_depth = self.km_listener.xyz88.depth.copy()
-        temp_across = self.km_listener.xyz88.across.copy()
-        temp_flags = self.km_listener.xyz88.detection_information.copy()
-        transducer_draft = self.km_listener.xyz88.transducer_draft
-        num_detections = self.km_listener.xyz88.number_detections
-        if self.depth.size < num_detections:
-            self.depth.resize(num_detections)
-            self.across.resize(num_detections)
-            self.angle.resize(num_detections)
-            self.range.resize(num_detections)
-            self.depth_corrected.resize(num_detections)
-            self.across_corrected.resize(num_detections)
-            self.depth_correction.resize(num_detections)
-            self.across_correction.resize(num_detections)
-        self.depth[:] = 0
-        self.across[:] = 0
-        self.angle[:] = 0
-        self.range[:] = 0
-        self.depth_corrected[:] = 0
-        self.across_corrected[:] = 0
-        self.depth_correction[:] = 0
-        self.across_correction[:] = 0
-
-        count = 0
-        for beam in range(num_beams):
-            if int(temp_flags[beam]) & 0x80 != 0:
-                # We skip beams without valid detections
-                continue
-
-            self.depth[count] = temp_depth[beam]
-            self.across[count] = temp_across[beam]
-            # Hmmmm, angle and range need to be uncorrected for S1Y and S1Z
-            self.angle[count] = math.atan(self.across[count] / self.depth[count])
-            self.range[count] = math.sqrt(self.depth[count] * self.depth[count] +
-                                          self.across[count] * self.across[count])
-            count += 1
-
-        self.avg_depth = np.mean(self.depth[0:num_detections])
+        self.poll_ping()  # the latest ping (a no-op if already polled)
+        with self._pings_lock:
+            self.depth, self.across, transducer_draft = self._ping
+        if self.depth.size == 0:
+            return
+        self.avg_depth = np.mean(self.depth)
 
         if self.avg_depth == 0:
             return
 
         # Do some plotting!
-        self.bathy_axes.plot(self.across[0:num_detections], self.depth[0:num_detections], 'r')
+        self.bathy_axes.plot(self.across, self.depth, 'r')
         self.bathy_axes.set_title("Compared Ping Bathymetry [m]")
         self.correction_axes.set_title("Resulting Bathymetric Corrections [m]")
         if not self.ssp or not self.km_listener.ssp or self.pause:
+            self.outer_correction = np.nan
             self.plots.draw()
             return
 
-        # Resample the sound speed profile into 1-m bins and then compute mean sound speed
-        # over the bins (since bin size is constant, mean sound speed is the harmonic sound speed)
-        num_bins = int(self.avg_depth)
-        depth_interp = np.linspace(transducer_draft, self.avg_depth + transducer_draft, num_bins)
+        # Harmonic mean sound speed over the water column, by travel-time integration of the (cached) profiles
+        z_top = transducer_draft
+        z_bottom = self.avg_depth + transducer_draft
 
         # Now get the equivalent SVP for the current profile being used to reduce the data
-        sv_interp = np.interp(depth_interp, self.km_listener.ssp.depth, self.km_listener.ssp.speed)
-        self.ssp_equiv = np.mean(sv_interp)
+        self.ssp_equiv = self.sis_harmonic_speed().mean_speed(z_top, z_bottom)
 
         # Now get the equivalent SVP for the proposed replacement profile
-        good_pts = (self.ssp.data[Dicts.idx['flag'], :] == 0)
-        sv_interp = np.interp(depth_interp, self.ssp.data[Dicts.idx['depth'], good_pts],
-                              self.ssp.data[Dicts.idx['speed'], good_pts])
-        sv_equiv2 = np.mean(sv_interp)
+        sv_equiv2 = self.ssp_harmonic_speed().mean_speed(z_top, z_bottom)
 
         # The proposed "corrected" SVP used the equivalent sv from the
         # candidate profile AND applies a user specified corrector term from
@@ -234,24 +264,25 @@ class RefMonitor(refmonitor_ui.RefMonitorBase):
         self.ssp_corrected = sv_equiv2 + self.ssp_corrector
         log.info("compare: original %6.1f, corrected %6.1f" % (self.ssp_equiv, self.ssp_corrected))
 
-        if int(self.ssp_equiv * 10.0) == int(self.ssp_corrected * 10.0):
-            for count in range(num_detections):
-                self.depth_corrected[count] = self.depth[count]
-                self.depth_correction[count] = 0.0
-                self.across_corrected[count] = self.across[count]
-                self.across_correction[count] = 0.0
-        else:
-            # Now do corrections
-            for count in range(num_detections):
-                angle_new = math.asin(math.sin(self.angle[count]) * self.ssp_corrected / self.ssp_equiv)
-                range_new = self.range[count] * self.ssp_corrected / self.ssp_equiv
-                self.depth_corrected[count] = range_new * math.cos(angle_new)
-                self.depth_correction[count] = self.depth_corrected[count] - self.depth[count]
-                self.across_corrected[count] = range_new * math.sin(angle_new)
-                self.across_correction[count] = self.across_corrected[count] - self.across[count]
+        self.depth_corrected, self.across_corrected = refraction.snell_correction(self.depth, self.across,
+                                                                                 self.ssp_equiv, self.ssp_corrected)
+        self.depth_correction = self.depth_corrected - self.depth
+        self.across_correction = self.across_corrected - self.across
+
+        # statistics of the corrections over the whole ping window
+        with self._pings_lock:  # copied, since the poll keeps adding pings
+            window_depth, window_across = [values.copy() for values in self.pings.data()]
+        self.window_stats = refraction.angle_bin_corrections(window_depth, window_across,
+                                                             self.ssp_equiv, self.ssp_corrected)
+        self.outer_correction = self.window_stats.outer_correction()
 
         self.bathy_axes.hold(True)
-        self.bathy_axes.plot(self.across_corrected[0:num_detections], self.depth_corrected[0:num_detections], 'g')
-        self.correction_axes.plot(self.across_corrected[0:num_detections], self.depth_correction[0:num_detections], 'b')
+        self.bathy_axes.plot(self.across_corrected, self.depth_corrected, 'g')
+        self.correction_axes.plot(self.across_corrected, self.depth_correction, 'b')
+        # window mean and inter-quartile range, plotted at the across distances of the mean depth
+        window_across = self.avg_depth * np.tan(np.radians(self.window_stats.centers))
+        self.correction_axes.plot(window_across, self.window_stats.mean, 'k')
+        self.correction_axes.plot(window_across, self.window_stats.low, 'k:')
+        self.correction_axes.plot(window_across, self.window_stats.high, 'k:')
 
         self.plots.draw()
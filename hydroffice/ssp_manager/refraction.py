@@ -0,0 +1,209 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def valid_beams(depth, across, detection_information, num_beams):
+    """Return the depths and the across-track distances of the beams with a valid detection"""
+    flags = np.asarray(detection_information[:num_beams]).astype(np.int64)
+    valid = (flags & 0x80) == 0  # the beams without valid detections have the bit 7 set
+    return np.asarray(depth[:num_beams], dtype=np.float64)[valid], \
+        np.asarray(across[:num_beams], dtype=np.float64)[valid]
+
+
+def beam_geometry(depth, across):
+    """Return the launch angles and the ranges of the passed beams"""
+    # Hmmmm, angle and range need to be uncorrected for S1Y and S1Z
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angle = np.arctan(across / depth)
+    return angle, np.hypot(depth, across)
+
+
+def snell_correction(depth, across, ssp_equiv, ssp_corrected):
+    """Return the depths and the across-track distances corrected for the ratio between the corrected and the
+    equivalent sound speeds
+
+    The beams with no solution (total reflection) are NaN.
+    """
+    if int(ssp_equiv * 10.0) == int(ssp_corrected * 10.0):
+        return depth.copy(), across.copy()
+
+    ratio = ssp_corrected / ssp_equiv
+    angle, rng = beam_geometry(depth, across)
+    with np.errstate(invalid='ignore'):
+        angle_new = np.arcsin(np.sin(angle) * ratio)
+    rng_new = rng * ratio
+    return rng_new * np.cos(angle_new), rng_new * np.sin(angle_new)
+
+
+class HarmonicSpeed(object):
+    """Harmonic mean sound speed of a profile, by cumulative travel-time integration
+
+    The sound speed is linearly interpolated between the samples, and kept constant beyond the profile ends
+    (like numpy.interp). Once built, the mean speed between any pair of depths costs O(log n).
+    """
+
+    def __init__(self, depth, speed):
+        depth = np.asarray(depth, dtype=np.float64)
+        speed = np.asarray(speed, dtype=np.float64)
+        order = np.argsort(depth, kind='mergesort')
+        self.depth = depth[order]
+        self.speed = speed[order]
+        if self.depth.size == 0:
+            raise ValueError("empty profile")
+
+        # one-way vertical travel time from the first sample to each sample
+        self.gradient = np.zeros(max(self.depth.size - 1, 0))
+        self.time = np.zeros(self.depth.size)
+        if self.depth.size > 1:
+            dz = np.diff(self.depth)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.gradient = np.where(dz > 0.0, np.diff(self.speed) / dz, 0.0)
+            self.time[1:] = np.cumsum(self._segment_time(self.speed[:-1], self.gradient, dz))
+
+    @classmethod
+    def _segment_time(cls, c0, gradient, dz):
+        """Travel time along 'dz' starting with speed 'c0' and with a constant speed gradient"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(np.abs(gradient) > 1e-9,
+                            np.log1p(gradient * dz / c0) / gradient,
+                            dz / c0)
+
+    def travel_time(self, z):
+        """One-way vertical travel time from the first sample to the passed depth(s)"""
+        z = np.asarray(z, dtype=np.float64)
+        if self.depth.size == 1:
+            return (z - self.depth[0]) / self.speed[0]
+
+        idx = np.clip(np.searchsorted(self.depth, z, side='right') - 1, 0, self.depth.size - 2)
+        dz = np.clip(z, self.depth[0], self.depth[-1]) - self.depth[idx]
+        t = self.time[idx] + self._segment_time(self.speed[idx], self.gradient[idx], dz)
+        # constant speed beyond the profile ends
+        t += (np.minimum(z, self.depth[0]) - self.depth[0]) / self.speed[0]
+        t += (np.maximum(z, self.depth[-1]) - self.depth[-1]) / self.speed[-1]
+        return t
+
+    def mean_speed(self, z_top, z_bottom):
+        """Harmonic mean sound speed between two depths"""
+        if z_bottom == z_top:
+            return float(np.interp(z_top, self.depth, self.speed))
+        return float((z_bottom - z_top) / (self.travel_time(z_bottom) - self.travel_time(z_top)))
+
+
+class PingBuffer(object):
+    """Fixed-size ring buffer with the valid beams of the last pings
+
+    The beams are stored in (pings, beams) arrays padded with NaN, so that the whole window can be processed
+    with array operations.
+    """
+
+    def __init__(self, size=10, max_beams=1000):
+        self.size = size
+        self.depth = np.full((size, max_beams), np.nan)
+        self.across = np.full((size, max_beams), np.nan)
+        self.times = [None] * size
+        self.head = 0  # the row for the next ping
+        self.count = 0
+
+    @property
+    def last_time(self):
+        if self.count == 0:
+            return None
+        return self.times[(self.head - 1) % self.size]
+
+    def clear(self):
+        self.depth[:] = np.nan
+        self.across[:] = np.nan
+        self.times = [None] * self.size
+        self.head = 0
+        self.count = 0
+
+    def append(self, depth, across, ping_time=None):
+        """Store a ping, unless it has the same time of the last stored one; return True if stored"""
+        if (ping_time is not None) and (ping_time == self.last_time):
+            return False
+
+        nr_beams = depth.size
+        if nr_beams > self.depth.shape[1]:
+            pad = np.full((self.size, nr_beams - self.depth.shape[1]), np.nan)
+            self.depth = np.hstack((self.depth, pad))
+            self.across = np.hstack((self.across, pad.copy()))
+
+        row = self.head
+        self.depth[row, :] = np.nan
+        self.across[row, :] = np.nan
+        self.depth[row, :nr_beams] = depth
+        self.across[row, :nr_beams] = across
+        self.times[row] = ping_time
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return True
+
+    def data(self):
+        """Return the depths and the across distances of the stored pings (in no particular order)"""
+        return self.depth[:self.count], self.across[:self.count]
+
+
+class AngleBinStats(object):
+    """Per across-track angle bin statistics of the depth corrections over a set of pings"""
+
+    def __init__(self, centers, counts, mean, low, high):
+        self.centers = centers  # bin centers [deg]
+        self.counts = counts
+        self.mean = mean
+        self.low = low
+        self.high = high
+
+    def outer_correction(self, min_angle=45.0):
+        """Mean depth correction of the beams with an angle (in absolute value) of at least 'min_angle'"""
+        outer = (np.abs(self.centers) >= min_angle) & (self.counts > 0)
+        if not np.any(outer):
+            return np.nan
+        return float(np.sum(self.mean[outer] * self.counts[outer]) / np.sum(self.counts[outer]))
+
+
+def angle_bin_corrections(depth, across, ssp_equiv, ssp_corrected, bin_size=5.0, percentiles=(25.0, 75.0)):
+    """Compute the mean and the percentiles of the depth corrections in angle bins
+
+    The passed arrays can have any shape (e.g., the (pings, beams) window of a PingBuffer); NaN are ignored.
+    """
+    angle, _ = beam_geometry(depth, across)
+    depth_corrected, _ = snell_correction(depth, across, ssp_equiv, ssp_corrected)
+    correction = (depth_corrected - depth).ravel()
+    angle = np.degrees(angle).ravel()
+
+    edges = np.arange(-90.0, 90.0 + bin_size, bin_size)
+    nr_bins = edges.size - 1
+    centers = edges[:-1] + bin_size / 2.0
+    valid = np.isfinite(correction) & np.isfinite(angle)
+    bins = np.clip(np.digitize(angle[valid], edges) - 1, 0, nr_bins - 1)
+    values = correction[valid]
+
+    counts = np.bincount(bins, minlength=nr_bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(bins, weights=values, minlength=nr_bins) / counts
+
+    # percentiles with linear interpolation, after sorting the values by bin and value
+    order = np.lexsort((values, bins))
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    stats = list()
+    for q in percentiles:
+        pos = starts + (q / 100.0) * np.maximum(counts - 1, 0)
+        below = np.floor(pos).astype(np.int64)
+        above = np.minimum(below + 1, starts + np.maximum(counts - 1, 0))
+        frac = pos - below
+        if sorted_values.size == 0:
+            stats.append(np.full(nr_bins, np.nan))
+            continue
+        below = np.clip(below, 0, sorted_values.size - 1)
+        above = np.clip(above, 0, sorted_values.size - 1)
+        value = sorted_values[below] * (1.0 - frac) + sorted_values[above] * frac
+        value[counts == 0] = np.nan
+        stats.append(value)
+
+    return AngleBinStats(centers=centers, counts=counts, mean=mean, low=stats[0], high=stats[1])
@@ -0,0 +1,76 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import copy
+import logging
+
+import numpy as np
+
+from hydroffice.ssp.ssp_dicts import Dicts
+
+log = logging.getLogger(__name__)
+
+
+def snapshot(ssp):
+    """Return a copy-on-write copy of a profile, sharing its NumPy arrays
+
+    The shared arrays become read-only on both sides, so that a missed own() raises an error instead of
+    silently modifying the other profile: each side calls own() right before its first in-place write.
+    The list and dict attributes (i.e., the metadata) are copied. The instance overrides of the methods
+    (e.g., the payload memoisation) are not copied.
+    """
+    if ssp is None:
+        return None
+
+    cow = copy.copy(ssp)
+    for name, value in vars(ssp).items():
+        if isinstance(value, np.ndarray):
+            if value.flags.writeable:
+                value = value.view()
+                value.flags.writeable = False
+                setattr(ssp, name, value)
+            setattr(cow, name, value)
+        elif isinstance(value, (list, dict)):
+            setattr(cow, name, copy.copy(value))
+        elif callable(value):
+            delattr(cow, name)
+    return cow
+
+
+def relocated(ssp, latitude, longitude, date_time):
+    """Return a copy-on-write copy of a profile, moved to the passed position and date time"""
+    cow = snapshot(ssp)
+    try:
+        cow.set_position(latitude, longitude)
+    except ValueError:  # the position is also written into the shared arrays
+        own(cow)
+        cow.set_position(latitude, longitude)
+    cow.date_time = date_time
+    return cow
+
+
+def own(ssp):
+    """Make writable (by copying them) the arrays that the profile shares with its snapshots
+
+    To be called right before any in-place modification of the profile arrays (a no-op once owned).
+    """
+    if ssp is None:
+        return
+    for name, value in vars(ssp).items():
+        if isinstance(value, np.ndarray) and not value.flags.writeable:
+            setattr(ssp, name, value.copy())
+
+
+def valid_data(ssp):
+    """Return the data of the unflagged samples
+
+    For a profile with read-only data (e.g., a snapshot), the result is computed once and then reused.
+    """
+    data = ssp.data
+    if data.flags.writeable:
+        return data[:, data[Dicts.idx['flag'], :] == 0]
+
+    cached = getattr(ssp, '_valid_data', None)
+    if (cached is None) or (cached[0] is not data):
+        cached = (data, data[:, data[Dicts.idx['flag'], :] == 0])
+        ssp._valid_data = cached
+    return cached[1]
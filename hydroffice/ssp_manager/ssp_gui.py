@@ -5,13 +5,18 @@ import logging
 
 log = logging.getLogger(__name__)
 
+from .timing import PhaseTimer
 from . import sspmanager
 
 
 def gui():
-    app = wx.App(False)
-    svp_editor = sspmanager.SSPManager()
-    app.SetTopWindow(svp_editor)
-    svp_editor.Show()
+    startup = PhaseTimer("SSP Manager startup")
+    with startup.phase("wx app"):
+        app = wx.App(False)
+    svp_editor = sspmanager.SSPManager(startup=startup)
+    with startup.phase("show"):
+        app.SetTopWindow(svp_editor)
+        svp_editor.Show()
+    # reported once the main loop is running (i.e., the main frame is actually usable)
+    wx.CallAfter(lambda: log.info(startup.report()))
     app.MainLoop()
-
@@ -5,7 +5,6 @@ import socket
 import datetime as dt
 import threading
 import time
-import copy
 import numpy as np
 import matplotlib.patches
 import wx
@@ -17,13 +16,15 @@ log = logging.getLogger(__name__)
 
 from hydroffice.base.helper import HyOError
 from hydroffice.base.timerthread import TimerThread
-from hydroffice.base.gdal_aux import GdalAux
-from .plots import WxPlots, PlotsSettings
+from .plots import WxPlots, PlotsSettings, PlotsArtists, PlotsScheduler, ProfileExtents
+from .clients import SisProber, CastSender, PayloadCache
+from .atlases import AtlasQueries, LazyAtlas, Woa09Cache, RtofsCache
+from .timing import PhaseTimer
+from .lazyimport import LazyModule
+from .context import CastContext
+from .journal import EditJournal
+from .snapshot import snapshot, own, valid_data
 from . import sspmanager_ui
-from . import refmonitor
-from . import geomonitor
-from . import settingsviewer
-from . import userinputsviewer
 from . import __version__
 from . import __license__
 from hydroffice.ssp import project
@@ -33,7 +34,17 @@ from hydroffice.ssp.ssp_dicts import Dicts
 from hydroffice.ssp.ssp_collection import SspCollection
 from hydroffice.ssp.helper import Helper, SspError
 from hydroffice.ssp.atlases.woa09checker import Woa09Checker
-from hydroffice.ssp_settings import ssp_settings
+
+# heavy or optional subsystems, only imported at their first use (e.g., the geo monitor imports Basemap)
+refmonitor = LazyModule('.refmonitor', __package__)
+geomonitor = LazyModule('.geomonitor', __package__)
+settingsviewer = LazyModule('.settingsviewer', __package__)
+userinputsviewer = LazyModule('.userinputsviewer', __package__)
+gdal_aux = LazyModule('hydroffice.base.gdal_aux')
+ssp_settings = LazyModule('hydroffice.ssp_settings.ssp_settings')
+batch = LazyModule('.batch', __package__)
+watcher = LazyModule('.watcher', __package__)
+woa09atlas = LazyModule('hydroffice.ssp.atlases.woa09atlas')
 
 
 class SSPManager(sspmanager_ui.SSPManagerBase):
@@ -45,13 +56,95 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         "SERVER": 2
     }
 
-    def __init__(self):
-        sspmanager_ui.SSPManagerBase.__init__(self, None, -1, "")
+    def __init__(self, startup=None):
+        # the durations of the startup phases are collected for the startup report
+        self.startup = startup if startup is not None else PhaseTimer("SSP Manager startup")
+        with self.startup.phase("main frame"):
+            sspmanager_ui.SSPManagerBase.__init__(self, None, -1, "")
 
         self.version = __version__
         self.license = __license__
 
-        # take care of WOA09 atlas
+        with self.startup.phase("WOA09 atlas check"):
+            with_woa09 = self.check_woa09_atlas()
+
+        with_rtofs = True
+
+        # The large WOA09 atlas is only loaded at its first query, while the RTOFS atlas (that requires
+        # an internet connection) is loaded in background once the startup is completed
+        with self.startup.phase("project and listeners"):
+            self.prj = project.Project(with_listeners=True, with_woa09=False, with_rtofs=False)
+        if with_woa09:
+            # the flag is set only once the atlas is actually loaded (see _on_woa09_atlas_loaded)
+            self.prj.woa09_atlas = LazyAtlas(self.load_woa09_atlas, "WOA09", empty=(None, None, None),
+                                             on_load=lambda atlas: wx.CallAfter(self._on_woa09_atlas_loaded, atlas))
+        if with_rtofs:
+            # the flag is set only once the atlas is actually loaded (see _on_rtofs_atlas_loaded)
+            self.prj.rtofs_atlas = LazyAtlas(self.load_rtofs_atlas, "RTOFS",
+                                             on_load=lambda atlas: wx.CallAfter(self._on_rtofs_atlas_loaded, atlas))
+        # position and date of the loaded and queried casts from SIS navigation, or the position last entered by
+        # the user (for an hour): the dialogs are shown only when none is available
+        self.cast_context = CastContext(self.prj.km_listener, max_cast_age=3600.0)
+        self.cast_sources = list()  # sources of the resolved cast positions and dates, shown to the user
+        # cast requests to the SIS clients off the GUI thread, last answering first
+        self.sis_prober = SisProber(self.prj, dispatch=wx.CallAfter)
+        self.cast_sender = CastSender(self.prj, dispatch=wx.CallAfter)  # cast transmission off the GUI thread
+        self.payloads = PayloadCache()  # encode-once datagrams for transmission, log and export
+        # undo/redo of the edits of the current profile (and of the applied surface sound speed), each change
+        # invalidating the encoded datagrams
+        self.journal = EditJournal(max_depth=200, max_bytes=32 * 1024 * 1024, owner=self.prj,
+                                   attributes=('surface_speed_applied', 'ssp_applied_depth'),
+                                   on_change=self.payloads.invalidate)
+        self.atlas_queries = AtlasQueries(dispatch=wx.CallAfter)  # atlas lookups off the GUI thread
+        self.atlas_query = None  # the running atlas query (if any)
+        self.woa09_cache = Woa09Cache(self.prj.woa09_atlas)  # WOA09 casts by grid cell and month
+        # RTOFS casts stored on disk by forecast date and grid node (to limit the network usage at sea)
+        self.rtofs_cache = RtofsCache(self.prj.rtofs_atlas, os.path.join(Woa09Checker.get_atlases_folder(), "rtofs"))
+        self.rtofs_prefetch_margin = 0.25  # [deg] around the current position (one cast per RTOFS grid node)
+        self.pipeline = None  # the processing steps (created at the first use)
+        self.watcher = None  # new casts from the drop folders (created with the first watched folder)
+        self.watch_pipeline = None
+
+        # check listeners
+        if not self.prj.has_running_listeners():
+            msg = 'Kongsberg and/or Sippican and/or MVP network I/O cannot bind to ports.\n' \
+                  'Is there another instance of SSP Manager running already?'
+            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+
+        self.status_message = ""
+
+        # UI (the monitors and the viewers are created at their first use)
+        self.p = PlotsSettings()
+        self.ref_monitor = None
+        self.geo_monitor = None
+        self.settings_viewer = None
+        self.settings_tool = None
+        self.inputs_viewer = None
+        with self.startup.phase("user interface"):
+            self.init_ui()
+
+        with self.startup.phase("state and timers"):
+            # update state
+            self.state = None
+            self._update_state(self.gui_state["CLOSED"])
+
+            # GUI timers (status bar and plots)
+            self.status_timer = TimerThread(self._update_status, timing=2)
+            self.status_timer.start()
+            self.plot_timer = TimerThread(self._check_plot_title, timing=10)
+            self.plot_timer.start()
+
+        self.SetMinSize(wx.Size(500, 300))
+        self.SetSize(wx.Size(1000, 550))
+
+        if with_rtofs:
+            self.atlas_queries.submit(self.prj.rtofs_atlas.load)
+
+    @staticmethod
+    def check_woa09_atlas():
+        """Check the presence of the WOA09 atlas (offering its download, if missing)"""
         if not Woa09Checker.is_present():
             dial = wx.MessageDialog(None, 'The WOA09 atlas (used by some advanced SSP functions)\n'
                                           'was not found!\n\n'
@@ -83,58 +176,59 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         else:
             with_woa09 = True
 
-        with_rtofs = True
-
-        # We load WOA09 atlas and attempt the RTOFS atlas (since it requires internet connection)
-        self.prj = project.Project(with_listeners=True, with_woa09=with_woa09, with_rtofs=with_rtofs)
-
-        # check listeners
-        if not self.prj.has_running_listeners():
-            msg = 'Kongsberg and/or Sippican and/or MVP network I/O cannot bind to ports.\n' \
-                  'Is there another instance of SSP Manager running already?'
-            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-            dlg.ShowModal()
-            dlg.Destroy()
-
-        # check woa09 atlas
-        if (not self.prj.woa09_atlas_loaded) and with_woa09:
-            msg = 'Unable to load World Ocean Atlas grid file'
-            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-            dlg.ShowModal()
-            dlg.Destroy()
-
-        # check rtofs atlas
-        if (not self.prj.rtofs_atlas_loaded) and with_rtofs:
-            msg = 'Unable to load RTOFS atlas.\n' \
-                  'To use RTOFS, Internet connectivity is required (with port 9090 open).\n' \
-                  'RTOFS queries disabled.'
-            dlg = wx.MessageDialog(None, msg, "Warning", wx.OK | wx.ICON_WARNING)
-            dlg.ShowModal()
-            dlg.Destroy()
+        return with_woa09
+
+    @staticmethod
+    def load_woa09_atlas():
+        """Load the WOA09 atlas grids (used at the first WOA09 query)"""
+        atlas = woa09atlas.Woa09Atlas()
+        if not atlas.load_grids():
+            log.info("unable to load World Ocean Atlas grid file")
+            return None
+        return atlas
+
+    @staticmethod
+    def load_rtofs_atlas():
+        """Load the RTOFS atlas through a listener-less project (requires an internet connection)"""
+        prj = project.Project(with_listeners=False, with_woa09=False, with_rtofs=True)
+        if not prj.rtofs_atlas_loaded:
+            return None
+        return prj.rtofs_atlas
+
+    def _on_woa09_atlas_loaded(self, atlas):
+        if atlas is not None:
+            self.prj.woa09_atlas_loaded = True
+            return
 
-        self.status_message = ""
+        self.prj.woa09_atlas_loaded = False
+        msg = 'Unable to load World Ocean Atlas grid file'
+        dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+        dlg.ShowModal()
+        dlg.Destroy()
 
-        # UI
-        self.p = PlotsSettings()
-        self.ref_monitor = None
-        self.geo_monitor = None
-        self.settings_viewer = None
-        self.settings_tool = None
-        self.inputs_viewer = None
-        self.init_ui()
+    def _woa09_available(self):
+        return self._get_pipeline().woa09_available()
 
-        # update state
-        self.state = None
-        self._update_state(self.gui_state["CLOSED"])
+    def _get_pipeline(self):
+        """Create (at the first use) the processing steps of the main project, shared with the batch processing"""
+        if self.pipeline is None:
+            config = batch.BatchConfig(export_formats=[], store_db=False)
+            self.pipeline = batch.CastPipeline(self.prj, config, context=self.cast_context,
+                                               rtofs_cache=self.rtofs_cache)
+        return self.pipeline
 
-        # GUI timers (status bar and plots)
-        self.status_timer = TimerThread(self._update_status, timing=2)
-        self.status_timer.start()
-        self.plot_timer = TimerThread(self._update_plot, timing=30)
-        self.plot_timer.start()
+    def _on_rtofs_atlas_loaded(self, atlas):
+        if atlas is not None:
+            self.prj.rtofs_atlas_loaded = True
+            return
 
-        self.SetMinSize(wx.Size(500, 300))
-        self.SetSize(wx.Size(1000, 550))
+        self.prj.rtofs_atlas_loaded = False
+        msg = 'Unable to load RTOFS atlas.\n' \
+              'To use RTOFS, Internet connectivity is required (with port 9090 open).\n' \
+              'RTOFS queries disabled.'
+        dlg = wx.MessageDialog(None, msg, "Warning", wx.OK | wx.ICON_WARNING)
+        dlg.ShowModal()
+        dlg.Destroy()
 
     def init_ui(self):
         favicon = wx.Icon(os.path.join(self.here, 'media', 'favicon.png'), wx.BITMAP_TYPE_PNG, 32, 32)
@@ -155,6 +249,14 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.p.plots = WxPlots(self)
         self.p.plots.callback_right_click_down = self.on_context
 
+        # the plot axes and artists are created once, then only updated
+        self.p.artists = PlotsArtists(self.p.plots.get_figure(), on_lod_changed=lambda: self._update_plot('profile'))
+        self.p.artists.set_visible(False)
+        self.p.speed_axes = self.p.artists.speed_axes
+        self.p.temp_axes = self.p.artists.temp_axes
+        self.p.sal_axes = self.p.artists.sal_axes
+        self.p.scheduler = PlotsScheduler(self._render_plot)
+
         # expand the panel to fit the whole app
         self.GetSizer().Add(self.p.plots, 1, wx.EXPAND)
         self.GetSizer().Fit(self)
@@ -164,11 +266,21 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         wxmpl.EVT_SELECTION(self, self.p.plots.GetId(), self._on_area_selected)
         wxmpl.EVT_POINT(self, self.p.plots.GetId(), self._on_point_selected)
 
-        # Other graphical panels are instantiated and are only shown when requested
-        self.ref_monitor = refmonitor.RefMonitor(self.prj.km_listener)
-        self.geo_monitor = geomonitor.GeoMonitor(self.prj.km_listener)
-        self.settings_viewer = settingsviewer.SettingsViewer(self.prj.s)
-        self.inputs_viewer = userinputsviewer.UserInputsViewer(parent=self, ssp_user_inputs=self.prj.u)
+    def _get_ref_monitor(self):
+        """Return the refraction monitor, creating it at the first use"""
+        if self.ref_monitor is None:
+            start = time.time()
+            self.ref_monitor = refmonitor.RefMonitor(self.prj.km_listener)
+            log.info("refraction monitor created in %.2f s" % (time.time() - start))
+        return self.ref_monitor
+
+    def _get_geo_monitor(self):
+        """Return the geo monitor, creating it at the first use (it builds a Basemap)"""
+        if self.geo_monitor is None:
+            start = time.time()
+            self.geo_monitor = geomonitor.GeoMonitor(self.prj.km_listener)
+            log.info("geo monitor created in %.2f s" % (time.time() - start))
+        return self.geo_monitor
 
     def on_context(self, event):
         """ Create and show a Context Menu """
@@ -311,6 +423,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         dlg.Destroy()
         filename = os.path.join(import_directory, import_file)
 
+        self.cast_sources = list()
         try:
             self.prj.open_file_format(filename, input_format, self.get_date, self.get_position)
         except SspError as e:
@@ -326,12 +439,16 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         self._update_state(self.gui_state['OPEN'])
         self._update_plot()
-        self.status_message = "Loaded %s" % self.prj.filename
+        self.status_message = "Loaded %s%s" % (self.prj.filename, self._cast_sources_note())
+
+        # the WOA09 casts are missing when the atlas was not loaded yet at the import
+        if self.prj.ssp_woa is None:
+            self._query_woa09_casts()
 
     # Query
 
     def on_file_query_woa09(self, evt):
-        if not self.prj.woa09_atlas_loaded:
+        if not self._woa09_available():
             msg = "Functionality disabled: Failed on WOA2009 grid load"
             dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
             dlg.ShowModal()
@@ -345,6 +462,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         msg = "User requested WOA09 synthetic cast"
         log.info(msg)
 
+        self.cast_sources = list()
         latitude, longitude = self.get_position()
         if (latitude is None) or (longitude is None):
             log.info("not a valid position")
@@ -357,24 +475,33 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             return
         log.info("using date time: %s" % query_date)
 
-        try:
-            woa_data, woa_min, woa_max = self.prj.woa09_atlas.query(latitude, longitude, query_date)
-            if woa_data is None:
-                log.info("unable to retrieve data")
+        def on_result(atlas_query):
+            try:
+                woa_data, woa_min, woa_max = atlas_query.result()
+                if woa_data is None:
+                    log.info("unable to retrieve data")
+                    return
+
+            except SspError:
+                msg = "Failed on WOA09 lookup"
+                dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+                dlg.ShowModal()
+                dlg.Destroy()
                 return
 
-        except SspError:
-            msg = "Failed on WOA09 lookup"
-            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-            dlg.ShowModal()
-            dlg.Destroy()
-            return
+            self._woa09_cast_loaded(woa_data, woa_min, woa_max)
+            log.info("Synthetic WOA09 cast using pos: (%.6f, %.6f) and time: %s"
+                     % (latitude, longitude, query_date))
+
+        self._query_atlas("Querying WOA09 atlas", on_result, self.woa09_cache.query,
+                          latitude, longitude, query_date)
 
+    def _woa09_cast_loaded(self, woa_data, woa_min, woa_max):
         log.info("got WOA SSP:\n%s" % woa_data)
         self.prj.ssp_woa = woa_data
         self.prj.ssp_woa_min = woa_min
         self.prj.ssp_woa_max = woa_max
-        self.prj.ssp_data = copy.deepcopy(woa_data)
+        self.prj.ssp_data = snapshot(woa_data)  # its arrays are copied at the first edit
 
         self.prj.filename = "%s_WOA09" % (self.prj.ssp_woa.date_time.strftime("%Y%m%d_%H%M%S"))
         self.prj.u.filename_prefix = os.path.splitext(self.prj.filename)[0]
@@ -385,12 +512,10 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self._update_plot()
         self._update_state(self.gui_state['OPEN'])
 
-        self.status_message = "Synthetic WOA09 cast"
-        log.info("Synthetic WOA09 cast using pos: (%.6f, %.6f) and time: %s"
-                 % (latitude, longitude, query_date))
+        self.status_message = "Synthetic WOA09 cast%s" % self._cast_sources_note()
 
     def on_file_query_rtofs(self, evt):
-        if not self.prj.rtofs_atlas_loaded:
+        if not self._rtofs_available():
             msg = "Functionality disabled: Failed on RTOFS grid load"
             dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
             dlg.ShowModal()
@@ -404,6 +529,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         msg = "User requested RTOFS synthetic cast"
         log.info(msg)
 
+        self.cast_sources = list()
         latitude, longitude = self.get_position()
         if (latitude is None) or (longitude is None):
             log.info("not a valid position")
@@ -416,31 +542,42 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             return
         log.info("using date time: %s" % query_date)
 
-        try:
-            temp_ssp = self.prj.rtofs_atlas.query(latitude, longitude, query_date)
-            if temp_ssp is None:
-                log.info("empty result from RTOFS query")
-                return
+        def rtofs_query():
+            rtofs_ssp = self.rtofs_cache.query(latitude, longitude, query_date)
+            woa = None, None, None
+            if rtofs_ssp is not None:
+                try:
+                    woa = self.woa09_cache.query(latitude, longitude, query_date)
+                    if woa[0] is None:
+                        log.info("failure in performing WOA09 lookup")
 
-        except SspError:
-            msg = "Failed on RTOFS lookup"
-            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-            dlg.ShowModal()
-            dlg.Destroy()
-            return
+                except HyOError:
+                    log.info("failure in performing WOA09 lookup")
+            return rtofs_ssp, woa
 
-        self.prj.ssp_data = temp_ssp
+        def on_result(atlas_query):
+            try:
+                temp_ssp, woa = atlas_query.result()
+                if temp_ssp is None:
+                    log.info("empty result from RTOFS query")
+                    return
 
-        try:
-            self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = self.prj.woa09_atlas.query(latitude,
-                                                                                                      longitude,
-                                                                                                      query_date)
-            if self.prj.ssp_woa is None:
-                log.info("failure in performing WOA09 lookup")
+            except SspError:
+                msg = "Failed on RTOFS lookup"
+                dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+                dlg.ShowModal()
+                dlg.Destroy()
+                return
 
-        except HyOError:
-            log.info("failure in performing WOA09 lookup")
+            self.prj.ssp_data = temp_ssp
+            self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = woa
+            self._rtofs_cast_loaded()
+            log.info("Synthetic RTOFS cast using pos: (%.6f, %.6f) and time: %s"
+                     % (latitude, longitude, query_date))
 
+        self._query_atlas("Querying RTOFS atlas", on_result, rtofs_query)
+
+    def _rtofs_cast_loaded(self):
         self.prj.filename = "%s_RTOFS" % (self.prj.ssp_data.date_time.strftime("%Y%m%d_%H%M%S"))
         self.prj.u.filename_prefix = os.path.splitext(self.prj.filename)[0]
         self.prj.has_ssp_loaded = True
@@ -450,9 +587,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self._update_plot()
         self._update_state(self.gui_state['OPEN'])
 
-        self.status_message = "Synthetic RTOFS cast"
-        log.info("Synthetic RTOFS cast using pos: (%.6f, %.6f) and time: %s"
-                 % (latitude, longitude, query_date))
+        self.status_message = "Synthetic RTOFS cast%s" % self._cast_sources_note()
 
     def on_file_query_sis(self, evt):
         log.info("requesting profile from SIS")
@@ -462,13 +597,25 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             self.clear_app()
 
         # Need to request the current SVP cast from the clients prior.  Take the first one that comes through.
-        self.prj.km_listener.ssp = None
-        for client in range(self.prj.s.client_list.num_clients):
-            log.info("testing client %s" % self.prj.s.client_list.clients[client].IP)
-            self.prj.ssp_recipient_ip = self.prj.s.client_list.clients[client].IP
-            self.prj.get_cast_from_sis()
-            if self.prj.km_listener.ssp:
-                break
+        self._probe_sis("Requesting the current cast from SIS", self._on_sis_cast_probed)
+
+    def _probe_sis(self, description, on_probed):
+        """Request the current cast to the SIS clients in background, then call 'on_probed' (on the GUI thread)
+
+        The clients are requested one at a time, since they share the listener (see SisProber).
+        """
+        if self.sis_prober.busy:
+            self.status_message = "Another SIS cast request is running"
+            log.info("another SIS cast request is running: %s skipped" % description)
+            return
+
+        self.status_message = "%s ..." % description
+        self.sis_prober.start(lambda ip: on_probed())
+
+    def _on_sis_cast_probed(self):
+        if self.prj.has_ssp_loaded:
+            log.info("a profile was loaded during the SIS cast request: SIS cast dropped")
+            return
 
         if not self.prj.km_listener.ssp:
             msg = "Unable to get SIS cast from any clients"
@@ -479,6 +626,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         log.info("got SSP from SIS: %s" % self.prj.km_listener.ssp)
 
+        self.cast_sources = list()
         latitude, longitude = self.get_position()
         if (latitude is None) or (longitude is None):
             log.info("not a valid position")
@@ -491,21 +639,16 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.filename = "%s_SIS" % (self.prj.ssp_data.date_time.strftime("%Y%m%d_%H%M%S"))
         self.prj.u.filename_prefix = os.path.splitext(self.prj.filename)[0]
 
-        self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = \
-            self.prj.woa09_atlas.query(latitude, longitude, self.prj.ssp_data.date_time)
-
-        if self.prj.ssp_woa is not None:
-            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
-
         self.prj.has_ssp_loaded = True
         self.prj.surface_speed_applied = False
         self.prj.ssp_applied_depth = 0
 
         self._update_plot()
         self._update_state(self.gui_state['OPEN'])
-        self.status_message = "Retrieved SIS current cast, user chose %.2f %.2f for position, cast date is %s" % (
-            latitude, longitude, self.prj.ssp_data.date_time)
+        self.status_message = "Retrieved SIS current cast at %.2f %.2f, cast date is %s%s" % (
+            latitude, longitude, self.prj.ssp_data.date_time, self._cast_sources_note())
+
+        self._query_woa09_casts(with_temp_and_sal=True)
 
     # Export
 
@@ -565,11 +708,119 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             self.prj.u.user_filename_prefix = os.path.splitext(filename)[0]
 
         # actually do the export
+        own(self.prj.ssp_data)
         self.prj.formats_export("USER")
 
         # open export folder
         Helper.explore_folder(self.prj.u.user_export_directory)
 
+    # Drop folders
+
+    def _get_watcher(self):
+        """Create (at the first use) the watcher of the drop folders, with its own processing project"""
+        if self.watcher is None:
+            # the project shares the atlases (and the RTOFS cache) of the main project, and does not export or
+            # store the casts
+            prj = project.Project(with_listeners=False, with_woa09=False, with_rtofs=False)
+            prj.woa09_atlas = self.prj.woa09_atlas
+            prj.rtofs_atlas = self.prj.rtofs_atlas
+            config = batch.BatchConfig(export_formats=[], store_db=False)
+            self.watch_pipeline = batch.CastPipeline(prj, config, context=self.cast_context,
+                                                     rtofs_cache=self.rtofs_cache)
+            self.watcher = watcher.DropFolderWatcher(self._process_dropped_cast, on_staged=self._on_cast_staged,
+                                                     on_failed=self._on_cast_failed, dispatch=wx.CallAfter)
+        return self.watcher
+
+    def _process_dropped_cast(self, filename, input_format):
+        """Import and process a dropped cast (in the watcher thread), and return the project state to stage"""
+        prj = self.watch_pipeline.prj
+
+        # the atlases of the main project are loaded in the meanwhile, so their state is read at each cast
+        woa09_atlas = self.prj.woa09_atlas
+        if isinstance(woa09_atlas, LazyAtlas):
+            prj.woa09_atlas_loaded = woa09_atlas.load() is not None  # loaded here, if not yet
+        else:
+            prj.woa09_atlas_loaded = self.prj.woa09_atlas_loaded
+        prj.rtofs_atlas_loaded = self.prj.rtofs_atlas_loaded
+
+        self.watch_pipeline.process(filename, input_format)
+        return {
+            "ssp_data": prj.ssp_data,
+            "ssp_woa": prj.ssp_woa,
+            "ssp_woa_min": prj.ssp_woa_min,
+            "ssp_woa_max": prj.ssp_woa_max,
+            "filename": prj.filename
+        }
+
+    def _on_cast_staged(self, filename):
+        count = self.watcher.staged_count()
+        log.info("staged cast %s (%d ready)" % (filename, count))
+        if (not self.prj.has_ssp_loaded) and (self.state != self.gui_state["SERVER"]):
+            self._open_staged_cast()
+            return
+        self.status_message = "Staged %s (%d ready)" % (os.path.basename(filename), count)
+
+    def _on_cast_failed(self, filename, error):
+        self.status_message = "Failure in processing %s" % os.path.basename(filename)
+
+    def _open_staged_cast(self):
+        staged = self.watcher.next_staged() if self.watcher else None
+        if staged is None:
+            msg = "No staged casts from the drop folders"
+            dlg = wx.MessageDialog(None, msg, "Drop folders", wx.OK | wx.ICON_INFORMATION)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+        filename, cast = staged
+
+        if self.prj.has_ssp_loaded:
+            self.prj.clean_project()
+            self.clear_app()
+
+        self.prj.ssp_data = cast["ssp_data"]
+        self.prj.ssp_woa = cast["ssp_woa"]
+        self.prj.ssp_woa_min = cast["ssp_woa_min"]
+        self.prj.ssp_woa_max = cast["ssp_woa_max"]
+        self.prj.filename = cast["filename"]
+        self.prj.u.filename_prefix = os.path.splitext(os.path.basename(self.prj.filename))[0]
+        self.prj.has_ssp_loaded = True
+        self.prj.surface_speed_applied = False
+        self.prj.ssp_applied_depth = 0
+
+        # set the new SSP for the refraction monitor
+        if self.ref_monitor:
+            self.ref_monitor.set_ssp(self.prj.ssp_data)
+            self.ref_monitor.set_corrector(0)
+
+        self._update_state(self.gui_state['OPEN'])
+        self._update_plot()
+        self.status_message = "Loaded staged %s (%d ready)" % (os.path.basename(filename),
+                                                               self.watcher.staged_count())
+
+    def on_file_watch_add(self, evt):
+        dlg = wx.DirDialog(self, "Select a drop folder to watch", style=wx.DD_DEFAULT_STYLE | wx.DD_DIR_MUST_EXIST)
+        if dlg.ShowModal() != wx.ID_OK:
+            dlg.Destroy()
+            return
+        folder = dlg.GetPath()
+        dlg.Destroy()
+
+        cast_watcher = self._get_watcher()
+        cast_watcher.add_folder(folder)
+        cast_watcher.start()
+        self.status_message = "Watching %d drop folders" % len(cast_watcher.folders)
+
+    def on_file_watch_open(self, evt):
+        self._open_staged_cast()
+
+    def on_file_watch_stop(self, evt):
+        if self.watcher is None:
+            return
+        # the watcher is kept, so that the files not yet processed are found again at the next start
+        self.watcher.stop()
+        log.info("stopped watching the drop folders")
+        self.status_message = "Stopped watching the drop folders"
+
     # clear
 
     def on_file_clear(self, evt):
@@ -620,6 +871,13 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             if self.plot_timer.is_alive():
                 self.plot_timer.stop()
 
+        if self.atlas_query:
+            self.atlas_query.cancel()
+        self.atlas_queries.shutdown()
+        if self.watcher:
+            log.info("stopping drop folders watcher")
+            self.watcher.stop()
+
         self.prj.release()
         time.sleep(2)  # to be sure that all the threads stop
 
@@ -651,116 +909,34 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         if self.p.has_zoom_applied or (not self.prj.has_ssp_loaded):
             return
 
-        good_pts = (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
-        if self.p.display_flagged:
-            good_pts[:] = True
-
-        self.p.min_speed = min(self.prj.ssp_data.data[Dicts.idx['speed'], good_pts])
-        self.p.max_speed = max(self.prj.ssp_data.data[Dicts.idx['speed'], good_pts])
-        self.p.min_temp = min(self.prj.ssp_data.data[Dicts.idx['temperature'], good_pts])
-        self.p.max_temp = max(self.prj.ssp_data.data[Dicts.idx['temperature'], good_pts])
-        self.p.min_sal = min(self.prj.ssp_data.data[Dicts.idx['salinity'], good_pts])
-        self.p.max_sal = max(self.prj.ssp_data.data[Dicts.idx['salinity'], good_pts])
-        self.p.max_depth = min(self.prj.ssp_data.data[Dicts.idx['depth'], good_pts])
-        self.p.min_depth = max(self.prj.ssp_data.data[Dicts.idx['depth'], good_pts])
+        extents = [self.p.extents.get('data', self.prj.ssp_data, good_only=not self.p.display_flagged)]
 
         if self.prj.surface_sound_speed:
-            self.p.min_speed = min(self.p.min_speed, self.prj.surface_sound_speed)
-            self.p.max_speed = max(self.p.max_speed, self.prj.surface_sound_speed)
+            extents.append(ProfileExtents.from_values(speed=self.prj.surface_sound_speed))
 
         if self.p.display_woa and self.prj.ssp_woa:
-            self.p.min_depth = max(self.p.min_depth,
-                                   max(self.prj.ssp_woa.data[Dicts.idx['depth'], :]))
-            self.p.max_depth = min(self.p.max_depth,
-                                   min(self.prj.ssp_woa.data[Dicts.idx['depth'], :]))
-            self.p.min_speed = min(self.p.min_speed,
-                                   min(self.prj.ssp_woa.data[Dicts.idx['speed'], :]))
-            self.p.max_speed = max(self.p.max_speed,
-                                   max(self.prj.ssp_woa.data[Dicts.idx['speed'], :]))
-            self.p.min_temp = min(self.p.min_temp,
-                                  min(self.prj.ssp_woa.data[Dicts.idx['temperature'], :]))
-            self.p.max_temp = max(self.p.max_temp,
-                                  max(self.prj.ssp_woa.data[Dicts.idx['temperature'], :]))
-            self.p.min_sal = min(self.p.min_sal,
-                                 min(self.prj.ssp_woa.data[Dicts.idx['salinity'], :]))
-            self.p.max_sal = max(self.p.max_sal,
-                                 max(self.prj.ssp_woa.data[Dicts.idx['salinity'], :]))
+            extents.append(self.p.extents.get('woa', self.prj.ssp_woa))
 
             if self.prj.ssp_woa_min and self.prj.ssp_woa_max:
-                if self.prj.ssp_woa_min.data.shape[1] > 0:
-                    self.p.min_depth = max(self.p.min_depth,
-                                           max(self.prj.ssp_woa_min.data[Dicts.idx['depth'], :]))
-                    self.p.max_depth = min(self.p.max_depth,
-                                           min(self.prj.ssp_woa_min.data[Dicts.idx['depth'], :]))
-                    self.p.min_speed = min(self.p.min_speed,
-                                           min(self.prj.ssp_woa_min.data[Dicts.idx['speed'], :]))
-                    self.p.max_speed = max(self.p.max_speed,
-                                           max(self.prj.ssp_woa_min.data[Dicts.idx['speed'], :]))
-                    self.p.min_temp = min(self.p.min_temp,
-                                          min(self.prj.ssp_woa_min.data[Dicts.idx['temperature'],
-                                              :]))
-                    self.p.max_temp = max(self.p.max_temp,
-                                          max(self.prj.ssp_woa_min.data[Dicts.idx['temperature'],
-                                              :]))
-                    self.p.min_sal = min(self.p.min_sal,
-                                         min(self.prj.ssp_woa_min.data[Dicts.idx['salinity'], :]))
-                    self.p.max_sal = max(self.p.max_sal,
-                                         max(self.prj.ssp_woa_min.data[Dicts.idx['salinity'], :]))
-
-                if self.prj.ssp_woa_max.data.shape[1] > 0:
-                    self.p.min_depth = max(self.p.min_depth,
-                                           max(self.prj.ssp_woa_max.data[Dicts.idx['depth'], :]))
-                    self.p.max_depth = min(self.p.max_depth,
-                                           min(self.prj.ssp_woa_max.data[Dicts.idx['depth'], :]))
-                    self.p.min_speed = min(self.p.min_speed,
-                                           min(self.prj.ssp_woa_max.data[Dicts.idx['speed'], :]))
-                    self.p.max_speed = max(self.p.max_speed,
-                                           max(self.prj.ssp_woa_max.data[Dicts.idx['speed'], :]))
-                    self.p.min_temp = min(self.p.min_temp,
-                                          min(self.prj.ssp_woa_max.data[Dicts.idx['temperature'],
-                                              :]))
-                    self.p.max_temp = max(self.p.max_temp,
-                                          max(self.prj.ssp_woa_max.data[Dicts.idx['temperature'],
-                                              :]))
-                    self.p.min_sal = min(self.p.min_sal,
-                                         min(self.prj.ssp_woa_max.data[Dicts.idx['salinity'], :]))
-                    self.p.max_sal = max(self.p.max_sal,
-                                         max(self.prj.ssp_woa_max.data[Dicts.idx['salinity'], :]))
+                extents.append(self.p.extents.get('woa_min', self.prj.ssp_woa_min))
+                extents.append(self.p.extents.get('woa_max', self.prj.ssp_woa_max))
 
         if self.p.display_reference and self.prj.ssp_reference:
-            self.p.min_depth = max(self.p.min_depth,
-                                   max(self.prj.ssp_reference.data[Dicts.idx['depth'], :]))
-            self.p.max_depth = min(self.p.max_depth,
-                                   min(self.prj.ssp_reference.data[Dicts.idx['depth'], :]))
-            self.p.min_speed = min(self.p.min_speed,
-                                   min(self.prj.ssp_reference.data[Dicts.idx['speed'], :]))
-            self.p.max_speed = max(self.p.max_speed,
-                                   max(self.prj.ssp_reference.data[Dicts.idx['speed'], :]))
-            self.p.min_temp = min(self.p.min_temp,
-                                  min(self.prj.ssp_reference.data[Dicts.idx['temperature'], :]))
-            self.p.max_temp = max(self.p.max_temp,
-                                  max(self.prj.ssp_reference.data[Dicts.idx['temperature'], :]))
-            self.p.min_sal = min(self.p.min_sal,
-                                 min(self.prj.ssp_reference.data[Dicts.idx['salinity'], :]))
-            self.p.max_sal = max(self.p.max_sal,
-                                 max(self.prj.ssp_reference.data[Dicts.idx['salinity'], :]))
+            extents.append(self.p.extents.get('reference', self.prj.ssp_reference))
 
         if self.p.sel_mode == self.p.sel_modes["Insert"]:
-            if self.prj.u.user_depth:
-                self.p.min_depth = max(self.p.min_depth, self.prj.u.user_depth)
-                self.p.max_depth = min(self.p.max_depth, self.prj.u.user_depth)
-
-            if self.prj.u.user_speed:
-                self.p.min_speed = min(self.p.min_speed, self.prj.u.user_speed)
-                self.p.max_speed = max(self.p.max_speed, self.prj.u.user_speed)
-
-            if self.prj.u.user_temperature:
-                self.p.min_temp = min(self.p.min_temp, self.prj.u.user_temperature)
-                self.p.max_temp = max(self.p.max_temp, self.prj.u.user_temperature)
-
-            if self.prj.u.user_salinity:
-                self.p.min_sal = min(self.p.min_sal, self.prj.u.user_salinity)
-                self.p.max_sal = max(self.p.max_sal, self.prj.u.user_salinity)
+            extents.append(ProfileExtents.from_values(depth=self.prj.u.user_depth or None,
+                                                      speed=self.prj.u.user_speed or None,
+                                                      temperature=self.prj.u.user_temperature or None,
+                                                      salinity=self.prj.u.user_salinity or None))
+
+        mins, maxs = ProfileExtents.combine(extents)
+        fields = ProfileExtents.fields
+        # the depth axis is inverted: 'min_depth' is the deepest value
+        self.p.max_depth, self.p.min_depth = mins[fields.index('depth')], maxs[fields.index('depth')]
+        self.p.min_speed, self.p.max_speed = mins[fields.index('speed')], maxs[fields.index('speed')]
+        self.p.min_temp, self.p.max_temp = mins[fields.index('temperature')], maxs[fields.index('temperature')]
+        self.p.min_sal, self.p.max_sal = mins[fields.index('salinity')], maxs[fields.index('salinity')]
 
         view_range = self.p.max_depth - self.p.min_depth
         if view_range == 0.0:
@@ -800,6 +976,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.u.clear_user_samples()
 
         self.p.sel_mode = self.p.sel_modes["Zoom"]
+        self.p.artists.set_interactive(False)
         self._update_plot()
         log.info("inspection mode: zoom")
 
@@ -808,6 +985,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.u.clear_user_samples()
 
         self.p.sel_mode = self.p.sel_modes["Flag"]
+        self.p.artists.set_interactive(True)
         self._update_plot()
         log.info("flag interaction: active")
 
@@ -816,6 +994,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.u.clear_user_samples()
 
         self.p.sel_mode = self.p.sel_modes["Flag"]
+        self.p.artists.set_interactive(True)
         self._update_plot()
         log.info("unflag interaction: active")
 
@@ -824,12 +1003,16 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.u.clear_user_samples()
 
         self.p.sel_mode = self.p.sel_modes["Insert"]
+        self.p.artists.set_interactive(True)
         self._update_plot()
         log.info("insert interaction: active")
 
     def _on_point_selected(self, evt):
         if self.p.sel_mode != self.p.sel_modes["Insert"]:
             return
+        if self.cast_sender.busy:
+            self.status_message = "Transmission in progress: the profile cannot be edited"
+            return
 
         log.info("point selection: %s, %s" % (evt.xdata, evt.ydata))
 
@@ -849,9 +1032,11 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
                 msg = "User manually inserted sound speed %f at depth %f" \
                       % (self.prj.u.user_speed, self.prj.u.user_depth)
 
-            self.prj.ssp_data.insert_sample(depth=self.prj.u.user_depth, speed=self.prj.u.user_speed,
-                                            temperature=self.prj.u.user_temperature, salinity=self.prj.u.user_salinity,
-                                            source=Dicts.source_types['User'])
+            self.journal.record("insert sample", self.prj.ssp_data, self.prj.ssp_data.insert_sample,
+                                depth=self.prj.u.user_depth, speed=self.prj.u.user_speed,
+                                temperature=self.prj.u.user_temperature, salinity=self.prj.u.user_salinity,
+                                source=Dicts.source_types['User'], rows=())  # only adds a sample
+            self._profile_changed()
             log.info(msg)
             self.prj.u.clear_user_samples()
 
@@ -863,12 +1048,15 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             self.prj.u.user_salinity = x
             self.prj.u.user_depth = y
 
-        self._update_plot()
+        self._update_plot(PlotsScheduler.edited)
 
     def _on_area_selected(self, evt):
 
         if (self.p.sel_mode != self.p.sel_modes["Flag"]) and (self.p.sel_mode != self.p.sel_modes["Zoom"]):
             return
+        if (self.p.sel_mode == self.p.sel_modes["Flag"]) and self.cast_sender.busy:
+            self.status_message = "Transmission in progress: the profile cannot be edited"
+            return
 
         log.info("area selection: %s, %s / %s, %s"
                  % (evt.x1data, evt.y1data, evt.x2data, evt.y2data))
@@ -878,12 +1066,15 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         if self.p.sel_mode == self.p.sel_modes["Flag"]:
             # Deal with case of user selecting points
+            self.journal.begin("flag", self.prj.ssp_data, rows=(Dicts.idx['flag'],))
             if evt.axes == self.p.speed_axes:
                 self.prj.ssp_data.toggle_flag([y1, y2], [x1, x2], 'speed', self.prj.u.inspection_mode)
             elif evt.axes == self.p.temp_axes:
                 self.prj.ssp_data.toggle_flag([y1, y2], [x1, x2], 'temperature', self.prj.u.inspection_mode)
             elif evt.axes == self.p.sal_axes:
                 self.prj.ssp_data.toggle_flag([y1, y2], [x1, x2], 'salinity', self.prj.u.inspection_mode)
+            self.journal.commit(self.prj.ssp_data)
+            self._profile_changed()
 
         elif self.p.sel_mode == self.p.sel_modes["Zoom"]:
             # Deal with case of zooming in
@@ -900,21 +1091,56 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             self.p.max_depth = y2
             self.p.has_zoom_applied = True
 
-        # In all cases, we update the plots accordingly
-        self._update_plot()
+        # In all cases, we update the plots accordingly (flagging only changes the editable artists)
+        if self.p.sel_mode == self.p.sel_modes["Flag"]:
+            self._update_plot(PlotsScheduler.edited)
+        else:
+            self._update_plot()
+
+    def _profile_changed(self):
+        """To be called after any in-place modification of the current profile data"""
+        self.p.extents.invalidate('data')
+        if self.ref_monitor:
+            self.ref_monitor.ssp_changed()
+
+    def _update_plot(self, *regions):
+        """Request an update of the passed plot regions (all of them, if not passed)
 
-    def _update_plot(self):
-        """Update the plots"""
-        # log.info("updating plots")
+        The actual rendering is coalesced by the plots scheduler (see PlotsScheduler.regions).
+        """
+        self.p.scheduler.mark_dirty(*regions)
+
+    def _check_plot_title(self):
+        """Periodically called: only request a redraw if the displayed title (e.g., the time since last
+        transmission) has changed"""
+        if not self.prj.has_ssp_loaded:
+            return
+        if self._plot_title() != self.p.title:
+            self._update_plot('title')
+
+    def _render_plot(self, dirty):
+        """Render the dirty plot regions
+
+        When only the artists changed by flagging/insertion are dirty, they are blitted (if the view limits
+        have not changed), otherwise the figure is redrawn.
+        """
+        # log.info("updating plots: %s" % dirty)
 
         if self.prj.has_sippican_to_process or self.prj.has_mvp_to_process:
             if self.state == self.gui_state["CLOSED"]:
                 self._update_state(self.gui_state["OPEN"])
 
+        view_limits = self.p.view_limits()
         self._reset_view_limits()
+        if (dirty == {PlotsScheduler.edited}) and not \
+                (self.p.artists.can_blit() and (view_limits == self.p.view_limits())):
+            dirty = {'profile'}
 
         try:
-            self._update_plot_worker()
+            if dirty == {PlotsScheduler.edited}:
+                self._update_edited_worker()
+            else:
+                self._update_plot_worker(dirty)
         except PyDeadObjectError:
             log.info("dead object")
         except IndexError:
@@ -928,243 +1154,308 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         except RuntimeError:
             log.info("runtime error during plot updating")
 
-    def _update_plot_worker(self):
-        """Update the plots"""
+    def _update_plot_worker(self, dirty):
+        """Update the artists of the dirty regions, then redraw the figure"""
 
-        self.p.plots.get_figure().clf()
         if not self.prj.has_ssp_loaded:
+            self.p.artists.set_visible(False)
             self.p.plots.draw()
             return
+        self.p.artists.set_visible(True)
+
+        # View limits (before the data, since the long profiles are decimated based on the depth view)
+        self.p.artists.set_limits('speed', self.p.min_speed, self.p.max_speed)
+        self.p.artists.set_limits('temperature', self.p.min_temp, self.p.max_temp)
+        self.p.artists.set_limits('salinity', self.p.min_sal, self.p.max_sal)
+        self.p.artists.set_depth_limits(self.p.min_depth, self.p.max_depth)
+        if self.p.artists.refine_lod():
+            dirty = dirty | {'profile'}
+
+        if 'woa' in dirty:
+            self._update_woa_artists()
+        if ('profile' in dirty) or (PlotsScheduler.edited in dirty):
+            self._update_reference_artists()
+            self._update_profile_artists()
+            self._update_insert_guides()
+        if 'depth' in dirty:
+            self._update_depth_artists()
+        if 'title' in dirty:
+            self._update_title_artists()
 
-        if self.prj.server.is_running:
-            bg_color = '#32cd32'  # green
-        elif self.prj.has_sippican_to_process or self.prj.has_mvp_to_process:
-            bg_color = '#F23047'  # red
-        else:
-            bg_color = 'w'
+        self.p.plots.draw()
+
+    def _update_woa_artists(self):
+        """Plot WOA2009 profile for context if desired, but only if we have a current SV loaded"""
+        fields = PlotsArtists.fields
 
-        # Fresh axes every time
-        self.p.speed_axes = self.p.plots.get_figure().add_subplot(131, axisbg=bg_color)
-        self.p.speed_axes.invert_yaxis()
-        self.p.temp_axes = self.p.plots.get_figure().add_subplot(132, sharey=self.p.speed_axes, axisbg=bg_color)
-        self.p.temp_axes.invert_yaxis()
-        self.p.sal_axes = self.p.plots.get_figure().add_subplot(133, sharey=self.p.speed_axes, axisbg=bg_color)
-        self.p.sal_axes.invert_yaxis()
-
-        if self.prj.has_ssp_loaded and self.p.display_woa and self.prj.ssp_woa:
-            # Plot WOA2009 profile for context if desired, but only if we have a current SV loaded
-            self.p.speed_axes.plot(self.prj.ssp_woa.data[Dicts.idx['speed'], :],
-                                   self.prj.ssp_woa.data[Dicts.idx['depth'], :], 'm--')
-            self.p.speed_axes.hold(True)
-            self.p.temp_axes.plot(self.prj.ssp_woa.data[Dicts.idx['temperature'], :],
-                                  self.prj.ssp_woa.data[Dicts.idx['depth'], :], 'm--')
-            self.p.temp_axes.hold(True)
-            self.p.sal_axes.plot(self.prj.ssp_woa.data[Dicts.idx['salinity'], :],
-                                 self.prj.ssp_woa.data[Dicts.idx['depth'], :], 'm--')
-            self.p.sal_axes.hold(True)
+        if self.p.display_woa and self.prj.ssp_woa:
+            for field in fields:
+                self.p.artists.set_line('woa', field, self.prj.ssp_woa.data[Dicts.idx[field], :],
+                                        self.prj.ssp_woa.data[Dicts.idx['depth'], :])
 
             if self.prj.ssp_woa_max and self.prj.ssp_woa_min:
-                self.p.speed_axes.plot(self.prj.ssp_woa_min.data[Dicts.idx['speed'], :],
-                                       self.prj.ssp_woa_min.data[Dicts.idx['depth'], :], 'm--')
-                self.p.temp_axes.plot(self.prj.ssp_woa_min.data[Dicts.idx['temperature'], :],
-                                      self.prj.ssp_woa_min.data[Dicts.idx['depth'], :], 'm--')
-                self.p.sal_axes.plot(self.prj.ssp_woa_min.data[Dicts.idx['salinity'], :],
-                                     self.prj.ssp_woa_min.data[Dicts.idx['depth'], :], 'm--')
-                self.p.speed_axes.plot(self.prj.ssp_woa_max.data[Dicts.idx['speed'], :],
-                                       self.prj.ssp_woa_max.data[Dicts.idx['depth'], :], 'm--')
-                self.p.temp_axes.plot(self.prj.ssp_woa_max.data[Dicts.idx['temperature'], :],
-                                      self.prj.ssp_woa_max.data[Dicts.idx['depth'], :], 'm--')
-                self.p.sal_axes.plot(self.prj.ssp_woa_max.data[Dicts.idx['salinity'], :],
-                                     self.prj.ssp_woa_max.data[Dicts.idx['depth'], :], 'm--')
+                for field in fields:
+                    self.p.artists.set_line('woa_min', field, self.prj.ssp_woa_min.data[Dicts.idx[field], :],
+                                            self.prj.ssp_woa_min.data[Dicts.idx['depth'], :])
+                    self.p.artists.set_line('woa_max', field, self.prj.ssp_woa_max.data[Dicts.idx[field], :],
+                                            self.prj.ssp_woa_max.data[Dicts.idx['depth'], :])
+            else:
+                self.p.artists.hide_line('woa_min')
+                self.p.artists.hide_line('woa_max')
+        else:
+            self.p.artists.hide_line('woa')
+            self.p.artists.hide_line('woa_min')
+            self.p.artists.hide_line('woa_max')
 
+    def _update_reference_artists(self):
+        """Update the reference and the thinned (for SIS) profiles"""
         if self.p.display_reference and self.prj.ssp_reference:
-            # Plot Reference profile
-            good_pts = (self.prj.ssp_reference.data[Dicts.idx['flag'], :] == 0)
-            self.p.speed_axes.plot(self.prj.ssp_reference.data[Dicts.idx['speed'], good_pts],
-                                   self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts], 'y')
-
-            if self.prj.has_ssp_loaded:
-                self.p.speed_axes.plot(self.prj.ssp_reference.data[Dicts.idx['speed'], good_pts],
-                                       self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts],
-                                       'y', linewidth=3.0)
-
-            self.p.speed_axes.hold(True)
-
-            self.p.temp_axes.plot(self.prj.ssp_reference.data[Dicts.idx['temperature'], good_pts],
-                                  self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts], 'y')
-
-            if self.prj.has_ssp_loaded:
-                self.p.temp_axes.plot(self.prj.ssp_reference.data[Dicts.idx['temperature'], good_pts],
-                                      self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts],
-                                      'y', linewidth=3.0)
-            self.p.temp_axes.hold(True)
-
-            self.p.sal_axes.plot(self.prj.ssp_reference.data[Dicts.idx['salinity'], good_pts],
-                                 self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts], 'y')
-            if self.prj.has_ssp_loaded:
-                self.p.sal_axes.plot(self.prj.ssp_reference.data[Dicts.idx['salinity'], good_pts],
-                                     self.prj.ssp_reference.data[Dicts.idx['depth'], good_pts],
-                                     'y', linewidth=3.0)
-
-            self.p.sal_axes.hold(True)
+            # Plot Reference profile (the unflagged samples of the read-only reference are selected only once)
+            good_data = valid_data(self.prj.ssp_reference)
+            for field in PlotsArtists.fields:
+                self.p.artists.set_line('reference', field, good_data[Dicts.idx[field], :],
+                                        good_data[Dicts.idx['depth'], :])
+        else:
+            self.p.artists.hide_line('reference')
 
         if self.prj.ssp_data.sis_data is not None:
             # Plot thinned SSP for sis
             good_pts = (self.prj.ssp_data.sis_data[Dicts.idx['flag'], :] == 0)
-            self.p.speed_axes.plot(self.prj.ssp_data.sis_data[Dicts.idx['speed'], good_pts],
-                                   self.prj.ssp_data.sis_data[Dicts.idx['depth'], good_pts],
-                                   marker='o', markersize=2.5, markerfacecolor='#00FF00', fillstyle=u'full',
-                                   linestyle='-', color='#33FF33')
-
-        if self.prj.has_ssp_loaded and self.p.display_flagged:
-            # Plot rejected points if desired
-            bad_pts = (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 1)
-            self.p.speed_axes.plot(self.prj.ssp_data.data[Dicts.idx['speed'], bad_pts],
-                                   self.prj.ssp_data.data[Dicts.idx['depth'], bad_pts], 'r,')
-            self.p.speed_axes.hold(True)
-            self.p.temp_axes.plot(self.prj.ssp_data.data[Dicts.idx['temperature'], bad_pts],
-                                  self.prj.ssp_data.data[Dicts.idx['depth'], bad_pts], 'r,')
-            self.p.temp_axes.hold(True)
-            self.p.sal_axes.plot(self.prj.ssp_data.data[Dicts.idx['salinity'], bad_pts],
-                                 self.prj.ssp_data.data[Dicts.idx['depth'], bad_pts], 'r,')
-            self.p.sal_axes.hold(True)
-
-        # Now plot the good points
-        if self.prj.server.is_running:
-            line = 'k'
+            self.p.artists.set_line('sis', 'speed', self.prj.ssp_data.sis_data[Dicts.idx['speed'], good_pts],
+                                    self.prj.ssp_data.sis_data[Dicts.idx['depth'], good_pts])
         else:
-            line = 'b'
-
-        if self.prj.has_ssp_loaded:
-            good_pts = (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
-            self.p.speed_axes.plot(self.prj.ssp_data.data[Dicts.idx['speed'], good_pts],
-                                   self.prj.ssp_data.data[Dicts.idx['depth'], good_pts], line)
-            self.p.temp_axes.plot(self.prj.ssp_data.data[Dicts.idx['temperature'], good_pts],
-                                  self.prj.ssp_data.data[Dicts.idx['depth'], good_pts], line)
-            self.p.sal_axes.plot(self.prj.ssp_data.data[Dicts.idx['salinity'], good_pts],
-                                 self.prj.ssp_data.data[Dicts.idx['depth'], good_pts], line)
-
-        # Label plots, etc
-        self.p.speed_axes.grid()
-        self.p.speed_axes.axis([self.p.min_speed, self.p.max_speed, self.p.min_depth, self.p.max_depth])
-        self.p.speed_axes.set_xlabel('Sound Speed [m/s]')
-        self.p.speed_axes.set_ylabel('Depth [m]')
-
-        self.p.temp_axes.grid()
-        self.p.temp_axes.axis([self.p.min_temp, self.p.max_temp, self.p.min_depth,
-                               self.p.max_depth])
-        self.p.temp_axes.set_xlabel('Temp [deg C]')
-
-        self.p.sal_axes.grid()
-        self.p.sal_axes.axis([self.p.min_sal, self.p.max_sal, self.p.min_depth,
-                              self.p.max_depth])
-        self.p.sal_axes.set_xlabel('Sal [psu]')
+            self.p.artists.hide_line('sis')
 
+    def _plot_title(self):
         if self.prj.server.is_running:
             age_of_transmission = dt.datetime.utcnow() - self.prj.time_of_last_tx
-            self.p.temp_axes.set_title("SERVER: %d cast(s) delivered\nTime since last transmission: %s"
-                                       % (self.prj.server.delivered_casts,
-                                          ':'.join(str(age_of_transmission).split(':')[:2])))
+            return "SERVER: %d cast(s) delivered\nTime since last transmission: %s" \
+                   % (self.prj.server.delivered_casts, ':'.join(str(age_of_transmission).split(':')[:2]))
 
         elif self.prj.has_sippican_to_process or self.prj.has_mvp_to_process:
-            self.p.temp_axes.set_title("Received %s... please process and deliver to SIS"
-                                       % (os.path.basename(self.prj.filename)))
+            return "Received %s... please process and deliver to SIS" % (os.path.basename(self.prj.filename))
 
         else:
             if self.prj.time_of_last_tx:
                 age_of_transmission = dt.datetime.utcnow() - self.prj.time_of_last_tx
-                self.p.temp_axes.set_title("%s\nTime since last transmission: %s" % (
-                    os.path.basename(self.prj.filename), ':'.join(str(age_of_transmission).split(':')[:2])))
+                return "%s\nTime since last transmission: %s" % (
+                    os.path.basename(self.prj.filename), ':'.join(str(age_of_transmission).split(':')[:2]))
             else:
-                self.p.temp_axes.set_title("%s" % os.path.basename(self.prj.filename))
+                return "%s" % os.path.basename(self.prj.filename)
+
+    def _update_title_artists(self):
+        """Update the title and the background color (both depending on the processing state)"""
+        if self.prj.server.is_running:
+            bg_color = '#32cd32'  # green
+        elif self.prj.has_sippican_to_process or self.prj.has_mvp_to_process:
+            bg_color = '#F23047'  # red
+        else:
+            bg_color = 'w'
+        self.p.artists.set_background(bg_color)
+
+        self.p.title = self._plot_title()
+        self.p.artists.set_title(self.p.title)
 
+    def _update_depth_artists(self):
+        """Update the mean depth band and the draft/surface sound speed lines"""
         # plot the current mean depth (if available and the user setting is on)
-        # print("# %s %s" % (self.prj.mean_depth, self.p.display_depth))
         if self.prj.mean_depth and self.p.display_depth:
-            # draw line on the 3 plots
-            line = '#663300'
-            y = [self.prj.mean_depth, self.prj.mean_depth]
-            x = [-100.0, 2000]  # sound speed
-            self.p.speed_axes.plot(x, y, line)
-            x = [-100.0, 100]  # temperature
-            self.p.temp_axes.plot(x, y, line)
-            x = [-100.0, 100]  # salinity
-            self.p.sal_axes.plot(x, y, line)
-
-            # draw rectangle on the 3 plots
             if self.prj.server.is_running:
                 a = 0.8
             else:
                 a = 0.5
-            sel = matplotlib.patches.Rectangle((-100.0, self.prj.mean_depth), 2100, 12000, edgecolor='k',
-                                               facecolor='#996633', label='_nolegend_', alpha=a)
-            self.p.speed_axes.add_patch(sel)
-            sel = matplotlib.patches.Rectangle((-100.0, self.prj.mean_depth), 200, 12000, edgecolor='k',
-                                               facecolor='#996633', label='_nolegend_', alpha=a)
-            self.p.temp_axes.add_patch(sel)
-            sel = matplotlib.patches.Rectangle((-100.0, self.prj.mean_depth), 200, 12000, edgecolor='k',
-                                               facecolor='#996633', label='_nolegend_', alpha=a)
-            self.p.sal_axes.add_patch(sel)
+            self.p.artists.set_band(self.prj.mean_depth, alpha=a)
+        else:
+            self.p.artists.hide_band()
 
         # plot vessel draft and surface sound speed (if available) [only on the speed plot]
-        # print("@ %s %s" % (self.prj.vessel_draft, self.prj.surface_sound_speed))
         if self.prj.vessel_draft and self.prj.surface_sound_speed:
-            line = 'g--'
             # vertical line
-            x = [self.prj.surface_sound_speed, self.prj.surface_sound_speed]
-            y = [0.0, 12000]
-            self.p.speed_axes.plot(x, y, line)
+            self.p.artists.set_line('draft_speed', 'speed', [self.prj.surface_sound_speed,
+                                                             self.prj.surface_sound_speed], [0.0, 12000])
             # horizontal line
-            x = [-100.0, 2100]
-            y = [self.prj.vessel_draft, self.prj.vessel_draft]
-            self.p.speed_axes.plot(x, y, line)
+            self.p.artists.set_line('draft_depth', 'speed', [-100.0, 2100],
+                                    [self.prj.vessel_draft, self.prj.vessel_draft])
             # dot at the draft/surface sound speed intersection
-            self.p.speed_axes.plot(self.prj.surface_sound_speed, self.prj.vessel_draft, 'g+', mew=1.6, ms=6)
+            self.p.artists.set_line('draft_point', 'speed', [self.prj.surface_sound_speed],
+                                    [self.prj.vessel_draft])
+        else:
+            self.p.artists.hide_line('draft_speed')
+            self.p.artists.hide_line('draft_depth')
+            self.p.artists.hide_line('draft_point')
+
+    def _update_edited_worker(self):
+        """Update only the artists changed by flagging/insertion, and blit them on the cached background"""
+        self._update_profile_artists()
+        self._update_insert_guides()
+        self.p.artists.blit()
+
+    def _update_profile_artists(self):
+        """Update the flagged and the good samples of the current profile"""
+        if self.p.display_flagged:
+            # Plot rejected points if desired
+            bad_pts = (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 1)
+            for field in PlotsArtists.fields:
+                self.p.artists.set_line('flagged', field, self.prj.ssp_data.data[Dicts.idx[field], bad_pts],
+                                        self.prj.ssp_data.data[Dicts.idx['depth'], bad_pts])
+        else:
+            self.p.artists.hide_line('flagged')
 
-        # plotting during point insertion
-        if self.p.sel_mode == self.p.sel_modes["Insert"]:
+        # Now plot the good points
+        if self.prj.server.is_running:
+            line_color = 'k'
+        else:
+            line_color = 'b'
 
-            salinities = np.zeros(2)
-            temperatures = np.zeros(2)
-            depths = np.zeros(2)
-
-            depths[0] = self.prj.u.user_depth
-
-            pts = ((self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
-                   & (self.prj.ssp_data.data[Dicts.idx['depth'], :] < self.prj.u.user_depth))
-            if np.count_nonzero(pts) > 0:
-                depths[1] = self.prj.ssp_data.data[Dicts.idx['depth'], pts][-1]
-                temperatures[1] = self.prj.ssp_data.data[Dicts.idx['temperature'], pts][-1]
-                salinities[1] = self.prj.ssp_data.data[Dicts.idx['salinity'], pts][-1]
-                if self.prj.u.user_salinity:
-                    salinities[0] = self.prj.u.user_salinity
-                    self.p.sal_axes.plot(salinities, depths, "c--")
-                if self.prj.u.user_temperature:
-                    temperatures[0] = self.prj.u.user_temperature
-                    self.p.temp_axes.plot(temperatures, depths, "c--")
-
-            pts = ((self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
-                   & (self.prj.ssp_data.data[Dicts.idx['depth'], :] > self.prj.u.user_depth))
-            if np.count_nonzero(pts) > 0:
-                depths[1] = self.prj.ssp_data.data[Dicts.idx['depth'], pts][0]
-                temperatures[1] = self.prj.ssp_data.data[Dicts.idx['temperature'], pts][0]
-                salinities[1] = self.prj.ssp_data.data[Dicts.idx['salinity'], pts][0]
-                if self.prj.u.user_salinity:
-                    salinities[0] = self.prj.u.user_salinity
-                    self.p.sal_axes.plot(salinities, depths, "c--")
-                if self.prj.u.user_temperature:
-                    temperatures[0] = self.prj.u.user_temperature
-                    self.p.temp_axes.plot(temperatures, depths, "c--")
-
-            if self.prj.u.user_salinity:
-                self.p.sal_axes.plot(self.prj.u.user_salinity, self.prj.u.user_depth, "c.")
-            if self.prj.u.user_temperature:
-                self.p.temp_axes.plot(self.prj.u.user_temperature, self.prj.u.user_depth, "c.")
+        good_pts = (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
+        for field in PlotsArtists.fields:
+            self.p.artists.set_line('good', field, self.prj.ssp_data.data[Dicts.idx[field], good_pts],
+                                    self.prj.ssp_data.data[Dicts.idx['depth'], good_pts])
+            self.p.artists.lines[('good', field)].set_color(line_color)
 
-        self.p.plots.draw()
+    def _update_insert_guides(self):
+        """Update the cyan guides shown while inserting a new sample"""
+        for name in ['insert_above', 'insert_below', 'insert_point']:
+            self.p.artists.hide_line(name)
+
+        if self.p.sel_mode != self.p.sel_modes["Insert"]:
+            return
+
+        user_values = {
+            'temperature': self.prj.u.user_temperature,
+            'salinity': self.prj.u.user_salinity
+        }
+
+        for name, pts, pick in [
+            ('insert_above', self.prj.ssp_data.data[Dicts.idx['depth'], :] < self.prj.u.user_depth, -1),
+            ('insert_below', self.prj.ssp_data.data[Dicts.idx['depth'], :] > self.prj.u.user_depth, 0)
+        ]:
+            pts &= (self.prj.ssp_data.data[Dicts.idx['flag'], :] == 0)
+            if np.count_nonzero(pts) == 0:
+                continue
+            depths = [self.prj.u.user_depth, self.prj.ssp_data.data[Dicts.idx['depth'], pts][pick]]
+            for field, value in user_values.items():
+                if value:
+                    self.p.artists.set_line(name, field, [value, self.prj.ssp_data.data[Dicts.idx[field], pts][pick]],
+                                            depths)
+
+        for field, value in user_values.items():
+            if value:
+                self.p.artists.set_line('insert_point', field, [value], [self.prj.u.user_depth])
+
+    # ###### Atlas queries #####
+
+    def _query_atlas(self, description, on_result, query, *args):
+        """Run an atlas query in background, then call 'on_result' (on the GUI thread) with the AtlasQuery
+
+        A non-modal progress dialog allows to cancel the query, and the result is dropped if the current
+        profile is changed in the meanwhile.
+        """
+        if self.atlas_query is not None:
+            self.status_message = "Another atlas query is running"
+            log.info("another atlas query is running: %s skipped" % description)
+            return None
+
+        ssp = self.prj.ssp_data
+        progress = wx.ProgressDialog("Atlas query", "%s ..." % description, parent=None,
+                                     style=wx.PD_CAN_ABORT | wx.PD_ELAPSED_TIME)
+
+        def pulse():
+            if atlas_query.done():
+                return
+            if not progress.Pulse()[0]:
+                log.info("user cancelled: %s" % description)
+                atlas_query.cancel()
+                return
+            wx.CallLater(200, pulse)
+
+        def on_done(done_query):
+            self.atlas_query = None
+            progress.Destroy()
+            if done_query.cancelled():
+                self.status_message = "%s: cancelled" % description
+                return
+            if self.prj.ssp_data is not ssp:
+                log.info("current profile changed during the atlas query: result dropped")
+                return
+            on_result(done_query)
+
+        self.status_message = "%s ..." % description
+        atlas_query = self.atlas_queries.submit(query, *args)
+        self.atlas_query = atlas_query
+        atlas_query.add_done_callback(on_done)
+        wx.CallLater(200, pulse)
+        return atlas_query
+
+    def _query_woa09_casts(self, with_temp_and_sal=False):
+        """Retrieve in background the WOA09 casts at the current profile location
+
+        With 'with_temp_and_sal', the temperature and salinity of the profile are then replaced by the WOA09 ones
+        (e.g., for the SIS casts that only have sound speed).
+        """
+        if not self._woa09_available():
+            return
+
+        def on_result(atlas_query):
+            try:
+                self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = atlas_query.result()
+            except HyOError as e:
+                log.info("failure in performing WOA09 lookup: %s" % e)
+                return
+
+            if with_temp_and_sal and (self.prj.ssp_woa is not None):
+                self.journal.begin("WOA09 temperature/salinity", self.prj.ssp_data)
+                self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
+                self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
+                self.journal.commit(self.prj.ssp_data)
+                self._profile_changed()
+            self._update_plot()
+
+        self._query_atlas("Querying WOA09 atlas", on_result, self.woa09_cache.query, self.prj.ssp_data.latitude,
+                          self.prj.ssp_data.longitude, self.prj.ssp_data.date_time)
+
+    def _augment_from_rtofs(self, description, on_cast):
+        """Query RTOFS at the current profile position in background, then call on_cast(cast, source)
+
+        On RTOFS lookup failure, 'on_cast' is called with the WOA09 cast (if available).
+        """
+        def on_result(atlas_query):
+            try:
+                cast = atlas_query.result()
+
+            except SspError:
+                if self._woa09_available() and (self.prj.ssp_woa is not None):  # try with WOA09
+                    log.info("failure in RTOFS lookup, reverting to WOA09")
+                    on_cast(self.prj.ssp_woa, "WOA09")
+
+                else:
+                    msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
+                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+                    dlg.ShowModal()
+                    dlg.Destroy()
+                return
+
+            on_cast(cast, "RTOFS")
+
+        self._query_atlas(description, on_result, self.rtofs_cache.query, self.prj.ssp_data.latitude,
+                          self.prj.ssp_data.longitude, self.prj.ssp_data.date_time)
+
+    def _rtofs_available(self):
+        return self._get_pipeline().rtofs_available()
 
     # ######  Process #####
 
+    def _atlas(self, source, sources):
+        """Return the atlas to use for the passed source (None, after the error dialog, if not available)"""
+        try:
+            return self._get_pipeline().atlas(source, sources)
+        except SspError as e:
+            msg = "Functionality disabled: %s" % e
+            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return None
+
     def on_process_load_salinity(self, evt):
         """XBT-specific function to add salinity values"""
 
@@ -1177,78 +1468,23 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         if self.prj.ssp_reference:
             log.info("using reference cast to augment salinity")
-            self.prj.ssp_data.replace_samples(self.prj.ssp_reference, 'salinity')
-            salinity_source = 'user-specified reference file %s' % self.prj.ssp_reference_filename
-
-        else:  # atlases
-            if self.prj.s.ssp_salinity_source == Dicts.salinity_sources["RTOFS"]:
-                # ext_type = Dicts.source_types['RtofsExtend']
-                salinity_source = "RTOFS"
-                if not self.prj.rtofs_atlas_loaded:
-                    if self.prj.woa09_atlas_loaded:  # try with WOA09
-                        log.info("RTOFS grids not loaded, reverting to WOA09")
-                        # ext_type = Dicts.source_types['Woa09Extend']
-                        salinity_source = "WOA09"
-                        self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-                    else:
-                        msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                        dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                        dlg.ShowModal()
-                        dlg.Destroy()
-                        return
-                else:
-                    try:
-                        temp_sv = self.prj.rtofs_atlas.query(self.prj.ssp_data.latitude,
-                                                             self.prj.ssp_data.longitude,
-                                                             self.prj.ssp_data.date_time)
-                        self.prj.ssp_data.replace_samples(temp_sv, 'salinity')
-
-                    except SspError:
-                        if self.prj.woa09_atlas_loaded:  # try with WOA09
-                            log.info("failure in RTOFS lookup, reverting to WOA09")
-                            # ext_type = Dicts.source_types['Woa09Extend']
-                            salinity_source = "WOA09"
-                            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-
-                        else:
-                            msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                            dlg.ShowModal()
-                            dlg.Destroy()
-                            return
-
-            elif self.prj.s.ssp_salinity_source == Dicts.salinity_sources["WOA09"]:
-                # ext_type = Dicts.source_types['Woa09Extend']
-                salinity_source = "WOA09"
-
-                if not self.prj.woa09_atlas_loaded:
-                    msg = "Functionality disabled: failure in loading WOA09 atlas"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
-
-                if self.prj.ssp_woa is None:
-                    msg = "Functionality disabled: failure in WOA2009 lookup"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
-
-                # And then extend by WOA
-                self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
+            self._add_salinity(self.prj.ssp_reference, self._get_pipeline().reference_source())
+            return
 
-            else:
-                raise SspError("unsupported extension source: %s" % self.prj.s.ssp_extension_source)
+        atlas = self._atlas(self.prj.s.ssp_salinity_source, Dicts.salinity_sources)
+        if atlas == "RTOFS":
+            self._augment_from_rtofs("Querying RTOFS atlas for salinity", self._add_salinity)
+        elif atlas == "WOA09":
+            self._add_salinity(self.prj.ssp_woa, atlas)
 
-        # Now replace the salinity values in the cast with the salinity values in WOA
-        self.prj.ssp_data.calc_speed()
-        # add metadata to source info
-        self.prj.ssp_data.modify_source_info("salinity augmented from %s" % salinity_source)
+    def _add_salinity(self, cast, salinity_source):
+        # the operation is recorded only now, since the profile can be edited during an atlas query
+        self.journal.begin("salinity", self.prj.ssp_data)
+        self._get_pipeline().add_salinity(cast, salinity_source)
+        self.journal.commit(self.prj.ssp_data)
+        self._profile_changed()
 
         self._update_plot()
-        msg = 'Salinity added to profile using source %s' % salinity_source
-        log.info(msg)
         self.status_message = 'Salinity added from %s' % salinity_source
 
     def on_process_load_temp_and_sal(self, evt):
@@ -1264,82 +1500,22 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         if self.prj.ssp_reference:
             log.info("using reference cast to augment salinity and temperature")
-            self.prj.ssp_data.replace_samples(self.prj.ssp_reference, 'salinity')
-            self.prj.ssp_data.replace_samples(self.prj.ssp_reference, 'temperature')
-            temperature_salinity_source = 'user specified reference file %s' % self.prj.ssp_reference_filename
-
-        else:  # atlases
-            if self.prj.s.ssp_salinity_source == Dicts.salinity_sources["RTOFS"]:
-                # ext_type = Dicts.source_types['RtofsExtend']
-                temperature_salinity_source = "RTOFS"
-                if not self.prj.rtofs_atlas_loaded:
-                    if self.prj.woa09_atlas_loaded:  # try with WOA09
-                        log.info("RTOFS grids not loaded, reverting to WOA09")
-                        # ext_type = Dicts.source_types['Woa09Extend']
-                        temperature_salinity_source = "WOA09"
-                        self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-                        self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
-                    else:
-                        msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                        dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                        dlg.ShowModal()
-                        dlg.Destroy()
-                        return
-                else:
-                    try:
-                        temp_sv = self.prj.rtofs_atlas.query(self.prj.ssp_data.latitude,
-                                                             self.prj.ssp_data.longitude,
-                                                             self.prj.ssp_data.date_time)
-                        self.prj.ssp_data.replace_samples(temp_sv, 'salinity')
-                        self.prj.ssp_data.replace_samples(temp_sv, 'temperature')
-
-                    except SspError:
-                        if self.prj.woa09_atlas_loaded:  # try with WOA09
-                            log.info("failure in RTOFS lookup, reverting to WOA09")
-                            # ext_type = Dicts.source_types['Woa09Extend']
-                            temperature_salinity_source = "WOA09"
-                            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-                            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
-
-                        else:
-                            msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                            dlg.ShowModal()
-                            dlg.Destroy()
-                            return
-
-            elif self.prj.s.ssp_salinity_source == Dicts.salinity_sources["WOA09"]:
-                # ext_type = Dicts.source_types['Woa09Extend']
-                temperature_salinity_source = "WOA09"
-
-                if not self.prj.woa09_atlas_loaded:
-                    msg = "Functionality disabled: failure in loading WOA09 atlas"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
-
-                if self.prj.ssp_woa is None:
-                    msg = "Functionality disabled: failure in WOA2009 lookup"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
-
-                # And then extend by WOA
-                self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-                self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
+            self._add_temp_and_sal(self.prj.ssp_reference, self._get_pipeline().reference_source())
+            return
 
-            else:
-                raise SspError("unsupported extension source: %s" % self.prj.s.ssp_extension_source)
+        atlas = self._atlas(self.prj.s.ssp_salinity_source, Dicts.salinity_sources)
+        if atlas == "RTOFS":
+            self._augment_from_rtofs("Querying RTOFS atlas for temperature/salinity", self._add_temp_and_sal)
+        elif atlas == "WOA09":
+            self._add_temp_and_sal(self.prj.ssp_woa, atlas)
 
-        # add metadata to source info
-        self.prj.ssp_data.modify_source_info("temperature/salinity augmented from %s" % temperature_salinity_source)
+    def _add_temp_and_sal(self, cast, temperature_salinity_source):
+        self.journal.begin("temperature/salinity", self.prj.ssp_data)
+        self._get_pipeline().add_temp_and_sal(cast, temperature_salinity_source)
+        self.journal.commit(self.prj.ssp_data)
+        self._profile_changed()
 
-        # We don't recalculate speed, of course.  T/S is simply for absorption coefficient calculation
         self._update_plot()
-        msg = 'Temperature/Salinity added to profile using source %s' % temperature_salinity_source
-        log.info(msg)
         self.status_message = "Temperature/salinity added from %s" % temperature_salinity_source
 
     def on_process_load_surface_ssp(self, evt):
@@ -1367,21 +1543,12 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             return
 
         # Insert the surface speed value into the profile at the vessel_draft
-        self.prj.surface_speed_applied = True
-        self.prj.ssp_applied_depth = 1.15 * self.prj.vessel_draft
-        self.prj.ssp_data.insert_sample(depth=self.prj.ssp_applied_depth, speed=surface_ssp,
-                                        temperature=None, salinity=None,
-                                        source=Dicts.source_types['SurfaceSensor'])
-
-        # And set all values shoaller than the draft to be the same speed
-        idx = self.prj.ssp_data.data[Dicts.idx['depth'], :] < self.prj.ssp_applied_depth
-        self.prj.ssp_data.data[Dicts.idx['speed'], idx] = surface_ssp
-        self.prj.ssp_data.modify_source_info('surface sound speed from %s' % surface_ssp_source)
+        self.journal.begin("surface sound speed", self.prj.ssp_data)
+        self._get_pipeline().add_surface_ssp(surface_ssp, self.prj.vessel_draft, surface_ssp_source)
+        self.journal.commit(self.prj.ssp_data)
+        self._profile_changed()
 
         self._update_plot()
-        msg = 'Surface sound speed %.2f added to profile for upper %.1f m (source: %s)' \
-              % (surface_ssp, self.prj.vessel_draft, surface_ssp_source)
-        log.info(msg)
         self.status_message = "Added surface sound speed %.1f" % surface_ssp
 
     def on_process_extend(self, evt):
@@ -1391,78 +1558,49 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         if self.prj.ssp_reference:
             log.info("Extending with user-specified reference profile")
-            ext_type = Dicts.source_types['UserRefExtend']
-            self.prj.ssp_data.extend(self.prj.ssp_reference, ext_type)
-
-        else:  # atlases
-            if self.prj.s.ssp_extension_source == Dicts.extension_sources["RTOFS"]:
-                ext_type = Dicts.source_types['RtofsExtend']
-                if not self.prj.rtofs_atlas_loaded:
-                    if self.prj.woa09_atlas_loaded:  # try with WOA09
-                        log.info("RTOFS grids not loaded, reverting to WOA09")
-                        ext_type = Dicts.source_types['Woa09Extend']
-                        self.prj.ssp_data.extend(self.prj.ssp_woa, ext_type)
-                    else:
-                        msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                        dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                        dlg.ShowModal()
-                        dlg.Destroy()
-                        return
-                else:
-                    try:
-                        temp_sv = self.prj.rtofs_atlas.query(self.prj.ssp_data.latitude,
-                                                             self.prj.ssp_data.longitude,
-                                                             self.prj.ssp_data.date_time)
-                        self.prj.ssp_data.extend(temp_sv, ext_type)
-                        # now use the WOA09 since it usually goes deeper
-                        self.prj.ssp_data.extend(temp_sv, Dicts.source_types['Woa09Extend'])
-
-                    except SspError:
-                        if self.prj.woa09_atlas_loaded:  # try with WOA09
-                            log.info("failure in RTOFS lookup, reverting to WOA09")
-                            ext_type = Dicts.source_types['Woa09Extend']
-                            self.prj.ssp_data.extend(self.prj.ssp_woa, ext_type)
-
-                        else:
-                            msg = "Functionality disabled: Failed on load RTOFS and WOA09 grids"
-                            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                            dlg.ShowModal()
-                            dlg.Destroy()
-                            return
-
-            elif self.prj.s.ssp_extension_source == Dicts.extension_sources["WOA09"]:
-                ext_type = Dicts.source_types['Woa09Extend']
-
-                if not self.prj.woa09_atlas_loaded:
-                    msg = "Functionality disabled: failure in loading WOA09 atlas"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
+            self._extend(self.prj.ssp_reference, "reference")
+            return
 
-                if self.prj.ssp_woa is None:
-                    msg = "Functionality disabled: failure in WOA2009 lookup"
-                    dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()
-                    dlg.Destroy()
-                    return
+        atlas = self._atlas(self.prj.s.ssp_extension_source, Dicts.extension_sources)
+        if atlas == "RTOFS":
+            self._augment_from_rtofs("Querying RTOFS atlas for extension", self._extend)
+        elif atlas == "WOA09":
+            self._extend(self.prj.ssp_woa, atlas)
 
-                # And then extend by WOA
-                self.prj.ssp_data.extend(self.prj.ssp_woa, ext_type)
+    def _extend(self, cast, source):
+        self.journal.begin("extension", self.prj.ssp_data)
+        ext_type = self._get_pipeline().extend_with(cast, source)
+        self.journal.commit(self.prj.ssp_data)
+        self._profile_changed()
 
-            else:
-                raise SspError("unsupported extension source: %s" % self.prj.s.ssp_extension_source)
+        self._update_plot()
+        self.status_message = 'Profile extended using source type %s' % ext_type
 
+    def on_process_undo(self, evt):
+        edit = self.journal.undo(self.prj.ssp_data)
+        if edit is None:
+            self.status_message = "Nothing to undo"
+            return
+        self._profile_changed()
         self._update_plot()
 
-        msg = 'Profile extended to depth %d m using source type %s' \
-              % (self.prj.ssp_data.data[Dicts.idx['depth'], self.prj.ssp_data.data.shape[1] - 1], ext_type)
-        log.info(msg)
-        self.prj.ssp_data.modify_source_info("extension type %s" % ext_type)
-        self.status_message = 'Profile extended using source type %s' % ext_type
+        log.info("undo %s" % edit)
+        self.status_message = "Undone %s" % edit.name
+
+    def on_process_redo(self, evt):
+        edit = self.journal.redo(self.prj.ssp_data)
+        if edit is None:
+            self.status_message = "Nothing to redo"
+            return
+        self._profile_changed()
+        self._update_plot()
+
+        log.info("redo %s" % edit)
+        self.status_message = "Redone %s" % edit.name
 
     def on_process_preview_thinning(self, event):
         log.info("preview thinning")
+        own(self.prj.ssp_data)
         self.prj.ssp_data.prepare_sis_data(thin=True)
 
         self._update_plot()
@@ -1472,6 +1610,10 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
     def on_process_send_profile(self, evt):
 
+        if self.cast_sender.busy:
+            self.status_message = "Transmission in progress"
+            return
+
         if self.prj.s.auto_export_on_send and self.prj.count_export_formats() == 0:
             msg = "The selected 'auto-export' option requires selection of export formats from Export sub-menu.\n" \
                   "Send anyway or cancel?"
@@ -1520,6 +1662,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
             if corrector != 0.0:
                 log.info("applying corrector: %s %s" % (corrector, depth))
+                self.journal.begin("corrector", self.prj.ssp_data, rows=(Dicts.idx['speed'],))
 
                 if self.prj.surface_speed_applied:
                     idx = self.prj.ssp_data.data[Dicts.idx['depth'], :] > self.prj.ssp_applied_depth
@@ -1528,66 +1671,110 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
                 else:
                     self.prj.ssp_data.data[Dicts.idx['speed'], :] = \
                         self.prj.ssp_data.data[Dicts.idx['speed'], :] + corrector
+                self.journal.commit(self.prj.ssp_data)
+                self._profile_changed()
                 self.ref_monitor.set_corrector(0)
 
-        # loop through client list
-        success = True
-        fmt = None
-        for client in range(self.prj.s.client_list.num_clients):
+        if self.prj.s.sis_auto_apply_manual_casts:
+            fmt = Dicts.kng_formats['S01']
+        else:
+            fmt = Dicts.kng_formats['S12']
+
+        # the datagram is encoded once, then shared by the transmissions, the log and the auto-export
+        own(self.prj.ssp_data)
+        self.payloads.attach(self.prj.ssp_data)
+
+        # transmit to the clients in background, then summarize the outcomes in a single dialog
+        # (the profile cannot be changed until then, see MENUS_DISABLED_ON_SENDING)
+        ssp = self.prj.ssp_data
+        self.status_message = "Transmitting cast to %d clients" % self.prj.s.client_list.num_clients
+        self._update_status()
+        self.cast_sender.send(fmt, on_sent=self._on_cast_sent,
+                              on_done=lambda outcomes: self._on_casts_sent(fmt, ssp, outcomes))
+        self._update_state(self.state)
+
+    def _export_payload(self, fmt, payload):
+        """Store the transmitted datagram along with the auto-exported files"""
+        names = [name for name, value in Dicts.kng_formats.items() if value == fmt]
+        folder = self.prj.u.user_export_directory or self.prj.get_output_folder()
+        prefix = self.prj.u.user_filename_prefix or os.path.splitext(os.path.basename(self.prj.filename))[0]
+        path = os.path.join(folder, "%s_%s.txt" % (prefix, names[0] if names else fmt))
+        if not isinstance(payload, bytes):
+            payload = payload.encode("utf-8")
+        try:
+            with open(path, "wb") as fid:
+                fid.write(payload)
+        except IOError as e:
+            log.warning("unable to store the transmitted datagram in %s: %s" % (path, e))
+            return
+        log.info("transmitted datagram stored in %s" % path)
 
-            if self.prj.s.sis_auto_apply_manual_casts:
-                fmt = Dicts.kng_formats['S01']
+    def _on_cast_sent(self, client, sent):
+        if not self.prj.s.sis_auto_apply_manual_casts:
+            log.info("Transmitted cast to %s" % client.IP)
+        elif not sent:
+            log.info("Cannot confirm reception of profile for client %s" % client.IP)
+        elif client.protocol == "SIS":
+            log.info("Reception confirmed from " + client.IP)
+        else:
+            log.info("Transmitted cast to %s, confirm reception in %s" % (client.IP, client.protocol))
+        self.status_message = "Transmitted cast to %s" % client.IP
+        self._update_status()
+
+    def _on_casts_sent(self, fmt, ssp, outcomes):
+        self._update_state(self.state)  # the profile can be changed again
+
+        success = any(sent for _, sent in outcomes)
+        confirmed = [client for client, sent in outcomes if sent and (client.protocol == "SIS")]
+        to_confirm = [client for client, sent in outcomes if sent and (client.protocol != "SIS")]
+        unconfirmed = [client for client, sent in outcomes if not sent]
+
+        if self.prj.s.sis_auto_apply_manual_casts:
+            msg = ""
+            if len(confirmed) > 0:
+                msg += "SIS confirmed the SSP reception from: %s\n" % ", ".join([c.IP for c in confirmed])
+                if self.prj.has_sippican_to_process:
+                    self.prj.has_sippican_to_process = False
+                if self.prj.has_mvp_to_process:
+                    self.prj.has_mvp_to_process = False
+            for client in to_confirm:
+                msg += "Transmitted cast to %s, confirm reception in %s\n" % (client.IP, client.protocol)
+            if len(unconfirmed) > 0:
+                msg += "\nCannot confirm reception of profile for clients: %s, please check SIS:\n" \
+                       % ", ".join([c.IP for c in unconfirmed])
+                msg += "1) Check sound speed file name in SIS run-time parameters " \
+                       "and match date/time in SIS .asvp filename with cast date/time to ensure receipt\n"
+                msg += "2) Ensure SVP datagram is being distributed to these IPs " \
+                       "on port %d to enable future confirmations" % self.prj.s.km_listen_port
+                self.status_message = "Unconfirmed reception from %d clients" % len(unconfirmed)
+            elif len(confirmed) > 0:
+                self.status_message = "Reception confirmed!"
             else:
-                fmt = Dicts.kng_formats['S12']
-
-            msg = "Transmitting cast to %s" % self.prj.s.client_list.clients[client].IP
+                self.status_message = "Transmitted cast, confirm reception in the clients"
             log.info(msg)
-            self.status_message = msg
-            self._update_status()
-
-            success = self.prj.send_cast(self.prj.s.client_list.clients[client], fmt)
-
-            if self.prj.s.sis_auto_apply_manual_casts:
-                if success:
-                    if self.prj.s.client_list.clients[client].protocol == "SIS":
-                        log.info("Reception confirmed from " + self.prj.s.client_list.clients[client].IP)
-                        self.status_message = "Reception confirmed!"
-                        msg = "SIS confirmed the SSP reception!"
-                        dlg = wx.MessageDialog(None, msg, "SIS acknowledge", wx.OK)
-                        dlg.ShowModal()
-                        dlg.Destroy()
-                        if self.prj.has_sippican_to_process:
-                            self.prj.has_sippican_to_process = False
-                        if self.prj.has_mvp_to_process:
-                            self.prj.has_mvp_to_process = False
-                    else:
-                        self.status_message = "Transmitted cast, confirm reception in %s" % (
-                            self.prj.s.client_list.clients[client].protocol)
-                else:
-                    msg = "Cannot confirm reception of profile for client %s, please check SIS:\n" % (
-                        self.prj.s.client_list.clients[client].IP)
-                    msg += "1) Check sound speed file name in SIS run-time parameters " \
-                           "and match date/time in SIS .asvp filename with cast date/time to ensure receipt\n"
-                    msg += "2) Ensure SVP datagram is being distributed to this IP " \
-                           "on port %d to enable future confirmations" % self.prj.s.km_listen_port
-                    log.info(msg)
-                    dlg = wx.MessageDialog(None, msg, "Acknowledge", wx.OK | wx.ICON_ERROR)
-                    dlg.ShowModal()  # Show it
-                    dlg.Destroy()
-
-        if not self.prj.s.sis_auto_apply_manual_casts:
+            if msg:
+                icon = wx.ICON_ERROR if len(unconfirmed) > 0 else wx.ICON_INFORMATION
+                dlg = wx.MessageDialog(None, msg, "Acknowledge", wx.OK | icon)
+                dlg.ShowModal()  # Show it
+                dlg.Destroy()
+        else:
             msg = "Profile transmitted, SIS is waiting for operator confirmation."
             log.info(msg)
             dlg = wx.MessageDialog(None, msg, "Acknowledge", wx.OK)
             dlg.ShowModal()  # Show it
             dlg.Destroy()
 
-        msg = "Transmitted Data: %s" % self.prj.ssp_data.convert_km(fmt)
+        payload = ssp.convert_km(fmt)  # the encoded datagram of the transmissions
+        msg = "Transmitted Data: %s" % payload
         log.info(msg)
+        if self.prj.ssp_data is not ssp:
+            log.info("current profile changed during the transmission: no auto-export")
+            return
 
         # Now that we're done sending to clients, auto-export files if desired
         if self.prj.s.auto_export_on_send:
             self.prj.formats_export("USER")
+            self._export_payload(fmt, payload)
 
         if success:
             self.prj.time_of_last_tx = dt.datetime.utcnow()
@@ -1629,7 +1816,10 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             return
 
         log.info("restart processing")
+        own(self.prj.ssp_data)
         self.prj.ssp_data.restart_processing()
+        self.journal.clear()
+        self._profile_changed()
 
         self._update_plot()
 
@@ -1731,14 +1921,6 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.prj.filename = "%s_LocalDB" % self.prj.ssp_data.original_path
         self.prj.u.filename_prefix = os.path.splitext(self.prj.filename)[0]
 
-        self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = \
-            self.prj.woa09_atlas.query(self.prj.ssp_data.latitude, self.prj.ssp_data.longitude,
-                                       self.prj.ssp_data.date_time)
-
-        if self.prj.ssp_woa is not None:
-            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'salinity')
-            self.prj.ssp_data.replace_samples(self.prj.ssp_woa, 'temperature')
-
         self.prj.has_ssp_loaded = True
         self.prj.surface_speed_applied = False
         self.prj.ssp_applied_depth = 0
@@ -1751,6 +1933,8 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
         ssp_db.disconnect()
 
+        self._query_woa09_casts(with_temp_and_sal=True)
+
     # Delete
 
     def on_db_delete_internal(self, event):
@@ -1830,15 +2014,15 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
     def on_db_export_shp(self, event):
         log.info("exporting as shapefile")
-        self._db_export(GdalAux.ogr_formats[b'ESRI Shapefile'])
+        self._db_export(gdal_aux.GdalAux.ogr_formats[b'ESRI Shapefile'])
 
     def on_db_export_kml(self, event):
         log.info("exporting as kml")
-        self._db_export(GdalAux.ogr_formats[b'KML'])
+        self._db_export(gdal_aux.GdalAux.ogr_formats[b'KML'])
 
     def on_db_export_csv(self, event):
         log.info("exporting as csv")
-        self._db_export(GdalAux.ogr_formats[b'CSV'])
+        self._db_export(gdal_aux.GdalAux.ogr_formats[b'CSV'])
 
     @classmethod
     def _db_export(cls, ogr_format):
@@ -1876,22 +2060,14 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
     def on_tools_geo_monitor(self, evt):
         """Display a map with the profile position"""
-        if not self.geo_monitor:
+        if not self._get_geo_monitor():
             log.info("geo monitor not available")
             return
 
         # Request the current SVP cast from the clients prior. Take the first one that comes through.
-        self.prj.km_listener.ssp = None
-        for client in range(self.prj.s.client_list.num_clients):
-            log.info("Testing client %s for position ..." % self.prj.s.client_list.clients[client].IP)
-            self.prj.ssp_recipient_ip = self.prj.s.client_list.clients[client].IP
-            self.prj.get_cast_from_sis()
-            if self.prj.km_listener.ssp:
-                log.info("... got SSP > valid client")
-                break
-            else:
-                log.info("... not valid SSP > skip this client")
+        self._probe_sis("Requesting the current cast from SIS", self._on_geo_monitor_probed)
 
+    def _on_geo_monitor_probed(self):
         if not self.prj.km_listener.ssp:
             msg = "Unable to run the geo-monitor since no casts were retrieved from SIS clients"
             dlg = wx.MessageDialog(None, msg, "Clients issue", wx.OK | wx.ICON_ERROR)
@@ -1903,22 +2079,14 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
     def on_tools_refraction_monitor(self, evt):
         """Display a refraction monitor"""
-        if not self.ref_monitor:
+        if not self._get_ref_monitor():
             log.info("refraction monitor not available")
             return
 
         # Request the current SVP cast from the clients prior. Take the first one that comes through.
-        self.prj.km_listener.ssp = None
-        for client in range(self.prj.s.client_list.num_clients):
-            log.info("Testing client %s for position ..." % self.prj.s.client_list.clients[client].IP)
-            self.prj.ssp_recipient_ip = self.prj.s.client_list.clients[client].IP
-            self.prj.get_cast_from_sis()
-            if self.prj.km_listener.ssp:
-                log.info("... got SSP > valid client")
-                break
-            else:
-                log.info("... not valid SSP > skip this client")
+        self._probe_sis("Requesting the current cast from SIS", self._on_ref_monitor_probed)
 
+    def _on_ref_monitor_probed(self):
         if not self.prj.km_listener.ssp:
             msg = "Unable to run the ref-monitor since no casts were retrieved from SIS clients"
             dlg = wx.MessageDialog(None, msg, "Clients issue", wx.OK | wx.ICON_ERROR)
@@ -1947,6 +2115,8 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.ref_monitor.OnShow()
 
     def on_tools_user_inputs(self, evt):
+        if self.inputs_viewer is None:
+            self.inputs_viewer = userinputsviewer.UserInputsViewer(parent=self, ssp_user_inputs=self.prj.u)
         self.inputs_viewer.OnShow()
 
     def on_tools_modify_settings(self, evt):
@@ -1954,6 +2124,8 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self.settings_tool.Show()
 
     def on_tools_view_settings(self, evt):
+        if self.settings_viewer is None:
+            self.settings_viewer = settingsviewer.SettingsViewer(self.prj.s)
         self.settings_viewer.OnShow()
 
     def on_tools_reload_settings(self, evt):
@@ -2002,7 +2174,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             dlg.Destroy()
             return
 
-        self.prj.server.set_refraction_monitor(self.ref_monitor)
+        self.prj.server.set_refraction_monitor(self._get_ref_monitor())
         threading.Thread(target=self.prj.server.run).start()
 
         # Now set up a timer for cast plot updates
@@ -2051,13 +2223,56 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         else:
             self.prj.deactivate_server_logging_on_db()
 
+    # ### RTOFS CACHE ###
+
+    def on_tools_rtofs_prefetch(self, event):
+        """Store on disk the RTOFS casts around the current position"""
+        if not self._rtofs_available() or self.rtofs_cache.offline:
+            msg = "Functionality disabled: RTOFS atlas not loaded or offline mode"
+            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+
+        if self.prj.has_ssp_loaded:
+            latitude, longitude = self.prj.ssp_data.latitude, self.prj.ssp_data.longitude
+        elif self.prj.km_listener and self.prj.km_listener.nav:
+            latitude, longitude = self.prj.km_listener.nav.latitude, self.prj.km_listener.nav.longitude
+        else:
+            msg = "A position is required: load a profile or receive SIS navigation"
+            dlg = wx.MessageDialog(None, msg, "Error", wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+
+        margin = self.rtofs_prefetch_margin
+
+        def on_result(atlas_query):
+            try:
+                self.status_message = "Prefetched %d RTOFS casts" % atlas_query.result()
+            except SspError as e:
+                log.info("failure in RTOFS prefetch: %s" % e)
+                self.status_message = "Failure in RTOFS prefetch"
+
+        log.info("prefetching RTOFS around %.4f, %.4f" % (latitude, longitude))
+        prefetch = self._query_atlas("Prefetching RTOFS casts", on_result, self.rtofs_cache.prefetch,
+                                     latitude - margin, latitude + margin, longitude - margin, longitude + margin,
+                                     dt.datetime.utcnow(), lambda: prefetch.cancelled())
+
+    def on_tools_rtofs_offline(self, event):
+        """Serve the RTOFS casts only from the on-disk cache"""
+        self.rtofs_cache.offline = self.ToolsRtofsOffline.IsChecked()
+        log.info("RTOFS offline mode: %s" % self.rtofs_cache.offline)
+        self.status_message = "RTOFS offline mode %s" % ("on" if self.rtofs_cache.offline else "off")
+
     # ### REF CAST ###
 
     def on_tools_set_reference_cast(self, evt):
         """set a reference cast"""
         log.info("set as reference cast:\n%s" % self.prj.ssp_data)
 
-        self.prj.ssp_reference = copy.deepcopy(self.prj.ssp_data)
+        # the arrays are shared until the current profile is edited
+        self.prj.ssp_reference = snapshot(self.prj.ssp_data)
         self.prj.ssp_reference_filename = self.prj.filename
 
         self._update_plot()
@@ -2077,14 +2292,11 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             self.prj.clean_project()
             self.clear_app()
 
-        self.prj.ssp_data = copy.deepcopy(self.prj.ssp_reference)
+        self.prj.ssp_data = snapshot(self.prj.ssp_reference)
         self.prj.filename = self.prj.ssp_reference_filename
         self.prj.u.filename_prefix = os.path.splitext(self.prj.filename)[0]
 
-        self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = self.prj.woa09_atlas.query(
-            self.prj.ssp_data.latitude,
-            self.prj.ssp_data.longitude,
-            self.prj.ssp_data.date_time)
+        self.prj.ssp_woa, self.prj.ssp_woa_min, self.prj.ssp_woa_max = None, None, None
         self.prj.has_ssp_loaded = True
 
         self.prj.surface_speed_applied = False
@@ -2094,6 +2306,8 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         self._update_plot()
         self.status_message = "Loaded %s" % self.prj.filename
 
+        self._query_woa09_casts()
+
     def on_tools_clear_reference_cast(self, evt):
         self.prj.ssp_reference = None
         self.prj.ssp_reference_filename = None
@@ -2190,7 +2404,33 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             return
 
     def get_position(self):
-        """Ask user for position, if not available"""
+        """Resolve the position from the cast context (SIS navigation, last user entry), or ask user for it"""
+        latitude, longitude, source = self.cast_context.position()
+        if source is None:
+            return self.ask_position()
+
+        log.info("cast position %s %s from %s" % (latitude, longitude, source))
+        self.cast_sources.append("position from %s" % source)
+        return [latitude, longitude]
+
+    def get_date(self):
+        """Resolve the date from the cast context (SIS navigation), or ask user for it"""
+        date, source = self.cast_context.date()
+        if source is None:
+            return self.ask_date()
+
+        log.info("cast date %s from %s" % (date, source))
+        self.cast_sources.append("date from %s" % source)
+        return date
+
+    def _cast_sources_note(self):
+        """Return (and reset) the note about the sources of the resolved cast positions and dates"""
+        note = " (%s)" % ", ".join(self.cast_sources) if self.cast_sources else ""
+        self.cast_sources = list()
+        return note
+
+    def ask_position(self):
+        """Ask user for position"""
         latitude = None
         longitude = None
 
@@ -2206,6 +2446,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
                 longitude = self.prj.km_listener.nav.longitude
                 msg = 'User set cast position %lf %lf from SIS input' % (latitude, longitude)
                 log.info(msg)
+                self.cast_sources.append("position from SIS")
 
             elif result == wx.ID_NO:
                 latitude = None
@@ -2248,11 +2489,13 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
 
             msg = 'Manual user input position: %lf %lf' % (latitude, longitude)
             log.info(msg)
+            self.cast_sources.append("position from user input")
+            self.cast_context.remember(latitude, longitude)
 
         return [latitude, longitude]
 
-    def get_date(self):
-        """Ask user for date, if not available"""
+    def ask_date(self):
+        """Ask user for date"""
 
         # SIS specific
         if self.prj.km_listener.nav:
@@ -2266,6 +2509,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
                 if date:
                     msg = 'Cast date %s from SIS input' % date
                     log.info(msg)
+                    self.cast_sources.append("date from SIS")
                     return date
                 else:
                     msg = 'Invalid date in SIS datagram'
@@ -2280,6 +2524,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
             date = dt.datetime.utcnow()
             msg = 'User set cast date %s from computer clock' % date
             log.info(msg)
+            self.cast_sources.append("date from machine clock")
             return date
 
         # user input date / time
@@ -2310,6 +2555,7 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
                                        int(cast_time[0:2]), int(cast_time[3:5]), int(cast_time[6:8]), 0)
                     msg = 'User input cast date %s' % date
                     log.info(msg)
+                    self.cast_sources.append("date from user input")
                     return date
                 except ValueError:
                     pass
@@ -2350,10 +2596,20 @@ class SSPManager(sspmanager_ui.SSPManagerBase):
         else:
             raise SspError("Passed wrong state type: %s is %s" % (state, type(state)))
 
+        if self.cast_sender.busy:
+            for item in sspmanager_ui.MENUS_DISABLED_ON_SENDING:
+                self.GetMenuBar().FindItemById(item).Enable(False)
+
         self.state = state
 
     def _update_status(self):
         """Provide info from SIS to the user through status bar"""
+        sis_values = (self.prj.mean_depth, self.prj.surface_sound_speed, self.prj.vessel_draft)
+        self._update_status_worker()
+        if sis_values != (self.prj.mean_depth, self.prj.surface_sound_speed, self.prj.vessel_draft):
+            self._update_plot('depth')
+
+    def _update_status_worker(self):
 
         self.frame_statusbar.SetStatusText(self.status_message, 0)
 
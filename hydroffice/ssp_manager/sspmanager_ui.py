@@ -44,6 +44,10 @@ MENU_FILE_EXPORT_UNB = wx.NewId()
 MENU_FILE_EXPORT_ELAC = wx.NewId()
 MENU_FILE_EXPORT_CSV = wx.NewId()
 MENU_FILE_EXPORT_CAST = wx.NewId()
+MENU_FILE_WATCH = wx.NewId()
+MENU_FILE_WATCH_ADD = wx.NewId()
+MENU_FILE_WATCH_OPEN = wx.NewId()
+MENU_FILE_WATCH_STOP = wx.NewId()
 MENU_FILE_CLEAR = wx.NewId()
 MENU_FILE_EXIT = wx.NewId()
 
@@ -62,6 +66,8 @@ MENU_PROC_LOAD_TEMP_SAL = wx.NewId()
 MENU_PROC_LOAD_SURFSP = wx.NewId()
 MENU_PROC_EXTEND_CAST = wx.NewId()
 MENU_PROC_INSPECTION = wx.NewId()
+MENU_PROC_UNDO = wx.NewId()
+MENU_PROC_REDO = wx.NewId()
 MENU_PROC_PREVIEW_THINNING = wx.NewId()
 MENU_PROC_SEND_PROFILE = wx.NewId()
 MENU_PROC_STORE_SSP = wx.NewId()
@@ -95,6 +101,9 @@ MENU_TOOLS_RELOAD_SETTINGS = wx.NewId()
 MENU_TOOLS_USER_INPUTS = wx.NewId()
 MENU_TOOLS_REF_MON = wx.NewId()
 MENU_TOOLS_GEO_MONITOR = wx.NewId()
+MENU_TOOLS_RTOFS = wx.NewId()
+MENU_TOOLS_RTOFS_PREFETCH = wx.NewId()
+MENU_TOOLS_RTOFS_OFFLINE = wx.NewId()
 
 MENU_SERVER_START = wx.NewId()
 MENU_SERVER_SEND = wx.NewId()
@@ -111,10 +120,11 @@ MENUS_ALL = (MENU_FILE_IMP, MENU_FILE_IMP_CASTAWAY, MENU_FILE_IMP_DIGIBAR, MENU_
              MENU_FILE_EXPORT, MENU_FILE_EXPORT_CAST,
              MENU_FILE_EXPORT_ASVP, MENU_FILE_EXPORT_PRO, MENU_FILE_EXPORT_HIPS, MENU_FILE_EXPORT_IXBLUE,
              MENU_FILE_EXPORT_VEL, MENU_FILE_EXPORT_UNB, MENU_FILE_EXPORT_ELAC, MENU_FILE_EXPORT_CSV,
-             MENU_FILE_CLEAR,
+             MENU_FILE_WATCH, MENU_FILE_CLEAR,
              MENU_VIEW_RESET, MENU_VIEW_HIDE_WOA, MENU_VIEW_HIDE_FLAGGED, MENU_VIEW_HIDE_DEPTH,
              MENU_PROC_LOAD_SAL, MENU_PROC_LOAD_TEMP_SAL, MENU_PROC_LOAD_SURFSP, MENU_PROC_EXTEND_CAST,
              MENU_PROC_INSPECTION, MENU_PROC_INS_ZOOM, MENU_PROC_INS_FLAG, MENU_PROC_INS_UNFLAG, MENU_PROC_INS_INSERT,
+             MENU_PROC_UNDO, MENU_PROC_REDO,
              # MENU_PROC_EXPRESS,
              MENU_PROC_PREVIEW_THINNING, MENU_PROC_SEND_PROFILE,
              MENU_PROC_STORE_SSP, MENU_PROC_REDO_SSP, MENU_PROC_LOG_METADATA,
@@ -134,6 +144,7 @@ MENUS_DISABLED_ON_CLOSED = (
     MENU_PROC_LOAD_SAL, MENU_PROC_LOAD_TEMP_SAL, MENU_PROC_LOAD_SURFSP,
     MENU_PROC_EXTEND_CAST, MENU_PROC_INSPECTION,
     MENU_PROC_INS_ZOOM, MENU_PROC_INS_FLAG, MENU_PROC_INS_INSERT, MENU_PROC_INS_UNFLAG,
+    MENU_PROC_UNDO, MENU_PROC_REDO,
     MENU_PROC_PREVIEW_THINNING, MENU_PROC_SEND_PROFILE,
     MENU_PROC_STORE_SSP, MENU_PROC_REDO_SSP,
     # MENU_PROC_EXPRESS,
@@ -146,18 +157,33 @@ MENUS_DISABLED_ON_SERVER = (
     MENU_FILE_IMP,  # all import
     MENU_FILE_QUERY,  # all query
     MENU_FILE_EXPORT,  # all export
+    MENU_FILE_WATCH,  # all drop folders
     MENU_FILE_CLEAR,
     MENU_PROC_LOG_METADATA, MENU_TOOLS_SET_REFERENCE_CAST, MENU_TOOLS_EDIT_REFERENCE_CAST,
     MENU_TOOLS_CLEAR_REFERENCE_CAST, MENU_FILE_IMP_DIGI_S, MENU_FILE_IMP_SEABIRD,
     # MENU_PROC_EXPRESS,
     MENU_PROC_LOAD_SAL, MENU_PROC_LOAD_TEMP_SAL, MENU_PROC_LOAD_SURFSP, MENU_PROC_EXTEND_CAST,
     MENU_PROC_INSPECTION, MENU_PROC_PREVIEW_THINNING, MENU_PROC_SEND_PROFILE, MENU_PROC_REDO_SSP,
+    MENU_PROC_UNDO, MENU_PROC_REDO,
     MENU_DB_QUERY,
     MENU_DB_DELETE,
     MENU_DB_EXPORT,
     MENU_DB_PLOT,
     MENU_SERVER_START)
 
+# while a cast is transmitted in background, the profile cannot be changed, replaced or cleared
+MENUS_DISABLED_ON_SENDING = (
+    MENU_FILE_IMP,  # all import
+    MENU_FILE_QUERY,  # all query
+    MENU_FILE_EXPORT,  # all export
+    MENU_FILE_WATCH,  # all drop folders
+    MENU_FILE_CLEAR,
+    MENU_PROC_LOAD_SAL, MENU_PROC_LOAD_TEMP_SAL, MENU_PROC_LOAD_SURFSP, MENU_PROC_EXTEND_CAST,
+    MENU_PROC_INSPECTION, MENU_PROC_PREVIEW_THINNING, MENU_PROC_SEND_PROFILE, MENU_PROC_REDO_SSP,
+    MENU_PROC_UNDO, MENU_PROC_REDO,
+    MENU_TOOLS_EDIT_REFERENCE_CAST,
+    MENU_SERVER_START)
+
 
 class SSPManagerBase(wx.Frame):
     def __init__(self, *args, **kwds):
@@ -261,6 +287,22 @@ class SSPManagerBase(wx.Frame):
         self.FileMenu.AppendMenu(MENU_FILE_EXPORT, "Export SSP", FileExp,
                                  "Export the current SSP")
 
+        # File / Drop folders
+        FileWatch = wx.Menu()
+        self.FileWatchAdd = wx.MenuItem(FileWatch, MENU_FILE_WATCH_ADD, "Watch folder",
+                                        "Automatically import and process the new casts in a folder",
+                                        wx.ITEM_NORMAL)
+        FileWatch.AppendItem(self.FileWatchAdd)
+        self.FileWatchOpen = wx.MenuItem(FileWatch, MENU_FILE_WATCH_OPEN, "Open staged cast",
+                                         "Open the oldest of the processed casts from the drop folders",
+                                         wx.ITEM_NORMAL)
+        FileWatch.AppendItem(self.FileWatchOpen)
+        self.FileWatchStop = wx.MenuItem(FileWatch, MENU_FILE_WATCH_STOP, "Stop watching",
+                                         "Stop watching all the drop folders", wx.ITEM_NORMAL)
+        FileWatch.AppendItem(self.FileWatchStop)
+        self.FileMenu.AppendMenu(MENU_FILE_WATCH, "Drop folders", FileWatch,
+                                 "Automatic import of the casts from drop folders")
+
         self.FileClear = wx.MenuItem(self.FileMenu, MENU_FILE_CLEAR, "Clear",
                                      "Clear the loaded cast", wx.ITEM_NORMAL)
         self.FileMenu.AppendItem(self.FileClear)
@@ -320,6 +362,12 @@ class SSPManagerBase(wx.Frame):
         self.ProcessInspection.AppendItem(self.PlotInsert)
         self.ProcessMenu.AppendMenu(MENU_PROC_INSPECTION, "Visual inspection", self.ProcessInspection,
                                     "Visual inspection of the resulting profile")
+        self.ProcessUndo = wx.MenuItem(self.ProcessMenu, MENU_PROC_UNDO, "Undo edit\tCtrl+Z",
+                                       "Undo the last edit of the profile", wx.ITEM_NORMAL)
+        self.ProcessMenu.AppendItem(self.ProcessUndo)
+        self.ProcessRedo = wx.MenuItem(self.ProcessMenu, MENU_PROC_REDO, "Redo edit\tCtrl+Y",
+                                       "Redo the last undone edit of the profile", wx.ITEM_NORMAL)
+        self.ProcessMenu.AppendItem(self.ProcessRedo)
         self.ProcessMenu.AppendSeparator()
         self.ProcessPreviewThinning = wx.MenuItem(self.ProcessMenu, MENU_PROC_PREVIEW_THINNING, "Preview thinning",
                                                   "Preview the thinning required by some client types", wx.ITEM_NORMAL)
@@ -435,6 +483,16 @@ class SSPManagerBase(wx.Frame):
         ReferenceMenu.AppendItem(self.ToolsClearReferenceCast)
         self.ToolsMenu.AppendMenu(MENU_TOOLS_REFERENCE, "Reference cast", ReferenceMenu,
                                   "Actions about a reference cast")
+        RtofsMenu = wx.Menu()
+        self.ToolsRtofsPrefetch = wx.MenuItem(RtofsMenu, MENU_TOOLS_RTOFS_PREFETCH, "Prefetch around position",
+                                              "Store on disk the RTOFS data around the current position",
+                                              wx.ITEM_NORMAL)
+        RtofsMenu.AppendItem(self.ToolsRtofsPrefetch)
+        self.ToolsRtofsOffline = wx.MenuItem(RtofsMenu, MENU_TOOLS_RTOFS_OFFLINE, "Offline mode",
+                                             "Only use the RTOFS data stored on disk", wx.ITEM_CHECK)
+        RtofsMenu.AppendItem(self.ToolsRtofsOffline)
+        self.ToolsMenu.AppendMenu(MENU_TOOLS_RTOFS, "RTOFS cache", RtofsMenu,
+                                  "Actions about the RTOFS on-disk cache")
         self.ToolsMenu.AppendSeparator()
         self.ToolsUserInputs = wx.MenuItem(self.ToolsMenu, MENU_TOOLS_USER_INPUTS, "Monitor user inputs",
                                            "Provide information about user inputs", wx.ITEM_NORMAL)
@@ -491,6 +549,9 @@ class SSPManagerBase(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_file_export_unb, self.FileExpUnb)
         self.Bind(wx.EVT_MENU, self.on_file_export_elac, self.FileExpElac)
         self.Bind(wx.EVT_MENU, self.on_file_export_csv, self.FileExpCsv)
+        self.Bind(wx.EVT_MENU, self.on_file_watch_add, self.FileWatchAdd)
+        self.Bind(wx.EVT_MENU, self.on_file_watch_open, self.FileWatchOpen)
+        self.Bind(wx.EVT_MENU, self.on_file_watch_stop, self.FileWatchStop)
         self.Bind(wx.EVT_MENU, self.on_file_clear, self.FileClear)
         self.Bind(wx.EVT_MENU, self.on_file_exit, self.FileExit)
 
@@ -508,6 +569,8 @@ class SSPManagerBase(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_process_load_temp_and_sal, self.ProcessLoadTempSal)
         self.Bind(wx.EVT_MENU, self.on_process_load_surface_ssp, self.ProcessLoadSurfSpeed)
         self.Bind(wx.EVT_MENU, self.on_process_extend, self.ProcessExtend)
+        self.Bind(wx.EVT_MENU, self.on_process_undo, self.ProcessUndo)
+        self.Bind(wx.EVT_MENU, self.on_process_redo, self.ProcessRedo)
         self.Bind(wx.EVT_MENU, self.on_process_preview_thinning, self.ProcessPreviewThinning)
         self.Bind(wx.EVT_MENU, self.on_process_send_profile, self.ProcessSendProfile)
         self.Bind(wx.EVT_MENU, self.on_process_store_db, self.ProcessStoreDb)
@@ -535,6 +598,8 @@ class SSPManagerBase(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_tools_set_reference_cast, self.ToolsSetReferenceCast)
         self.Bind(wx.EVT_MENU, self.on_tools_edit_reference_cast, self.ToolsEditReferenceCast)
         self.Bind(wx.EVT_MENU, self.on_tools_clear_reference_cast, self.ToolsClearReferenceCast)
+        self.Bind(wx.EVT_MENU, self.on_tools_rtofs_prefetch, self.ToolsRtofsPrefetch)
+        self.Bind(wx.EVT_MENU, self.on_tools_rtofs_offline, self.ToolsRtofsOffline)
         self.Bind(wx.EVT_MENU, self.on_tools_user_inputs, self.ToolsUserInputs)
         self.Bind(wx.EVT_MENU, self.on_tools_modify_settings, self.ToolsModifySettings)
         self.Bind(wx.EVT_MENU, self.on_tools_view_settings, self.ToolsViewSettings)
@@ -660,6 +725,18 @@ class SSPManagerBase(wx.Frame):
         log.info("Event handler 'on_file_export_csv' not implemented!")
         event.Skip()
 
+    def on_file_watch_add(self, event):
+        log.info("Event handler 'on_file_watch_add' not implemented!")
+        event.Skip()
+
+    def on_file_watch_open(self, event):
+        log.info("Event handler 'on_file_watch_open' not implemented!")
+        event.Skip()
+
+    def on_file_watch_stop(self, event):
+        log.info("Event handler 'on_file_watch_stop' not implemented!")
+        event.Skip()
+
     def on_file_clear(self, event):
         log.info("Event handler 'on_file_clear' not implemented!")
         event.Skip()
@@ -708,6 +785,14 @@ class SSPManagerBase(wx.Frame):
         log.info("Event handler 'on_tools_geo_monitor' not implemented!")
         event.Skip()
 
+    def on_tools_rtofs_prefetch(self, event):
+        log.info("Event handler 'on_tools_rtofs_prefetch' not implemented!")
+        event.Skip()
+
+    def on_tools_rtofs_offline(self, event):
+        log.info("Event handler 'on_tools_rtofs_offline' not implemented!")
+        event.Skip()
+
     # def on_process_express_mode(self, event):
     # log.info("Event handler `OnToolsExpress' not implemented!")
     #     event.Skip()
@@ -728,6 +813,14 @@ class SSPManagerBase(wx.Frame):
         log.info("Event handler 'on_process_extend' not implemented!")
         event.Skip()
 
+    def on_process_undo(self, event):
+        log.info("Event handler 'on_process_undo' not implemented!")
+        event.Skip()
+
+    def on_process_redo(self, event):
+        log.info("Event handler 'on_process_redo' not implemented!")
+        event.Skip()
+
     def on_process_preview_thinning(self, event):
         log.info("Event handler 'on_process_preview_thinning' not implemented!")
         event.Skip()
@@ -0,0 +1,32 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class PhaseTimer(object):
+    """Collect the durations of the named phases of an activity (e.g., the application startup)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.phases = list()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start))
+
+    def report(self):
+        """Return a textual report with the duration of each phase"""
+        lines = ["%s:" % self.name]
+        for name, duration in self.phases:
+            lines.append("  %-32s %7.3f s" % (name, duration))
+        lines.append("  %-32s %7.3f s" % ("total", time.time() - self.start))
+        return "\n".join(lines)
@@ -0,0 +1,182 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime as dt
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class TrackStore(object):
+    """Bounded, array-backed storage of the vessel track
+
+    The positions (with time and surface sound speed) are stored in growable NumPy arrays. The projected
+    coordinates are cached, so that only the new positions have to be projected. When the track exceeds
+    'max_points', the old part (all but the last 'recent_points' positions) is thinned: a position is kept
+    only when it starts a new 'min_distance' step along the track or a new 'min_interval' time step.
+    """
+    epoch = dt.datetime(1970, 1, 1)
+    earth_radius = 6371000.0
+
+    def __init__(self, capacity=1024, max_points=20000, recent_points=2000, min_distance=1000.0,
+                 min_interval=600.0):
+        self.max_points = max_points
+        self.recent_points = recent_points
+        self.min_distance = min_distance  # [m]
+        self.min_interval = min_interval  # [s]
+
+        self.time = np.zeros(capacity)
+        self.latitude = np.zeros(capacity)
+        self.longitude = np.zeros(capacity)
+        self.ssp = np.zeros(capacity)
+        self.size = 0
+        self.appended = 0  # total number of appended positions (never decreased by thinning)
+
+        # projected coordinates cache
+        self._proj = None
+        self._x = np.zeros(capacity)
+        self._y = np.zeros(capacity)
+        self._projected = 0
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = int(np.ceil(self.time.shape[0] * 1.5))
+        for name in ['time', 'latitude', 'longitude', 'ssp', '_x', '_y']:
+            old = getattr(self, name)
+            new = np.zeros(capacity)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+
+    def append(self, time, latitude, longitude, ssp=None):
+        """Append a position; 'time' is a datetime, 'ssp' the surface sound speed (NaN if not passed)"""
+        if self.size == self.time.shape[0]:
+            self._grow()
+
+        idx = self.size
+        self.time[idx] = (time - self.epoch).total_seconds()
+        self.latitude[idx] = latitude
+        self.longitude[idx] = longitude
+        self.ssp[idx] = np.nan if ssp is None else ssp
+        self.size += 1
+        self.appended += 1
+
+        if self.size > self.max_points:
+            self.thin()
+
+    def clear(self):
+        self.size = 0
+        self._projected = 0
+
+    def distances(self, start=0, end=None):
+        """Distances [m] between consecutive positions (equirectangular approximation)"""
+        end = self.size if end is None else end
+        lat = np.radians(self.latitude[start:end])
+        lon = np.radians(self.longitude[start:end])
+        d_lon = (np.diff(lon) + np.pi) % (2.0 * np.pi) - np.pi
+        d_x = d_lon * np.cos((lat[1:] + lat[:-1]) / 2.0)
+        return self.earth_radius * np.hypot(d_x, np.diff(lat))
+
+    def thin(self):
+        """Thin the old part of the track, until the track is within 'max_points'"""
+        min_distance = self.min_distance
+        min_interval = self.min_interval
+        while self.size > self.max_points:
+            nr_old = self.size - self.recent_points
+            if nr_old < 2:
+                break
+
+            along = np.concatenate(([0.0], np.cumsum(self.distances(0, nr_old))))
+            distance_steps = np.floor(along / min_distance)
+            time_steps = np.floor((self.time[:nr_old] - self.time[0]) / min_interval)
+            keep = np.ones(self.size, dtype=bool)
+            keep[1:nr_old] = (np.diff(distance_steps) != 0) | (np.diff(time_steps) != 0)
+
+            nr_kept = np.count_nonzero(keep)
+            log.debug("track thinning: %d -> %d positions" % (self.size, nr_kept))
+            for name in ['time', 'latitude', 'longitude', 'ssp']:
+                array = getattr(self, name)
+                array[:nr_kept] = array[:self.size][keep]
+            if self._projected > 0:
+                projected = keep[:self._projected]
+                nr_projected = np.count_nonzero(projected)
+                self._x[:nr_projected] = self._x[:self._projected][projected]
+                self._y[:nr_projected] = self._y[:self._projected][projected]
+                self._projected = nr_projected
+            self.size = nr_kept
+
+            # coarser policy for the next pass (if still needed)
+            min_distance *= 2.0
+            min_interval *= 2.0
+
+    def projected(self, proj):
+        """Return the track coordinates projected by 'proj' (e.g., a Basemap instance)
+
+        Only the positions added after the last call are projected, unless the projection has changed.
+        """
+        if proj is not self._proj:
+            self._proj = proj
+            self._projected = 0
+
+        if self._projected < self.size:
+            x, y = proj(self.longitude[self._projected:self.size], self.latitude[self._projected:self.size])
+            self._x[self._projected:self.size] = x
+            self._y[self._projected:self.size] = y
+            self._projected = self.size
+
+        return self._x[:self.size], self._y[:self.size]
+
+    def data(self):
+        """Return latitudes, longitudes and surface sound speeds of the stored positions"""
+        return self.latitude[:self.size], self.longitude[:self.size], self.ssp[:self.size]
+
+
+class SpeedGrid(object):
+    """Spatially binned mean of the surface sound speed, on a regular grid of projected coordinates
+
+    The samples are accumulated as per-cell sums and counts, so that the grid can be incrementally updated.
+    """
+
+    def __init__(self, x_min, x_max, y_min, y_max, resolution=200):
+        self.extent = (x_min, x_max, y_min, y_max)
+        # the longest side gets 'resolution' cells, the other one is scaled to get ~square cells
+        width = x_max - x_min
+        height = y_max - y_min
+        if width >= height:
+            self.nx = resolution
+            self.ny = max(1, int(round(resolution * height / width)))
+        else:
+            self.ny = resolution
+            self.nx = max(1, int(round(resolution * width / height)))
+        self.sums = np.zeros((self.ny, self.nx))
+        self.counts = np.zeros((self.ny, self.nx), dtype=np.int64)
+
+    def add(self, x, y, ssp):
+        """Accumulate the sound speed samples at the projected coordinates x, y"""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        ssp = np.asarray(ssp, dtype=np.float64)
+        x_min, x_max, y_min, y_max = self.extent
+
+        valid = np.isfinite(x) & np.isfinite(y) & np.isfinite(ssp) \
+            & (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)
+        if not np.any(valid):
+            return
+        col = np.minimum(((x[valid] - x_min) / (x_max - x_min) * self.nx).astype(np.int64), self.nx - 1)
+        row = np.minimum(((y[valid] - y_min) / (y_max - y_min) * self.ny).astype(np.int64), self.ny - 1)
+        np.add.at(self.sums, (row, col), ssp[valid])
+        np.add.at(self.counts, (row, col), 1)
+
+    def mean(self):
+        """Return the mean sound speed per cell, masked where no samples are present"""
+        empty = self.counts == 0
+        return np.ma.masked_array(self.sums / np.maximum(self.counts, 1), mask=empty)
+
+    def speed_range(self):
+        """Return the min and max of the binned sound speed (None if the grid is empty)"""
+        if not np.any(self.counts):
+            return None
+        mean = self.mean()
+        return mean.min(), mean.max()
@@ -0,0 +1,207 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from .batch import cast_formats, cast_format
+
+log = logging.getLogger(__name__)
+
+
+class DropFolderWatcher(object):
+    """Watch drop folders for new cast files, and process them in background
+
+    The folders are polled every 'interval' seconds. A new file is ready once its size and modification time
+    did not change for 'settle' seconds (so that the partially written files are not read).
+
+    The ready files wait in a bounded queue for the 'process(path, input_format)' callable, run by a single
+    background thread. The results wait in a bounded queue of staged casts, until taken with next_staged().
+    When the staged casts are not taken, the processing stops and then the polling stops queueing the new
+    files (backpressure): these files are only delayed, never dropped.
+
+    The 'on_staged(path)' and 'on_failed(path, error)' callbacks are called through 'dispatch'
+    (e.g., wx.CallAfter).
+
+    Stopping does not wait for the file being processed. The files still waiting to be processed (and the one
+    being processed) are found again by the polling once the watcher is restarted. The 'process' calls are run
+    one at a time, also when a stopped processing thread is still completing its file after a restart.
+    """
+
+    def __init__(self, process, on_staged=None, on_failed=None, input_formats=None, interval=1.0, settle=2.0,
+                 max_ready=8, max_staged=4, dispatch=None):
+        self.process = process
+        self.on_staged = on_staged
+        self.on_failed = on_failed
+        self.formats = cast_formats(input_formats)
+        self.interval = interval
+        self.settle = settle
+        self.dispatch = dispatch
+        self.folders = list()
+        self._pending = dict()  # path: ((size, modification time), first time with this signature)
+        self._seen = set()
+        self._ready = queue.Queue(max_ready)
+        self._staged = queue.Queue(max_staged)
+        self._throttled = False
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()  # the processing threads share the 'process' state (e.g., project)
+        self._stop = threading.Event()  # a new one at each start, so that the threads of a stopped run just end
+        self._threads = list()
+
+    def add_folder(self, folder):
+        """Watch a folder (its current files are ignored, only the new ones are processed)"""
+        folder = os.path.abspath(folder)
+        with self._lock:
+            if folder in self.folders:
+                return
+            for path in self._listdir(folder):
+                self._seen.add(path)
+            self.folders.append(folder)
+        log.info("watching %s" % folder)
+
+    @property
+    def running(self):
+        return len(self._threads) > 0
+
+    def start(self):
+        if self.running:
+            return
+        self._stop = threading.Event()
+        for target in (self._poll_loop, self._process_loop):
+            thread = threading.Thread(target=target, args=(self._stop, ))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the polling and the processing (without waiting for the file being processed)"""
+        self._stop.set()
+        self._threads = list()
+
+        # the files not yet processed will be queued again by the polling
+        while True:
+            try:
+                path, _ = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            self._requeue(path)
+
+    def _requeue(self, path):
+        with self._lock:
+            self._seen.discard(path)
+            self._pending.pop(path, None)
+
+    def staged_count(self):
+        return self._staged.qsize()
+
+    def next_staged(self):
+        """Return the oldest staged cast as (path, result), or None"""
+        try:
+            return self._staged.get_nowait()
+        except queue.Empty:
+            return None
+
+    # polling
+
+    @staticmethod
+    def _listdir(folder):
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError as e:
+            log.warning("unable to list %s: %s" % (folder, e))
+            return list()
+        return [os.path.join(folder, name) for name in names]
+
+    def _poll_loop(self, stop):
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.interval)
+
+    def poll(self):
+        """Queue the new files that are settled, until the queue is full"""
+        now = time.time()
+        with self._lock:
+            folders = list(self.folders)
+
+        for folder in folders:
+            for path in self._listdir(folder):
+                if path in self._seen:
+                    continue
+                input_format = cast_format(path, self.formats)
+                if input_format is None:
+                    self._seen.add(path)
+                    continue
+
+                try:
+                    stat = os.stat(path)
+                except OSError:  # removed in the meanwhile
+                    self._pending.pop(path, None)
+                    continue
+                signature = (stat.st_size, stat.st_mtime)
+                pending = self._pending.get(path)
+                if (pending is None) or (pending[0] != signature):
+                    self._pending[path] = (signature, now)
+                    continue
+                if (stat.st_size == 0) or (now - pending[1] < self.settle):
+                    continue
+
+                try:
+                    self._ready.put_nowait((path, input_format))
+                except queue.Full:
+                    if not self._throttled:
+                        log.info("processing queue full, new casts are delayed")
+                        self._throttled = True
+                    return
+                self._throttled = False
+                del self._pending[path]
+                self._seen.add(path)
+
+    # processing
+
+    def _notify(self, callback, *args):
+        if callback is None:
+            return
+        if self.dispatch is None:
+            callback(*args)
+        else:
+            self.dispatch(callback, *args)
+
+    def _process_loop(self, stop):
+        while not stop.is_set():
+            try:
+                path, input_format = self._ready.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            if stop.is_set():  # stopped while waiting
+                self._requeue(path)
+                return
+
+            with self._process_lock:
+                if stop.is_set():  # stopped while waiting for the previous processing thread
+                    self._requeue(path)
+                    return
+                start = time.time()
+                try:
+                    result = self.process(path, input_format)
+                except Exception as e:
+                    log.warning("failure in processing %s: %s" % (path, e))
+                    self._notify(self.on_failed, path, e)
+                    continue
+            log.info("processed %s in %.2f s" % (path, time.time() - start))
+
+            while True:
+                if stop.is_set():
+                    self._requeue(path)
+                    return
+                try:
+                    self._staged.put((path, result), timeout=self.interval)
+                except queue.Full:
+                    continue
+                self._notify(self.on_staged, path)
+                break